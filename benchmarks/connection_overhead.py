@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Costo de abrir la conexión a la base de datos en cada petición contra reutilizarla (CONN_MAX_AGE) o tomarla de un
+pool (DB_POOL=1).
+
+Ejemplo, contra el MySQL de docker-compose:
+    DB_HOST=127.0.0.1 DB_PORT=3307 python benchmarks/connection_overhead.py --requests 2000
+    DB_POOL=1 DB_HOST=127.0.0.1 DB_PORT=3307 python benchmarks/connection_overhead.py --requests 2000
+
+Cada petición simulada dispara request_started y request_finished (las mismas señales con las que Django cierra o
+conserva la conexión) alrededor de una consulta ligera. Se reportan la latencia p50/p95 por petición y cuántas
+conexiones se abrieron con CONN_MAX_AGE=0 (comportamiento de settings.py) y con el valor de settings_production.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'consultorioNutricionista.settings_production')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.signals import request_finished, request_started  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.db.backends.signals import connection_created  # noqa: E402
+
+from consultorioNutricionista.models import Patient  # noqa: E402
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def measure(conn_max_age, requests):
+    opened = []
+
+    def count(sender, connection, **kwargs):
+        opened.append(connection.alias)
+
+    connection.close()
+    connection.settings_dict['CONN_MAX_AGE'] = conn_max_age
+    connection_created.connect(count)
+    latencies = []
+    try:
+        for _ in range(requests):
+            start = time.perf_counter()
+            request_started.send(sender=None)
+            Patient.objects.filter(is_active=True).values_list('id', flat=True).first()
+            request_finished.send(sender=None)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connection_created.disconnect(count)
+        connection.close()
+
+    return {
+        'conn_max_age': conn_max_age,
+        'connections_opened': len(opened),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    configured = connection.settings_dict['CONN_MAX_AGE']
+    engine = connection.settings_dict['ENGINE']
+    results = {
+        'engine': engine,
+        'before': measure(0, args.requests),
+        'after': measure(configured, args.requests),
+    }
+    # Con DB_POOL=1 ambas mediciones toman la conexión del pool (CONN_MAX_AGE=0): compárese con la fila "before" de
+    # una corrida sin pool
+    for label in ('before', 'after'):
+        result = results[label]
+        print(f"{label:6} CONN_MAX_AGE={result['conn_max_age']:<5} conexiones {result['connections_opened']:>6}  "
+              f"p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms")
+    print(f"motor: {engine}")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+"""
+Tiempo de carga del índice de alimentos en memoria, de una búsqueda por nombre y de los totales de nutrientes de un
+plan, sobre la base de datos de benchmark (ver run_benchmarks.py).
+
+Ejemplo:
+    python benchmarks/food_index.py --foods 5000 --items 50 --repeat 10000
+
+Si la tabla tiene menos de --foods alimentos se completa con alimentos sintéticos. Los totales se calculan para
+planes de --items alimentos elegidos al azar y se reporta el tiempo promedio por plan en microsegundos.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'consultorioNutricionista.settings_benchmark')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+
+from consultorioNutricionista import foods  # noqa: E402
+from consultorioNutricionista.models import Food, normalize_name  # noqa: E402
+
+WORDS = ('arroz', 'frijol', 'tortilla', 'pollo', 'manzana', 'leche', 'queso', 'huevo', 'avena', 'nopal', 'aguacate',
+         'jitomate', 'pan', 'atún', 'plátano', 'yogur', 'lenteja', 'calabaza', 'elote', 'papaya')
+
+
+def fill_foods(count):
+    existing = Food.objects.count()
+    rng = random.Random(42)
+    new = []
+    for number in range(existing, count):
+        nombre = f"{rng.choice(WORDS).capitalize()} {rng.choice(WORDS)} {number}"
+        new.append(Food(codigo=f"bench-{number}", nombre=nombre, nombre_normalizado=normalize_name(nombre), grupo='benchmark',
+                        **{nutrient: Decimal(rng.randint(0, 50000)).scaleb(-2) for nutrient in Food.NUTRIENTS}))
+    Food.objects.bulk_create(new, batch_size=1000)
+    foods.bump_food_version()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--foods', type=int, default=5000)
+    parser.add_argument('--items', type=int, default=50)
+    parser.add_argument('--repeat', type=int, default=10000)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    call_command('migrate', verbosity=0)
+    fill_foods(args.foods)
+
+    start = time.perf_counter()
+    index = foods.food_index()
+    load_ms = (time.perf_counter() - start) * 1000
+
+    rng = random.Random(7)
+    plans = [[(rng.choice(index.ids), Decimal(rng.randint(10, 300))) for _ in range(args.items)] for _ in range(100)]
+    start = time.perf_counter()
+    for number in range(args.repeat):
+        index.totals(plans[number % len(plans)])
+    totals_us = (time.perf_counter() - start) / args.repeat * 1e6
+
+    queries = [word[:3] for word in WORDS]
+    start = time.perf_counter()
+    for number in range(args.repeat):
+        index.search(queries[number % len(queries)])
+    search_us = (time.perf_counter() - start) / args.repeat * 1e6
+
+    # Con la versión sin cambios el índice no se vuelve a construir
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        foods.food_index()
+    cached_us = (time.perf_counter() - start) / args.repeat * 1e6
+
+    results = {
+        'foods': len(index),
+        'numpy': foods.np is not None,
+        'load_ms': round(load_ms, 3),
+        'totals_us': round(totals_us, 3),
+        'search_us': round(search_us, 3),
+        'index_lookup_us': round(cached_us, 3),
+    }
+    print(f"{results['foods']} alimentos (NumPy: {'sí' if results['numpy'] else 'no'})")
+    print(f"carga del índice     {results['load_ms']:>10} ms")
+    print(f"totales ({args.items} alimentos) {results['totals_us']:>10} µs")
+    print(f"búsqueda por nombre  {results['search_us']:>10} µs")
+    print(f"índice ya cargado    {results['index_lookup_us']:>10} µs")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
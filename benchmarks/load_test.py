@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Prueba de carga de las páginas públicas del paciente contra un servidor WSGI y uno ASGI ya levantados.
+
+Ejemplo (mismo número de procesos en ambos servidores):
+    gunicorn consultorioNutricionista.wsgi -w 4 -b 127.0.0.1:8001
+    uvicorn consultorioNutricionista.asgi:application --workers 4 --port 8002
+    python benchmarks/load_test.py --wsgi http://127.0.0.1:8001 --asgi http://127.0.0.1:8002 --patients 1-500
+
+Cada cliente concurrente pide en ciclo la ficha pública de un paciente al azar, el formulario de búsqueda y la página
+de paciente no encontrado durante --duration segundos. Se reportan peticiones por segundo, latencia p50/p95/p99 y
+errores de cada servidor; con --output el resultado se guarda en JSON.
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def parse_range(text):
+    first, _, last = text.partition('-')
+    return int(first), int(last or first)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def request_paths(rng, patients):
+    yield f'/patient_public_detail/{rng.randint(*patients)}/'
+    yield '/patient_public_form/'
+    yield '/patient_public_not_found/'
+
+
+def client(base_url, patients, deadline, seed, timeout):
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    while time.perf_counter() < deadline:
+        for path in request_paths(rng, patients):
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(base_url + path, timeout=timeout) as response:
+                    response.read()
+            except (urllib.error.URLError, OSError):
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+    return latencies, errors
+
+
+def run(base_url, concurrency, duration, patients, timeout, warmup):
+    # Calentamiento: llena la caché de fragmentos y las conexiones de los procesos antes de medir
+    client(base_url, patients, time.perf_counter() + warmup, 0, timeout)
+
+    start = time.perf_counter()
+    deadline = start + duration
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda seed: client(base_url, patients, deadline, seed, timeout), range(1, concurrency + 1)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [latency for latency_list, _ in results for latency in latency_list]
+    return {
+        'url': base_url,
+        'requests': len(latencies),
+        'errors': sum(errors for _, errors in results),
+        'rps': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--wsgi', help='URL base del servidor WSGI')
+    parser.add_argument('--asgi', help='URL base del servidor ASGI')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=5.0)
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--patients', type=parse_range, default=(1, 100), help='Rango de ids de pacientes, por ejemplo 1-500')
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    targets = [(name, url.rstrip('/')) for name, url in (('wsgi', args.wsgi), ('asgi', args.asgi)) if url]
+    if not targets:
+        parser.error('Indica al menos --wsgi o --asgi')
+
+    results = {}
+    for name, url in targets:
+        result = run(url, args.concurrency, args.duration, args.patients, args.timeout, args.warmup)
+        results[name] = result
+        print(f"{name:5} {result['rps']:>9} req/s  p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  "
+              f"p99 {result['p99_ms']:>8} ms  errores {result['errors']}")
+
+    if len(results) == 2 and results['wsgi']['rps']:
+        print(f"asgi/wsgi: {results['asgi']['rps'] / results['wsgi']['rps']:.2f}x peticiones por segundo")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'concurrency': args.concurrency, 'duration': args.duration, 'results': results}, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+"""
+Inicios de sesión por segundo con cada hasher de contraseñas y peticiones autenticadas por segundo con cada backend
+de sesiones, sobre los datos de benchmark (ver run_benchmarks.py).
+
+Ejemplo:
+    python benchmarks/login_throughput.py --logins 50 --requests 500 --argon2-time-cost 1 --argon2-memory-cost 19456
+
+Los hashers son el PBKDF2 de Django y, si argon2-cffi está instalado, Argon2 con los parámetros dados (los que
+imprime "manage.py calibrate_password_hasher"); también se comprueba que una contraseña guardada con PBKDF2 se vuelve
+a guardar con Argon2 al iniciar sesión. Las páginas autenticadas se piden con sesiones en la base de datos (db),
+cached_db y cookies firmadas, y se reportan las sentencias SQL por petición.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'consultorioNutricionista.settings_benchmark')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext, override_settings  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+sys.path.insert(0, str(BASE_DIR / 'benchmarks'))
+from run_benchmarks import percentile, prepare_data  # noqa: E402
+
+try:
+    import argon2
+except ImportError:  # argon2-cffi es opcional
+    argon2 = None
+
+PASSWORD = 'benchmark'
+PBKDF2 = 'django.contrib.auth.hashers.PBKDF2PasswordHasher'
+ARGON2 = 'consultorioNutricionista.hashers.CalibratedArgon2PasswordHasher'
+
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}
+
+
+def summary(latencies, elapsed):
+    return {
+        'per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+    }
+
+
+def measure_logins(user, hashers, count):
+    with override_settings(PASSWORD_HASHERS=hashers):
+        user.set_password(PASSWORD)
+        user.save()
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(count):
+            client = Client()
+            request_start = time.perf_counter()
+            response = client.post(reverse('login'), {'username': user.username, 'password': PASSWORD})
+            latencies.append((time.perf_counter() - request_start) * 1000)
+            assert response.status_code == 302, response.status_code
+        return summary(latencies, time.perf_counter() - start)
+
+
+def check_rehash(user):
+    # La contraseña se guarda con PBKDF2 y se inicia sesión con Argon2 como hasher preferido
+    with override_settings(PASSWORD_HASHERS=[PBKDF2]):
+        user.set_password(PASSWORD)
+        user.save()
+    with override_settings(PASSWORD_HASHERS=[ARGON2, PBKDF2]):
+        Client().post(reverse('login'), {'username': user.username, 'password': PASSWORD})
+    user.refresh_from_db()
+    return user.password.startswith('argon2$')
+
+
+def measure_pages(user, engine, count):
+    caches = {**settings.CACHES, 'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessions'}}
+    with override_settings(SESSION_ENGINE=engine, CACHES=caches, SESSION_CACHE_ALIAS='sessions'):
+        client = Client()
+        client.force_login(user)
+        url = reverse('home')
+        client.get(url)
+        latencies, queries = [], []
+        start = time.perf_counter()
+        for _ in range(count):
+            with CaptureQueriesContext(connection) as captured:
+                request_start = time.perf_counter()
+                response = client.get(url)
+                latencies.append((time.perf_counter() - request_start) * 1000)
+            assert response.status_code == 200, response.status_code
+            queries.append(len(captured.captured_queries))
+        result = summary(latencies, time.perf_counter() - start)
+        result['avg_queries'] = round(statistics.mean(queries), 2)
+        return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=100)
+    parser.add_argument('--consultations', type=int, default=5)
+    parser.add_argument('--logins', type=int, default=30)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--argon2-time-cost', type=int, default=2)
+    parser.add_argument('--argon2-memory-cost', type=int, default=102400)
+    parser.add_argument('--argon2-parallelism', type=int, default=8)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    nutritionist, _ = prepare_data(args.patients, args.consultations)
+    results = {'logins': {'pbkdf2': measure_logins(nutritionist, [PBKDF2], args.logins)}, 'pages': {}}
+    if argon2 is not None:
+        with override_settings(ARGON2_TIME_COST=args.argon2_time_cost, ARGON2_MEMORY_COST=args.argon2_memory_cost,
+                               ARGON2_PARALLELISM=args.argon2_parallelism):
+            results['logins']['argon2'] = measure_logins(nutritionist, [ARGON2, PBKDF2], args.logins)
+            results['rehash_on_login'] = check_rehash(nutritionist)
+    else:
+        print('argon2-cffi no está instalado: solo se mide PBKDF2')
+
+    for label, engine in SESSION_ENGINES.items():
+        results['pages'][label] = measure_pages(nutritionist, engine, args.requests)
+
+    # La contraseña del usuario de benchmark vuelve al hasher de settings_benchmark
+    nutritionist.set_password(PASSWORD)
+    nutritionist.save()
+
+    for label, result in results['logins'].items():
+        print(f"login  {label:14} {result['per_second']:>8}/s  p50 {result['p50_ms']:>9} ms  p95 {result['p95_ms']:>9} ms")
+    if 'rehash_on_login' in results:
+        print(f"rehash PBKDF2 -> Argon2 al iniciar sesión: {'sí' if results['rehash_on_login'] else 'no'}")
+    for label, result in results['pages'].items():
+        print(f"página {label:14} {result['per_second']:>8}/s  p50 {result['p50_ms']:>9} ms  "
+              f"p95 {result['p95_ms']:>9} ms  SQL {result['avg_queries']}")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
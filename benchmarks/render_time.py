@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+"""
+Tiempo de respuesta y de render del detalle del paciente con la caché de fragmentos fría y caliente, sobre los datos
+de benchmark (ver run_benchmarks.py).
+
+Ejemplo:
+    python benchmarks/render_time.py --patients 2000 --consultations 20 --sample 200
+
+Primero se piden los detalles de --sample pacientes con la caché vacía (antes) y luego otra vez con los fragmentos ya
+guardados (después). Se reportan la latencia p50/p95, el tiempo de render de plantillas y las sentencias SQL por
+petición.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'consultorioNutricionista.settings_benchmark')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.template.backends.django import Template as DjangoTemplate  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from consultorioNutricionista import public_cache  # noqa: E402
+from consultorioNutricionista.models import Patient  # noqa: E402
+
+sys.path.insert(0, str(BASE_DIR / 'benchmarks'))
+from run_benchmarks import percentile, prepare_data  # noqa: E402
+
+
+class RenderTimer:
+    # Mide el render de la plantilla de la página (los renders anidados quedan incluidos en el exterior)
+    def __init__(self):
+        self.total = 0.0
+        self.depth = 0
+
+    def __enter__(self):
+        self.original = DjangoTemplate.render
+        timer = self
+
+        def render(template, context=None, request=None):
+            timer.depth += 1
+            start = time.perf_counter()
+            try:
+                return timer.original(template, context, request)
+            finally:
+                timer.depth -= 1
+                if not timer.depth:
+                    timer.total += time.perf_counter() - start
+
+        DjangoTemplate.render = render
+        return self
+
+    def __exit__(self, *exc):
+        DjangoTemplate.render = self.original
+
+
+def measure(client, urls):
+    latencies, renders, queries = [], [], []
+    for url in urls:
+        with CaptureQueriesContext(connection) as captured, RenderTimer() as timer:
+            start = time.perf_counter()
+            response = client.get(url)
+            latencies.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, (url, response.status_code)
+        renders.append(timer.total * 1000)
+        queries.append(len(captured.captured_queries))
+    return {
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'render_p50_ms': round(statistics.median(renders), 3),
+        'avg_queries': round(statistics.mean(queries), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--consultations', type=int, default=10)
+    parser.add_argument('--sample', type=int, default=100)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+
+    nutritionist, _ = prepare_data(args.patients, args.consultations)
+    client = Client()
+    client.force_login(nutritionist)
+    patient_ids = Patient.objects.order_by('id').values_list('id', flat=True)[:args.sample]
+    urls = [reverse('patient_detail', args=[patient_id]) for patient_id in patient_ids]
+
+    public_cache.get_cache().clear()
+    results = {'before': measure(client, urls), 'after': measure(client, urls)}
+    for label, result in results.items():
+        print(f"{label:6} p50 {result['p50_ms']:>8} ms  p95 {result['p95_ms']:>8} ms  "
+              f"render {result['render_p50_ms']:>8} ms  SQL {result['avg_queries']}")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2)
+
+
+if __name__ == '__main__':
+    main()
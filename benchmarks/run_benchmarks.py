@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+"""
+Benchmark de todas las rutas con nombre de urls.py usando el cliente de pruebas de Django sobre SQLite.
+
+Ejemplos:
+    python benchmarks/run_benchmarks.py --patients 2000 --consultations 20 --output results.json
+    python benchmarks/run_benchmarks.py --output new.json --baseline results.json
+
+Por cada ruta se registran la latencia p50/p95, el número de sentencias SQL y el pico de memoria de una petición.
+Una excepción en una vista detiene la suite, y si alguna ruta responde con un código distinto de 2xx/3xx el proceso
+termina con código 1 (una página de error no es una medición válida). Con --baseline además se compara contra un
+resultado anterior y el proceso termina con código 1 si alguna ruta empeora más de la tolerancia en p95 o ejecuta más
+sentencias SQL.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from datetime import time as clock, timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'consultorioNutricionista.settings_benchmark')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+from django.urls import URLPattern, get_resolver, reverse  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from consultorioNutricionista.exports import run_job  # noqa: E402
+from consultorioNutricionista.models import Patient, Consultation, ExportJob, Appointment  # noqa: E402
+from consultorioNutricionista.scheduling import book_appointment, free_slots, generate_recurring_slots  # noqa: E402
+
+# Rutas que no se miden: cierran la sesión, borran datos o no son vistas del consultorio
+SKIPPED_ROUTES = {'logout', 'login_fail', 'delete_patient', 'delete_assistant'}
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(int(round(fraction * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def prepare_data(patients, consultations):
+    call_command('migrate', verbosity=0)
+    if not Patient.objects.exists():
+        call_command('generate_data', patients=patients, consultations=consultations, verbosity=0)
+    nutritionist, created = User.objects.get_or_create(username='benchmark', defaults={'is_staff': True, 'is_superuser': True})
+    if created:
+        nutritionist.set_password('benchmark')
+        nutritionist.save()
+    assistant, created = User.objects.get_or_create(username='benchmark-assistant', defaults={'is_staff': True})
+    return nutritionist, assistant
+
+
+# Disponibilidad de 9 a 17 h para las próximas dos semanas (los días que ya la tienen se omiten) y una cita programada
+# a partir de mañana, que se reutiliza entre corridas mientras no se cancele.
+def prepare_schedule(nutritionist, patient):
+    today = timezone.localdate()
+    generate_recurring_slots(nutritionist.id, today, today + timedelta(days=13), range(7), clock(9), clock(17))
+    upcoming = Appointment.objects.filter(nutritionist=nutritionist, estado=Appointment.PROGRAMADA, inicio__gte=timezone.now())
+    appointment = upcoming.order_by('inicio').first()
+    if appointment is None:
+        desde = timezone.now() + timedelta(days=1)
+        inicio, fin = free_slots(nutritionist.id, desde, desde + timedelta(days=7))[0]
+        appointment = book_appointment(patient.id, nutritionist.id, inicio, fin)
+    return appointment
+
+
+def named_routes():
+    for pattern in get_resolver().url_patterns:
+        if isinstance(pattern, URLPattern) and pattern.name and pattern.name not in SKIPPED_ROUTES:
+            yield pattern
+
+
+# Construye la petición de cada ruta: argumentos de la URL a partir de datos de ejemplo y POST donde aplica
+def build_requests(nutritionist, assistant):
+    patient = Patient.objects.filter(is_active=True).order_by('id').first()
+    consultation = Consultation.objects.filter(patient=patient).order_by('-fecha_consulta').first()
+    appointment = prepare_schedule(nutritionist, patient)
+    job, _ = ExportJob.objects.get_or_create(patient=patient, formato=ExportJob.CSV)
+    if job.estado != ExportJob.TERMINADO:
+        # export_download solo responde con un trabajo terminado
+        run_job(job)
+    arguments = {'patient_id': patient.id, 'consultation_id': consultation.id if consultation else 1, 'assistant_id': assistant.id,
+                 'job_id': job.id, 'appointment_id': appointment.id}
+    posts = {
+        'initiate_consultation': {'patient': patient.id, 'peso': '70.50', 'observaciones': 'Benchmark'},
+        'search_patient': {'patient_id': patient.id},
+        'patient_public_form': {'patient_id': patient.id},
+        # La primera petición cancela la cita; las demás miden la misma vista sobre una cita ya cancelada
+        'cancel_appointment': {'confirmar': '1'},
+    }
+
+    requests = []
+    for pattern in named_routes():
+        converters = pattern.pattern.converters
+        kwargs = {name: arguments[name] for name in converters}
+        url = reverse(pattern.name, kwargs=kwargs or None)
+        requests.append((pattern.name, 'GET', url, None))
+        if pattern.name in posts:
+            requests.append((pattern.name + ' [POST]', 'POST', url, posts[pattern.name]))
+    return requests
+
+
+def measure(client, method, url, data, iterations, warmup):
+    call = client.post if method == 'POST' else client.get
+    for _ in range(warmup):
+        call(url, data) if data else call(url)
+
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        response = call(url, data) if data else call(url)
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        response = call(url, data) if data else call(url)
+        if getattr(response, 'streaming', False):
+            b''.join(response.streaming_content)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return {
+        'status': response.status_code,
+        'p50_ms': round(statistics.median(latencies), 3),
+        'p95_ms': round(percentile(latencies, 0.95), 3),
+        'queries': len(queries.captured_queries),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def failed_routes(results):
+    return [f"{name}: código {route['status']}" for name, route in results['routes'].items() if not 200 <= route['status'] < 400]
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, current in results['routes'].items():
+        previous = baseline.get('routes', {}).get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        if current['queries'] > previous['queries']:
+            regressions.append(f"{name}: SQL {previous['queries']} -> {current['queries']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--consultations', type=int, default=10)
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', help='Resultado anterior contra el cual comparar')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Aumento permitido en p95 (0.25 = 25%%)')
+    args = parser.parse_args()
+
+    nutritionist, assistant = prepare_data(args.patients, args.consultations)
+    client = Client()
+    client.force_login(nutritionist)
+
+    results = {
+        'meta': {
+            'patients': Patient.objects.count(),
+            'consultations': Consultation.objects.count(),
+            'iterations': args.iterations,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+        },
+        'routes': {},
+    }
+    for name, method, url, data in build_requests(nutritionist, assistant):
+        results['routes'][name] = measure(client, method, url, data, args.iterations, args.warmup)
+        route = results['routes'][name]
+        print(f"{name:40} {route['status']}  p50 {route['p50_ms']:8.2f} ms  p95 {route['p95_ms']:8.2f} ms  "
+              f"SQL {route['queries']:4}  pico {route['peak_kb']:9.1f} KB")
+
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+
+    failures = failed_routes(results)
+    for failure in failures:
+        print(f"FALLA {failure}")
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESIÓN {regression}")
+    if failures or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum, Window
+from django.db.models.functions import Lag, TruncDate
+from django.utils import timezone
+
+from .models import Consultation, ConsultationRollup, PatientSummary, RollupChange, RollupState
+from .nutrition import WHO_CATEGORIES, WHO_LIMITS_CENTS, np, to_cents, who_category
+
+
+# Analítica del consultorio a partir de agregados precalculados (ConsultationRollup).
+# refresh_rollups recalcula solo los días registrados en RollupChange (consultas nuevas, editadas, borradas o
+# importadas con fecha pasada); rebuild_rollups recalcula todo por bloques, con la agrupación vectorizada en NumPy
+# cuando está disponible. El tablero solo lee los agregados y el resumen por paciente.
+# Las consultas con IMC inválido (0, el valor por defecto cuando el paciente no tiene una altura válida) no entran en
+# los agregados ni en la proporción por categoría; su peso sí cuenta como peso anterior de la siguiente consulta.
+
+AGE_BANDS = ('0-17', '18-29', '30-44', '45-59', '60+')
+AGE_LIMITS = (18, 30, 45, 60)
+STATE_NAME = 'consultas'
+DEFAULT_CHUNK_SIZE = 5000
+
+ROW_FIELDS = ('id', 'patient_id', 'fecha_consulta', 'peso', 'imc', 'patient__sexo', 'patient__fecha_nacimiento')
+
+
+def ymd(day):
+    return day.year * 10000 + day.month * 100 + day.day
+
+
+def age_band(day, nacimiento):
+    # La resta de fechas como enteros AAAAMMDD da la edad exacta en años
+    age = (ymd(day) - ymd(nacimiento)) // 10000
+    return AGE_BANDS[sum(age >= limit for limit in AGE_LIMITS)]
+
+
+def add_totals(totals, key, consultas, imc_cents, delta_cents, delta_count):
+    current = totals.setdefault(key, [0, 0, 0, 0])
+    current[0] += consultas
+    current[1] += imc_cents
+    current[2] += delta_cents
+    current[3] += delta_count
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Agrupa filas de consultas por (periodo, fecha del periodo, sexo, grupo de edad, categoría). anteriores trae el peso
+# de la consulta previa de cada fila (o None) para calcular el cambio de peso.
+
+def aggregate_rows(rows, anteriores):
+    totals = {}
+    for (_, _, fecha, peso, imc, sexo, nacimiento), anterior in zip(rows, anteriores):
+        day = timezone.localtime(fecha).date()
+        band = age_band(day, nacimiento)
+        categoria = who_category(imc)
+        delta = to_cents(peso) - to_cents(anterior) if anterior is not None else 0
+        for periodo, inicio in ((ConsultationRollup.DIARIO, day), (ConsultationRollup.MENSUAL, day.replace(day=1))):
+            add_totals(totals, (periodo, inicio, sexo, band, categoria), 1, to_cents(imc), delta, anterior is not None)
+    return totals
+
+
+def aggregate_rows_vectorized(rows, anteriores):
+    if np is None:
+        return aggregate_rows(rows, anteriores)
+
+    size = len(rows)
+    days = [timezone.localtime(row[2]).date() for row in rows]
+    day_ordinal = np.fromiter((day.toordinal() for day in days), np.int64, size)
+    month_ordinal = np.fromiter((day.replace(day=1).toordinal() for day in days), np.int64, size)
+    ages = (np.fromiter((ymd(day) for day in days), np.int64, size)
+            - np.fromiter((ymd(row[6]) for row in rows), np.int64, size)) // 10000
+    bands = np.searchsorted(np.array(AGE_LIMITS), ages, side='right')
+    imc_cents = np.rint(np.fromiter((float(row[4]) for row in rows), np.float64, size) * 100).astype(np.int64)
+    categories = np.searchsorted(np.array(WHO_LIMITS_CENTS), imc_cents, side='right')
+    female = np.fromiter((row[5] == 'F' for row in rows), np.int64, size)
+    peso_cents = np.rint(np.fromiter((float(row[3]) for row in rows), np.float64, size) * 100).astype(np.int64)
+    has_previous = np.fromiter((anterior is not None for anterior in anteriores), bool, size)
+    previous_cents = np.rint(np.fromiter((float(a) if a is not None else 0.0 for a in anteriores), np.float64, size) * 100).astype(np.int64)
+    deltas = np.where(has_previous, peso_cents - previous_cents, 0)
+
+    totals = {}
+    for periodo, ordinals in ((ConsultationRollup.DIARIO, day_ordinal), (ConsultationRollup.MENSUAL, month_ordinal)):
+        keys = ((ordinals * 2 + female) * len(AGE_BANDS) + bands) * len(WHO_CATEGORIES) + categories
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+        consultas = np.bincount(inverse)
+        imc_sums = np.bincount(inverse, weights=imc_cents)
+        delta_sums = np.bincount(inverse, weights=deltas)
+        delta_counts = np.bincount(inverse, weights=has_previous)
+        for index, key in enumerate(unique_keys.tolist()):
+            key, categoria = divmod(key, len(WHO_CATEGORIES))
+            key, band = divmod(key, len(AGE_BANDS))
+            ordinal, is_female = divmod(key, 2)
+            add_totals(totals, (periodo, date.fromordinal(ordinal), 'F' if is_female else 'M', AGE_BANDS[band], WHO_CATEGORIES[categoria]),
+                       int(consultas[index]), int(imc_sums[index]), int(delta_sums[index]), int(delta_counts[index]))
+    return totals
+
+
+def rollup_values(totals):
+    consultas, imc_cents, delta_cents, delta_count = totals
+    return {
+        'consultas': consultas,
+        'imc_total': Decimal(imc_cents).scaleb(-2),
+        'peso_cambio_total': Decimal(delta_cents).scaleb(-2),
+        'peso_cambio_consultas': delta_count,
+    }
+
+
+def rollup_key(key):
+    periodo, fecha, sexo, grupo_edad, categoria = key
+    return {'periodo': periodo, 'fecha': fecha, 'sexo': sexo, 'grupo_edad': grupo_edad, 'categoria': categoria}
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Peso de la consulta anterior de cada fila, con una función de ventana sobre el historial de los pacientes del bloque.
+
+def previous_weights(rows):
+    ids = {row[0] for row in rows}
+    history = (
+        Consultation.objects.filter(patient_id__in={row[1] for row in rows})
+        .annotate(anterior=Window(Lag('peso'), partition_by=[F('patient_id')], order_by=[F('fecha_consulta').asc(), F('id').asc()]))
+        .values_list('id', 'anterior')
+    )
+    anteriores = {consultation_id: anterior for consultation_id, anterior in history if consultation_id in ids}
+    return [anteriores.get(row[0]) for row in rows]
+
+
+# Días a recalcular por un bloque de cambios: el día de cada cambio y el de la siguiente visita del paciente, cuyo
+# cambio de peso depende de la consulta anterior; un cambio sin fecha marca todos los días con consultas del paciente.
+
+def dirty_days(changes):
+    changed = {}
+    for _, patient_id, fecha in changes:
+        changed.setdefault(patient_id, set()).add(fecha)
+    visits = {}
+    history = (Consultation.objects.filter(patient_id__in=list(changed))
+               .values_list('patient_id', TruncDate('fecha_consulta')).distinct())
+    for patient_id, day in history:
+        visits.setdefault(patient_id, []).append(day)
+
+    days = set()
+    for patient_id, fechas in changed.items():
+        patient_days = sorted(visits.get(patient_id, []))
+        if None in fechas:
+            days.update(patient_days)
+        for fecha in fechas - {None}:
+            days.add(fecha)
+            position = bisect_right(patient_days, fecha)
+            if position < len(patient_days):
+                days.add(patient_days[position])
+    return days
+
+
+def local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+# Consultas de un día local, leídas por rango desde consultation_date_idx (sin ordenar: solo se agregan).
+
+def day_consultations(day):
+    return (Consultation.objects.filter(fecha_consulta__gte=local_midnight(day), fecha_consulta__lt=local_midnight(day + timedelta(days=1)))
+            .values_list(*ROW_FIELDS))
+
+
+# Reemplaza los agregados diarios de un día con sus consultas. Regresa el número de consultas leídas.
+
+def rebuild_day(day):
+    rows = list(day_consultations(day))
+    valid = [(row, anterior) for row, anterior in zip(rows, previous_weights(rows)) if row[4] > 0]
+    totals = aggregate_rows([row for row, _ in valid], [anterior for _, anterior in valid]) if valid else {}
+    ConsultationRollup.objects.filter(periodo=ConsultationRollup.DIARIO, fecha=day).delete()
+    ConsultationRollup.objects.bulk_create([ConsultationRollup(**rollup_key(key), **rollup_values(values))
+                                            for key, values in totals.items() if key[0] == ConsultationRollup.DIARIO])
+    return len(rows)
+
+
+# Los agregados mensuales son la suma de los diarios del mes (el grupo de edad de cada consulta se calcula con su día).
+
+def rebuild_month(month):
+    next_month = (month + timedelta(days=31)).replace(day=1)
+    daily = (
+        ConsultationRollup.objects.filter(periodo=ConsultationRollup.DIARIO, fecha__gte=month, fecha__lt=next_month)
+        .values('sexo', 'grupo_edad', 'categoria')
+        .annotate(total_consultas=Sum('consultas'), total_imc=Sum('imc_total'), total_peso_cambio=Sum('peso_cambio_total'),
+                  total_peso_cambio_consultas=Sum('peso_cambio_consultas'))
+    )
+    monthly = [
+        ConsultationRollup(periodo=ConsultationRollup.MENSUAL, fecha=month, sexo=row['sexo'], grupo_edad=row['grupo_edad'],
+                           categoria=row['categoria'], consultas=row['total_consultas'], imc_total=row['total_imc'],
+                           peso_cambio_total=row['total_peso_cambio'], peso_cambio_consultas=row['total_peso_cambio_consultas'])
+        for row in daily
+    ]
+    ConsultationRollup.objects.filter(periodo=ConsultationRollup.MENSUAL, fecha=month).delete()
+    ConsultationRollup.objects.bulk_create(monthly)
+
+
+# Procesa RollupChange por bloques de chunk_size cambios. Cada bloque recalcula sus días y meses y borra los cambios que
+# leyó en la misma transacción; regresa el número de consultas reagregadas.
+
+def refresh_rollups(chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    RollupState.objects.get_or_create(nombre=STATE_NAME)
+    processed = 0
+    while True:
+        with transaction.atomic():
+            RollupState.objects.select_for_update().get(nombre=STATE_NAME)
+            changes = list(RollupChange.objects.order_by('id').values_list('id', 'patient_id', 'fecha')[:chunk_size])
+            if not changes:
+                break
+            days = dirty_days(changes)
+            for day in sorted(days):
+                processed += rebuild_day(day)
+            for month in sorted({day.replace(day=1) for day in days}):
+                rebuild_month(month)
+            RollupChange.objects.filter(id__in=[change[0] for change in changes]).delete()
+        if progress is not None:
+            progress(processed)
+    return processed
+
+
+# Recalcula todos los agregados. Las consultas se leen por bloques ordenadas por paciente y fecha, de modo que el peso
+# anterior se obtiene al recorrerlas. Todo corre en una transacción que toma primero el candado de RollupState: una
+# actualización incremental espera a que termine, y solo se borran los cambios visibles al empezar (los que se
+# confirmen después quedan para la siguiente actualización).
+
+def rebuild_rollups(chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    RollupState.objects.get_or_create(nombre=STATE_NAME)
+    with transaction.atomic():
+        RollupState.objects.select_for_update().get(nombre=STATE_NAME)
+        seen_changes = list(RollupChange.objects.values_list('id', flat=True))
+        consultations = (
+            Consultation.objects.order_by('patient_id', 'fecha_consulta', 'id')
+            .values_list(*ROW_FIELDS)
+            .iterator(chunk_size=chunk_size)
+        )
+
+        totals = {}
+        processed = 0
+        current_patient, previous_peso = None, None
+        rows, anteriores = [], []
+        for row in consultations:
+            if row[1] != current_patient:
+                current_patient, previous_peso = row[1], None
+            if row[4] > 0:
+                rows.append(row)
+                anteriores.append(previous_peso)
+            previous_peso = row[3]
+            processed += 1
+            if len(rows) >= chunk_size:
+                for key, chunk_totals in aggregate_rows_vectorized(rows, anteriores).items():
+                    add_totals(totals, key, *chunk_totals)
+                rows, anteriores = [], []
+                if progress is not None:
+                    progress(processed)
+        if rows:
+            for key, chunk_totals in aggregate_rows_vectorized(rows, anteriores).items():
+                add_totals(totals, key, *chunk_totals)
+
+        ConsultationRollup.objects.all().delete()
+        ConsultationRollup.objects.bulk_create(
+            [ConsultationRollup(**rollup_key(key), **rollup_values(values)) for key, values in totals.items()], batch_size=1000)
+        for start in range(0, len(seen_changes), chunk_size):
+            RollupChange.objects.filter(id__in=seen_changes[start:start + chunk_size]).delete()
+    return processed
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Proporción de pacientes activos en cada categoría de la OMS según su IMC más reciente (una fila por paciente).
+
+def patient_category_share():
+    limits = [None] + [Decimal(limit).scaleb(-2) for limit in WHO_LIMITS_CENTS] + [None]
+    counts = {}
+    for categoria, lower, upper in zip(WHO_CATEGORIES, limits, limits[1:]):
+        condition = Q()
+        if lower is not None:
+            condition &= Q(latest_imc__gte=lower)
+        if upper is not None:
+            condition &= Q(latest_imc__lt=upper)
+        counts[categoria] = Count('pk', filter=condition)
+    totals = PatientSummary.objects.filter(patient__is_active=True, latest_imc__gt=0).aggregate(**counts)
+    total = sum(totals.values())
+    return [(categoria, totals[categoria], round(totals[categoria] * 100 / total, 1) if total else 0.0) for categoria in WHO_CATEGORIES]
+
+
+def dashboard_data(months=12):
+    today = timezone.localdate()
+    month = today.year * 12 + today.month - 1 - (months - 1)
+    since = date(month // 12, month % 12 + 1, 1)
+    monthly = ConsultationRollup.objects.filter(periodo=ConsultationRollup.MENSUAL, fecha__gte=since)
+
+    distribution = {}
+    for row in monthly.values('grupo_edad', 'sexo', 'categoria').annotate(consultas=Sum('consultas'), imc=Sum('imc_total')):
+        group = distribution.setdefault((row['grupo_edad'], row['sexo']), {'consultas': 0, 'imc': Decimal(0), 'categorias': dict.fromkeys(WHO_CATEGORIES, 0)})
+        group['consultas'] += row['consultas']
+        group['imc'] += row['imc']
+        group['categorias'][row['categoria']] += row['consultas']
+    imc_by_group = [
+        {
+            'grupo_edad': grupo_edad,
+            'sexo': sexo,
+            'consultas': group['consultas'],
+            'imc_promedio': round(group['imc'] / group['consultas'], 2),
+            'categorias': [group['categorias'][categoria] for categoria in WHO_CATEGORIES],
+        }
+        for (grupo_edad, sexo), group in sorted(distribution.items(), key=lambda item: (AGE_BANDS.index(item[0][0]), item[0][1]))
+    ]
+
+    weight_change = [
+        {'mes': row['fecha'], 'cambio_promedio': round(row['total'] / row['consultas'], 2)}
+        for row in monthly.values('fecha').annotate(total=Sum('peso_cambio_total'), consultas=Sum('peso_cambio_consultas')).order_by('fecha')
+        if row['consultas']
+    ]
+
+    return {
+        'since': since,
+        'categories': WHO_CATEGORIES,
+        'imc_by_group': imc_by_group,
+        'weight_change': weight_change,
+        'category_share': patient_category_share(),
+    }
@@ -1,4 +1,11 @@
 from django.apps import AppConfig
+from django.core import checks
 
 class ConsultorioNutricionistaConfig(AppConfig):
     name = 'consultorioNutricionista'
+
+    def ready(self):
+        from .public_cache import check_version_cache
+        from .roles import check_roles_cache
+        checks.register(check_roles_cache, checks.Tags.caches, deploy=True)
+        checks.register(check_version_cache, checks.Tags.caches, deploy=True)
@@ -0,0 +1,181 @@
+import time
+from datetime import timedelta
+
+from django.db import models, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Patient, Consultation, PatientSummary, ArchivedPatient, ArchivedConsultation, Appointment, \
+    MealPlan, ExportJob, RollupChange
+from .public_cache import bump_patient_version
+from .routers import reading_from_primary
+
+
+# Archivo y borrado masivo de pacientes.
+# archive_patients mueve pacientes inactivos y sus consultas a ArchivedPatient/ArchivedConsultation por bloques, cada
+# bloque en su propia transacción; restore_patient los regresa con sus ids originales cuando se abre su detalle.
+# Los borrados son por conjuntos (DELETE ... WHERE id IN (...)) por bloques de ids, sin cargar los objetos ni
+# recorrer la cascada fila por fila; las tablas que dependen del paciente (consultas, tokens, resumen, ...) se
+# descubren a partir de las relaciones del modelo. Como no se disparan señales, aquí se invalida la caché pública.
+
+DEFAULT_CHUNK_SIZE = 100
+DEFAULT_ROWS_CHUNK_SIZE = 2000
+
+PATIENT_FIELDS = [field.attname for field in Patient._meta.concrete_fields]
+CONSULTATION_FIELDS = [field.attname for field in Consultation._meta.concrete_fields]
+
+
+def chunks(values, size):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def raw_delete(queryset):
+    return queryset._raw_delete(router.db_for_write(queryset.model))
+
+
+# Borra las filas de las tablas que dependen de model para los ids dados: en cascada por bloques (cada bloque en su
+# transacción si no hay una abierta) y pone en NULL las relaciones SET_NULL.
+def delete_dependents(model, ids, chunk_size=DEFAULT_ROWS_CHUNK_SIZE):
+    for relation in model._meta.related_objects:
+        related_model, field = relation.related_model, relation.field
+        lookup = {f'{field.name}__in': ids}
+        on_delete = field.remote_field.on_delete
+        if on_delete is models.CASCADE:
+            delete_rows(related_model._base_manager.filter(**lookup), chunk_size)
+        elif on_delete is models.SET_NULL:
+            related_model._base_manager.filter(**lookup).update(**{field.name: None})
+
+
+def delete_rows(queryset, chunk_size=DEFAULT_ROWS_CHUNK_SIZE):
+    model = queryset.model
+    deleted = 0
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            delete_dependents(model, ids, chunk_size)
+            deleted += raw_delete(model._base_manager.filter(pk__in=ids))
+
+
+# Borrado definitivo de pacientes y de todo lo que depende de ellos, por bloques.
+def purge_patients(patient_ids, chunk_size=DEFAULT_CHUNK_SIZE, rows_chunk_size=DEFAULT_ROWS_CHUNK_SIZE):
+    deleted = 0
+    for chunk in chunks(patient_ids, chunk_size):
+        # Se marcan inactivos primero para que no aparezcan en las listas mientras se borran sus consultas
+        Patient.objects.filter(id__in=chunk).update(is_active=False)
+        # Las consultas se borran en varias transacciones: los días de los agregados de analítica se registran antes
+        # (por si el borrado se interrumpe) y otra vez con el borrado del paciente, para que una actualización que
+        # corra a la mitad no deje agregadas las consultas ya borradas
+        changes = list(Consultation.objects.filter(patient_id__in=chunk).values_list('patient_id', 'fecha_consulta'))
+        RollupChange.record(changes)
+        delete_dependents(Patient, chunk, rows_chunk_size)
+        with transaction.atomic():
+            deleted += raw_delete(Patient.objects.filter(id__in=chunk))
+            RollupChange.record(changes)
+        for patient_id in chunk:
+            bump_patient_version(patient_id)
+    return deleted
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+def archivable_patients(inactive_days=0):
+    # El archivo solo guarda el paciente y sus consultas y restore_patient solo regresa eso, así que los pacientes con
+    # citas (de cualquier estado), planes de alimentación o exportaciones se quedan en las tablas activas: archivarlos
+    # borraría esas filas sin forma de recuperarlas
+    with_appointments = Appointment.objects.values('patient_id')
+    with_plans = MealPlan.objects.values('consultation__patient_id')
+    with_exports = ExportJob.objects.filter(patient__isnull=False).values('patient_id')
+    patients = (Patient.objects.filter(is_active=False).exclude(id__in=with_appointments).exclude(id__in=with_plans)
+                .exclude(id__in=with_exports))
+    if inactive_days:
+        cutoff = timezone.now() - timedelta(days=inactive_days)
+        patients = patients.filter(Q(summary__last_visit__lt=cutoff) | Q(summary__isnull=True))
+    return patients
+
+
+def copy_rows(queryset, fields, target_model, rows_chunk_size):
+    last_id = 0
+    copied = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').values(*fields)[:rows_chunk_size])
+        if not rows:
+            return copied
+        target_model.objects.bulk_create([target_model(**row) for row in rows])
+        copied += len(rows)
+        last_id = rows[-1]['id']
+
+
+def archive_chunk(patient_ids, rows_chunk_size=DEFAULT_ROWS_CHUNK_SIZE):
+    with transaction.atomic():
+        # Se bloquean los pacientes y se vuelve a comprobar que sigan inactivos
+        patient_ids = list(Patient.objects.select_for_update().filter(id__in=patient_ids, is_active=False).values_list('id', flat=True))
+        if not patient_ids:
+            return 0, 0
+        archivado = timezone.now()
+        ArchivedPatient.objects.bulk_create([
+            ArchivedPatient(archivado=archivado, **row) for row in Patient.objects.filter(id__in=patient_ids).values(*PATIENT_FIELDS)
+        ])
+        consultations = copy_rows(Consultation.objects.filter(patient_id__in=patient_ids), CONSULTATION_FIELDS,
+                                  ArchivedConsultation, rows_chunk_size)
+        RollupChange.record_patients(patient_ids)
+        delete_dependents(Patient, patient_ids, rows_chunk_size)
+        raw_delete(Patient.objects.filter(id__in=patient_ids))
+    for patient_id in patient_ids:
+        bump_patient_version(patient_id)
+    return len(patient_ids), consultations
+
+
+# Archiva los pacientes inactivos (sin visitas en inactive_days días, si se indica) por bloques de chunk_size
+# pacientes. Regresa (pacientes, consultas, segundos).
+def archive_patients(inactive_days=0, chunk_size=DEFAULT_CHUNK_SIZE, rows_chunk_size=DEFAULT_ROWS_CHUNK_SIZE, progress=None):
+    candidates = archivable_patients(inactive_days).order_by('id').values_list('id', flat=True)
+    start = time.perf_counter()
+    patients = consultations = 0
+    last_id = 0
+    while True:
+        chunk = list(candidates.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        archived, rows = archive_chunk(chunk, rows_chunk_size)
+        patients += archived
+        consultations += rows
+        last_id = chunk[-1]
+        if progress is not None:
+            progress(patients, consultations, time.perf_counter() - start)
+    return patients, consultations, time.perf_counter() - start
+
+
+# Regresa un paciente archivado a las tablas principales con sus ids originales. El paciente conserva su estado
+# (normalmente inactivo), así que vuelve al archivo en la siguiente corrida de archive_patients.
+# Se llama desde el detalle del paciente, que puede leer de la réplica: todas las lecturas de la restauración (el
+# bloqueo del archivo, las consultas que se copian y el resumen) van al primario, dentro de su transacción.
+def restore_patient(patient_id, rows_chunk_size=DEFAULT_ROWS_CHUNK_SIZE):
+    with reading_from_primary(), transaction.atomic():
+        archived = ArchivedPatient.objects.select_for_update().filter(id=patient_id).first()
+        if archived is None:
+            return None
+        patient = Patient(**{field: getattr(archived, field) for field in PATIENT_FIELDS})
+        # save() en lugar de bulk_create para que las señales creen los tokens de búsqueda e invaliden la caché
+        patient.save(force_insert=True)
+        copy_rows(ArchivedConsultation.objects.filter(patient_id=patient_id), CONSULTATION_FIELDS, Consultation, rows_chunk_size)
+        RollupChange.record_patients([patient_id])
+        raw_delete(ArchivedConsultation.objects.filter(patient_id=patient_id))
+        raw_delete(ArchivedPatient.objects.filter(id=patient_id))
+        PatientSummary.rebuild(patient_id)
+    return patient
+
+
+def purge_archive(archived_before, chunk_size=DEFAULT_CHUNK_SIZE, rows_chunk_size=DEFAULT_ROWS_CHUNK_SIZE):
+    ids = ArchivedPatient.objects.filter(archivado__lt=archived_before).order_by('id').values_list('id', flat=True)
+    deleted = 0
+    while True:
+        chunk = list(ids[:chunk_size])
+        if not chunk:
+            return deleted
+        delete_dependents(ArchivedPatient, chunk, rows_chunk_size)
+        with transaction.atomic():
+            deleted += raw_delete(ArchivedPatient.objects.filter(id__in=chunk))
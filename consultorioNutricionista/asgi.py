@@ -5,12 +5,15 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
+
+By default it uses the ASGI profile (settings_asgi): the production settings plus urls_asgi, which serves the public
+patient pages with async views.
 """
 
 import os
 
 from django.core.asgi import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'consultorioNutricionista.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'consultorioNutricionista.settings_asgi')
 
 application = get_asgi_application()
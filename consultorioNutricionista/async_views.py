@@ -0,0 +1,58 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse
+from django.shortcuts import render, redirect
+
+from .forms import SearchPatientForm
+from .models import Patient
+from . import public_cache
+
+
+# Versiones asíncronas de las vistas públicas del paciente para el perfil ASGI (settings_asgi / urls_asgi).
+# El paciente se busca con el ORM asíncrono y el fragmento sale del mismo caché que las vistas síncronas.
+
+async def load_user(request):
+    # home.html usa request.roles; se resuelven aquí fuera del event loop para que el render no toque la base de datos
+    await sync_to_async(lambda: request.roles.is_authenticated, thread_sensitive=False)()
+
+
+async def patient_public_detail(request, patient_id):
+    async def load_context():
+        return {'patient': await Patient.objects.aget(id=patient_id)}
+
+    try:
+        card = await public_cache.apatient_fragment(patient_id, 'patient_public_card.html', load_context)
+    except Patient.DoesNotExist:
+        return HttpResponse("No se encontró el paciente con ese ID")
+
+    await load_user(request)
+    return render(request, 'patient_public_detail.html', {'patient_card': card})
+
+
+async def search_patient(request):
+    if request.method != 'POST':
+        await load_user(request)
+        return render(request, 'patient_public_form.html', {'form': SearchPatientForm()})
+
+    form = SearchPatientForm(request.POST)
+    if not form.is_valid():
+        return redirect('patient_public_not_found')
+    patient_id = form.cleaned_data['patient_id']
+
+    async def load_context():
+        patient = await Patient.objects.filter(id=patient_id).afirst()
+        if patient is None:
+            raise Patient.DoesNotExist
+        return {'patient': patient}
+
+    try:
+        patient_table = await public_cache.apatient_fragment(patient_id, 'patient_public_table.html', load_context)
+    except Patient.DoesNotExist:
+        return redirect('patient_public_not_found')
+
+    await load_user(request)
+    return render(request, 'patient_public_form.html', {'form': form, 'patient_table': patient_table})
+
+
+async def patient_public_not_found(request):
+    await load_user(request)
+    return render(request, 'patient_public_not_found.html')
@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.core.cache.utils import make_template_fragment_key
+from django.db.models import Prefetch
+from django.http import Http404
+from django.utils.functional import cached_property
+
+from .models import Patient, Consultation, PatientSummary
+from .nutrition import patient_profile
+from .archive import restore_patient
+from . import public_cache
+from .routers import reading_from_primary
+
+
+# Carga los datos del detalle del paciente con dos sentencias: el paciente junto con su resumen (select_related) y una
+# página de su historial de consultas ordenada de la más reciente a la más antigua (Prefetch con un queryset
+# recortado, servido por consultation_patient_date_idx). El IMC actual y el anterior salen de esa misma lista en la
+# primera página y del resumen en las demás; el total de consultas para numerar y paginar también sale del resumen.
+
+HISTORY_PER_PAGE = 10
+HISTORY_FIELDS = ('id', 'patient_id', 'fecha_consulta', 'peso', 'observaciones', 'imc')
+
+
+class PatientDetail:
+    def __init__(self, patient, summary, history, page, per_page, has_next):
+        self.patient = patient
+        self.summary = summary
+        self.history = history
+        self.page = page
+        self.per_page = per_page
+        self.has_next = has_next
+
+        if page == 1:
+            self.latest_imc = history[0].imc if history else None
+            self.previous_imc = history[1].imc if len(history) > 1 else None
+        else:
+            self.latest_imc = summary.latest_imc
+            self.previous_imc = summary.previous_imc
+
+        # Número de cada consulta en orden cronológico (la más antigua es la 1)
+        first_number = summary.consultation_count - (page - 1) * per_page
+        for index, consultation in enumerate(history):
+            consultation.numero = first_number - index
+
+    @cached_property
+    def profile(self):
+        return patient_profile(self.patient)
+
+    @property
+    def consultation_count(self):
+        return self.summary.consultation_count
+
+    @property
+    def has_previous(self):
+        return self.page > 1
+
+    @property
+    def next_page(self):
+        return self.page + 1
+
+    @property
+    def previous_page(self):
+        return self.page - 1
+
+
+# on_restore se llama si el paciente estaba archivado y se restauró (la vista fija al usuario al primario).
+def load_patient_detail(patient_id, page=1, per_page=HISTORY_PER_PAGE, on_restore=None):
+    page = max(int(page or 1), 1)
+    offset = (page - 1) * per_page
+    # Se pide una consulta de más para saber si hay página siguiente sin hacer COUNT
+    history = Consultation.objects.only(*HISTORY_FIELDS).order_by('-fecha_consulta', '-id')[offset:offset + per_page + 1]
+    patient = (
+        Patient.objects.select_related('summary')
+        .prefetch_related(Prefetch('consultation_set', queryset=history, to_attr='history_page'))
+        .filter(id=patient_id)
+        .first()
+    )
+    if patient is None:
+        # El paciente pudo haberse archivado: se restaura al abrir su detalle y se vuelve a leer del primario, porque
+        # la réplica todavía no tiene las filas restauradas
+        if restore_patient(patient_id) is None:
+            raise Http404("No se encontró el paciente")
+        if on_restore is not None:
+            on_restore()
+        with reading_from_primary():
+            return load_patient_detail(patient_id, page, per_page)
+
+    try:
+        summary = patient.summary
+    except PatientSummary.DoesNotExist:
+        # Solo pacientes anteriores al resumen; el siguiente acceso ya lo encuentra. Se cuenta en el primario, igual
+        # que donde se escribe
+        with reading_from_primary():
+            summary = PatientSummary.rebuild(patient.pk)
+
+    rows = patient.history_page
+    return PatientDetail(patient, summary, rows[:per_page], page, per_page, len(rows) > per_page)
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# patient_detail.html guarda la ficha y la página del historial con {% cache %} en el caché público. Las llaves
+# incluyen la versión del paciente de public_cache, que se incrementa al guardar o borrar el paciente o sus consultas,
+# así que un cambio deja de usar los fragmentos anteriores sin borrarlos.
+
+def detail_fragments(patient_id, page, superuser):
+    return {
+        'patient_id': patient_id,
+        'version': public_cache.patient_version(patient_id),
+        'page': page,
+        'superuser': superuser,
+        'ttl': getattr(settings, 'PUBLIC_CACHE_TTL', 300),
+        'cache_alias': getattr(settings, 'PUBLIC_CACHE_ALIAS', 'default'),
+    }
+
+
+def fragments_cached(fragment):
+    keys = [
+        make_template_fragment_key('patient_card', [fragment['patient_id'], fragment['version'], fragment['superuser']]),
+        make_template_fragment_key('patient_history', [fragment['patient_id'], fragment['version'], fragment['page'], fragment['superuser']]),
+    ]
+    return len(public_cache.get_cache().get_many(keys)) == len(keys)
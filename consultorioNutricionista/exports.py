@@ -0,0 +1,187 @@
+import csv
+import tempfile
+from datetime import datetime, time, timedelta
+
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Consultation, ExportJob
+from .pagination import keyset_filter
+
+try:
+    import openpyxl
+except ImportError:  # openpyxl es opcional: sin él no se ofrecen exportaciones XLSX
+    openpyxl = None
+
+try:
+    from reportlab.lib.pagesizes import landscape, letter
+    from reportlab.pdfgen import canvas
+except ImportError:  # reportlab es opcional: sin él no se ofrecen exportaciones PDF
+    canvas = None
+
+
+# Exportación de consultas de un paciente o de todo el consultorio.
+# Las filas se leen por bloques con paginación por llave sobre (paciente, fecha, id), que coincide con
+# consultation_patient_date_idx, así que ni el queryset ni el archivo completo se guardan en memoria: el CSV se envía
+# al navegador conforme se genera y los archivos XLSX y PDF se escriben en un archivo temporal desde el trabajador
+# (run_export_worker) antes de guardarse en MEDIA_ROOT.
+
+DEFAULT_CHUNK_SIZE = 2000
+STALE_MINUTES = 60
+
+COLUMNS = ('paciente', 'apellido_paterno', 'apellido_materno', 'nombre', 'fecha_consulta', 'peso', 'imc', 'observaciones')
+ORDER_FIELDS = ('patient_id', 'fecha_consulta', 'id')
+ROW_FIELDS = ('patient_id', 'fecha_consulta', 'id', 'patient__apellido_paterno', 'patient__apellido_materno',
+              'patient__nombre', 'peso', 'imc', 'observaciones')
+
+
+def available_formats():
+    formats = [ExportJob.CSV]
+    if openpyxl is not None:
+        formats.append(ExportJob.XLSX)
+    if canvas is not None:
+        formats.append(ExportJob.PDF)
+    return formats
+
+
+def export_queryset(patient_id=None, desde=None, hasta=None):
+    consultations = Consultation.objects.all()
+    if patient_id:
+        consultations = consultations.filter(patient_id=patient_id)
+    if desde:
+        consultations = consultations.filter(fecha_consulta__gte=timezone.make_aware(datetime.combine(desde, time.min)))
+    if hasta:
+        consultations = consultations.filter(fecha_consulta__lt=timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min)))
+    return consultations
+
+
+# Regresa las filas en el orden de COLUMNS, con la fecha en hora local y los decimales sin convertir.
+def consultation_rows(consultations, chunk_size=DEFAULT_CHUNK_SIZE):
+    ordered = consultations.order_by(*ORDER_FIELDS).values_list(*ROW_FIELDS)
+    last = None
+    while True:
+        chunk = ordered.filter(keyset_filter(ORDER_FIELDS, last, True)) if last else ordered
+        rows = list(chunk[:chunk_size])
+        for patient_id, fecha, _, paterno, materno, nombre, peso, imc, observaciones in rows:
+            yield patient_id, paterno, materno, nombre, timezone.localtime(fecha).strftime('%Y-%m-%d %H:%M'), peso, imc, observaciones
+        if len(rows) < chunk_size:
+            break
+        last = rows[-1][:3]
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Escritores. csv_lines genera las líneas de texto (para StreamingHttpResponse o para un archivo); los demás escriben
+# en un archivo binario abierto.
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def write_csv(output, rows):
+    for line in csv_lines(rows):
+        output.write(line.encode('utf-8'))
+
+
+def write_xlsx(output, rows):
+    # En modo write_only openpyxl escribe cada fila a disco en lugar de conservar la hoja en memoria
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet('Consultas')
+    sheet.append(COLUMNS)
+    for row in rows:
+        sheet.append(row)
+    workbook.save(output)
+
+
+PDF_COLUMNS = ((0, 'Paciente', 30), (1, 'Apellido paterno', 80), (2, 'Apellido materno', 80), (3, 'Nombre', 80),
+               (4, 'Fecha', 80), (5, 'Peso', 40), (6, 'IMC', 40), (7, 'Observaciones', 250))
+PDF_MARGIN = 36
+PDF_LINE = 14
+
+
+def write_pdf(output, rows):
+    width, height = landscape(letter)
+    pdf = canvas.Canvas(output, pagesize=(width, height), pageCompression=1)
+
+    def header():
+        pdf.setFont('Helvetica-Bold', 8)
+        x = PDF_MARGIN
+        for _, title, column_width in PDF_COLUMNS:
+            pdf.drawString(x, height - PDF_MARGIN, title)
+            x += column_width
+        pdf.setFont('Helvetica', 8)
+        return height - PDF_MARGIN - PDF_LINE
+
+    y = header()
+    for row in rows:
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            y = header()
+        x = PDF_MARGIN
+        for index, _, column_width in PDF_COLUMNS:
+            text = str(row[index]) if row[index] is not None else ''
+            pdf.drawString(x, y, text[:column_width // 4])
+            x += column_width
+        y -= PDF_LINE
+    pdf.save()
+
+
+WRITERS = {ExportJob.CSV: write_csv, ExportJob.XLSX: write_xlsx, ExportJob.PDF: write_pdf}
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Cola de trabajos. Varios trabajadores pueden correr a la vez: cada uno toma el siguiente trabajo pendiente que no
+# esté bloqueado por otro.
+
+def claim_next_job():
+    with transaction.atomic():
+        job = ExportJob.objects.select_for_update(skip_locked=True).filter(estado=ExportJob.PENDIENTE).order_by('id').first()
+        if job is None:
+            return None
+        job.estado = ExportJob.EN_PROCESO
+        job.iniciado = timezone.now()
+        job.save(update_fields=['estado', 'iniciado'])
+    return job
+
+
+# Regresa a la cola los trabajos que quedaron en proceso por un trabajador que se detuvo.
+def requeue_stale_jobs(minutes=STALE_MINUTES):
+    return ExportJob.objects.filter(estado=ExportJob.EN_PROCESO, iniciado__lt=timezone.now() - timedelta(minutes=minutes)).update(
+        estado=ExportJob.PENDIENTE, iniciado=None)
+
+
+def run_job(job, chunk_size=DEFAULT_CHUNK_SIZE):
+    counter = {'filas': 0}
+
+    def counted(rows):
+        for row in rows:
+            counter['filas'] += 1
+            yield row
+
+    try:
+        if job.formato not in available_formats():
+            raise ValueError(f"El formato {job.formato} no está disponible en este servidor")
+        rows = consultation_rows(export_queryset(job.patient_id, job.desde, job.hasta), chunk_size)
+        with tempfile.TemporaryFile() as output:
+            WRITERS[job.formato](output, counted(rows))
+            output.seek(0)
+            job.archivo.save(job.filename(), File(output), save=False)
+    except Exception as error:
+        job.estado = ExportJob.ERROR
+        job.error = str(error)
+    else:
+        job.estado = ExportJob.TERMINADO
+    job.filas = counter['filas']
+    job.terminado = timezone.now()
+    job.save(update_fields=['estado', 'error', 'archivo', 'filas', 'terminado'])
+    return job
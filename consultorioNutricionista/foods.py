@@ -0,0 +1,209 @@
+import bisect
+import csv
+import threading
+from decimal import Decimal, InvalidOperation
+
+from django.db import connections, router
+
+from .models import Food, MealPlanItem, normalize_name
+from .public_cache import get_version_cache, new_version
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él los totales se suman elemento por elemento
+    np = None
+
+
+# Tabla de alimentos en memoria para buscar por nombre y sumar los nutrientes de un plan sin consultar la base de datos.
+# FoodIndex guarda los nutrientes de todos los alimentos en una matriz (un renglón por alimento, una columna por
+# nutriente de Food.NUTRIENTS, por 100 g) y los nombres normalizados en listas ordenadas para buscar por prefijo con
+# bisect. Los totales de un plan son una multiplicación de los gramos por los renglones de sus alimentos.
+# Cada proceso construye el índice la primera vez que lo usa y lo conserva mientras no cambie la versión de la tabla,
+# que se incrementa al guardar o borrar un alimento o al importar el CSV. La versión vive en el caché de versiones
+# compartido (PUBLIC_VERSION_CACHE_ALIAS, revisado por "manage.py check --deploy") para que todos los procesos vean el
+# cambio. Si aun así se pide un alimento que el índice no tiene (la invalidación todavía no llega, o el alimento se
+# insertó sin señales), el índice se vuelve a construir una vez en lugar de fallar.
+
+VERSION_KEY = 'food-table-version'
+IMPORT_CHUNK_SIZE = 1000
+SEARCH_LIMIT = 20
+
+lock = threading.Lock()
+loaded = {'version': None, 'index': None}
+
+
+def food_version():
+    cache = get_version_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        version = new_version()
+        if not cache.add(VERSION_KEY, version, timeout=None):
+            version = cache.get(VERSION_KEY, version)
+    return version
+
+
+def bump_food_version():
+    cache = get_version_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, new_version(), timeout=None)
+
+
+class FoodIndex:
+    def __init__(self, rows):
+        rows = sorted(rows, key=lambda row: row[2])
+        self.ids = [row[0] for row in rows]
+        self.names = [row[1] for row in rows]
+        self.keys = [row[2] for row in rows]
+        self.positions = {food_id: position for position, food_id in enumerate(self.ids)}
+        values = [[float(value) for value in row[3:]] for row in rows]
+        if np is not None:
+            self.nutrients = np.array(values, dtype=np.float64).reshape(len(rows), len(Food.NUTRIENTS))
+        else:
+            self.nutrients = values
+
+        # Cada palabra del nombre (a partir de la segunda) también se puede buscar por prefijo
+        words = sorted((word, position) for position, key in enumerate(self.keys) for word in key.split()[1:])
+        self.words = [word for word, _ in words]
+        self.word_positions = [position for _, position in words]
+
+    @classmethod
+    def load(cls):
+        return cls(Food.objects.values_list('id', 'nombre', 'nombre_normalizado', *Food.NUTRIENTS).iterator(chunk_size=IMPORT_CHUNK_SIZE))
+
+    def __len__(self):
+        return len(self.ids)
+
+    # Regresa este índice si ya tiene todos los alimentos pedidos; si no, el índice reconstruido
+    def current(self, food_ids):
+        if all(food_id in self.positions for food_id in food_ids):
+            return self
+        return refreshed_index(self)
+
+    def name(self, food_id):
+        index = self.current([food_id])
+        return index.names[index.positions[food_id]]
+
+    # Alimentos cuyo nombre o alguna de sus palabras empieza con el texto; las coincidencias al inicio del nombre van
+    # primero, en orden alfabético.
+    def search(self, text, limit=SEARCH_LIMIT):
+        prefix = normalize_name(text).strip()
+        if not prefix:
+            return []
+        found = []
+        start = bisect.bisect_left(self.keys, prefix)
+        for position in range(start, len(self.keys)):
+            if len(found) >= limit or not self.keys[position].startswith(prefix):
+                break
+            found.append(position)
+        seen = set(found)
+        start = bisect.bisect_left(self.words, prefix)
+        for index in range(start, len(self.words)):
+            if len(found) >= limit or not self.words[index].startswith(prefix):
+                break
+            position = self.word_positions[index]
+            if position not in seen:
+                seen.add(position)
+                found.append(position)
+        return [(self.ids[position], self.names[position]) for position in found]
+
+    # Totales de nutrientes para pares (id de alimento, gramos); regresa un diccionario nutriente -> cantidad.
+    def totals(self, items):
+        items = list(items)
+        if not items:
+            return dict.fromkeys(Food.NUTRIENTS, 0.0)
+        index = self.current([food_id for food_id, _ in items])
+        positions = [index.positions[food_id] for food_id, _ in items]
+        if np is not None:
+            grams = np.fromiter((float(gramos) for _, gramos in items), np.float64, len(items))
+            values = (grams @ index.nutrients[positions]) / 100
+        else:
+            values = [0.0] * len(Food.NUTRIENTS)
+            for position, (_, gramos) in zip(positions, items):
+                factor = float(gramos) / 100
+                for column, value in enumerate(index.nutrients[position]):
+                    values[column] += value * factor
+        return {nutrient: round(float(value), 2) for nutrient, value in zip(Food.NUTRIENTS, values)}
+
+
+def food_index():
+    version = food_version()
+    if loaded['version'] != version:
+        with lock:
+            if loaded['version'] != version:
+                loaded['index'] = FoodIndex.load()
+                loaded['version'] = version
+    return loaded['index']
+
+
+# Reconstruye el índice si sigue siendo el que no tenía el alimento; si otro hilo ya lo reconstruyó se usa ese
+def refreshed_index(stale):
+    with lock:
+        if loaded['index'] is None or loaded['index'] is stale:
+            version = food_version()
+            loaded['index'] = FoodIndex.load()
+            loaded['version'] = version
+        return loaded['index']
+
+
+# Totales del plan completo y por comida (desayuno, colación, ...) con una sola lectura de sus renglones.
+def plan_totals(plan_id):
+    items = list(MealPlanItem.objects.filter(plan_id=plan_id).values_list('comida', 'food_id', 'gramos'))
+    index = food_index()
+    by_meal = {}
+    for comida, food_id, gramos in items:
+        by_meal.setdefault(comida, []).append((food_id, gramos))
+    return {
+        'total': index.totals((food_id, gramos) for _, food_id, gramos in items),
+        'comidas': {comida: index.totals(meal_items) for comida, meal_items in by_meal.items()},
+    }
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Importación del CSV de composición de alimentos. Las columnas son codigo, nombre, grupo y los nutrientes de
+# Food.NUTRIENTS por 100 g (las que falten quedan en 0). Las filas se insertan o actualizan por bloques con un solo
+# INSERT ... ON CONFLICT/ON DUPLICATE KEY UPDATE por bloque, sin señales por fila; al final se incrementa una vez la
+# versión de la tabla para que los procesos vuelvan a construir su índice.
+
+def parse_decimal(value):
+    value = (value or '').strip().replace(',', '.')
+    if not value or value in ('-', 'tr', 'ND'):
+        return Decimal(0)
+    return Decimal(value)
+
+
+def import_foods(stream, chunk_size=IMPORT_CHUNK_SIZE, delimiter=','):
+    connection = connections[router.db_for_write(Food)]
+    unique_fields = ['codigo'] if connection.features.supports_update_conflicts_with_target else None
+    update_fields = ['nombre', 'nombre_normalizado', 'grupo', *Food.NUTRIENTS]
+
+    imported, errors = 0, []
+    chunk = []
+    for line, row in enumerate(csv.DictReader(stream, delimiter=delimiter), start=2):
+        codigo, nombre = (row.get('codigo') or '').strip(), (row.get('nombre') or '').strip()
+        if not codigo or not nombre:
+            errors.append((line, 'Faltan el código o el nombre'))
+            continue
+        try:
+            nutrients = {nutrient: parse_decimal(row.get(nutrient)) for nutrient in Food.NUTRIENTS}
+        except InvalidOperation:
+            errors.append((line, 'Hay un valor de nutriente que no es numérico'))
+            continue
+        chunk.append(Food(codigo=codigo[:20], nombre=nombre[:200], nombre_normalizado=normalize_name(nombre)[:200],
+                          grupo=(row.get('grupo') or '').strip()[:100], **nutrients))
+        if len(chunk) >= chunk_size:
+            imported += save_foods(chunk, unique_fields, update_fields)
+            chunk = []
+    if chunk:
+        imported += save_foods(chunk, unique_fields, update_fields)
+    bump_food_version()
+    return imported, errors
+
+
+def save_foods(foods, unique_fields, update_fields):
+    # Un código repetido dentro del mismo bloque se queda con la última fila
+    foods = list({food.codigo: food for food in foods}.values())
+    Food.objects.bulk_create(foods, update_conflicts=True, unique_fields=unique_fields, update_fields=update_fields)
+    return len(foods)
@@ -1,10 +1,10 @@
-from datetime import datetime
-
 from django import forms
 from django.contrib.auth import authenticate
+from django.db import transaction
 from django.contrib.auth.forms import ReadOnlyPasswordHashField, AuthenticationForm
 from django.utils.translation import gettext_lazy as _
-from .models import Patient, Consultation
+from .models import Patient, Consultation, ExportJob, Food, MealPlanItem
+from .exports import available_formats
 from django.contrib.auth.models import User
 
 # Esta clase define un formulario que será utilizado para la creación y edición de instancias de usuarios con el rol de nutricionista en el sistema.
@@ -109,9 +109,93 @@ class ConsultationForm(forms.ModelForm):
             'observaciones': forms.Textarea(attrs={'class': 'form-control'}),
         }
 
+    # La consulta (con su IMC ya calculado) y el peso del paciente se escriben en una sola transacción, con una
+    # sentencia por tabla; el receptor de post_save agrega el UPDATE de PatientSummary.
     def save(self, commit=True):
         consultation = super().save(commit=False)
-        consultation.fecha_consulta = datetime.now()
         if commit:
-            consultation.save()
-        return consultation
\ No newline at end of file
+            with transaction.atomic():
+                consultation.save()
+                Patient.objects.filter(pk=consultation.patient_id).update(peso=consultation.peso)
+        return consultation
+# ----------------------------------------------------------------------------------------------------------------------#
+
+# Esta clase define un formulario para subir un archivo CSV o JSONL con consultas históricas.
+
+class ConsultationImportForm(forms.Form):
+    archivo = forms.FileField(label='Archivo de consultas (CSV o JSONL)')
+    formato = forms.ChoiceField(choices=[('', 'Según la extensión'), ('csv', 'CSV'), ('jsonl', 'JSONL')], required=False)
+
+# ----------------------------------------------------------------------------------------------------------------------#
+
+# Esta clase define los filtros de la serie de progreso de un paciente: rango de fechas, número máximo de puntos,
+# agrupación opcional por semana o mes y formato de salida.
+
+class ProgressFilterForm(forms.Form):
+    desde = forms.DateField(required=False)
+    hasta = forms.DateField(required=False)
+    max_points = forms.IntegerField(required=False, min_value=3, max_value=5000)
+    agrupar = forms.ChoiceField(choices=[('', 'Sin agrupar'), ('week', 'Semana'), ('month', 'Mes')], required=False)
+    formato = forms.ChoiceField(choices=[('json', 'JSON'), ('csv', 'CSV')], required=False)
+
+# ----------------------------------------------------------------------------------------------------------------------#
+
+# Esta clase define una exportación de consultas: formato, paciente (vacío para todo el consultorio) y rango de fechas
+# opcional. Solo se ofrecen los formatos cuyas bibliotecas están instaladas.
+
+class ExportForm(forms.Form):
+    formato = forms.ChoiceField(choices=ExportJob.FORMATOS)
+    patient_id = forms.IntegerField(required=False, min_value=1, label='Id de paciente (vacío para todos)')
+    desde = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+    hasta = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date'}))
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        formats = available_formats()
+        self.fields['formato'].choices = [(value, label) for value, label in ExportJob.FORMATOS if value in formats]
+
+    def clean_patient_id(self):
+        patient_id = self.cleaned_data['patient_id']
+        if patient_id and not Patient.objects.filter(id=patient_id).exists():
+            raise forms.ValidationError('No existe un paciente con ese id')
+        return patient_id
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('desde') and cleaned_data.get('hasta') and cleaned_data['desde'] > cleaned_data['hasta']:
+            raise forms.ValidationError('La fecha inicial es posterior a la final')
+        return cleaned_data
+
+# ----------------------------------------------------------------------------------------------------------------------#
+
+# Esta clase define el formulario para reservar una cita con un nutricionista; los empalmes y la disponibilidad se
+# revisan al reservar (ver scheduling.book_appointment).
+
+class AppointmentForm(forms.Form):
+    patient_id = forms.IntegerField(min_value=1, label='Id de paciente')
+    nutritionist = forms.ModelChoiceField(queryset=User.objects.filter(is_superuser=True, is_active=True).order_by('username'),
+                                          label='Nutricionista')
+    inicio = forms.DateTimeField(widget=forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+                                 input_formats=['%Y-%m-%dT%H:%M'])
+    duracion = forms.IntegerField(min_value=10, max_value=240, initial=30, label='Duración (minutos)')
+
+    def clean_patient_id(self):
+        patient_id = self.cleaned_data['patient_id']
+        if not Patient.objects.filter(id=patient_id, is_active=True).exists():
+            raise forms.ValidationError('No existe un paciente activo con ese id')
+        return patient_id
+
+# ----------------------------------------------------------------------------------------------------------------------#
+
+# Esta clase define el formulario para agregar un alimento al plan de alimentación de una consulta.
+
+class MealPlanItemForm(forms.Form):
+    food_id = forms.IntegerField(min_value=1, widget=forms.HiddenInput)
+    comida = forms.ChoiceField(choices=MealPlanItem.COMIDAS, initial=MealPlanItem.COMIDA)
+    gramos = forms.DecimalField(max_digits=7, decimal_places=2, min_value=0.01)
+
+    def clean_food_id(self):
+        food_id = self.cleaned_data['food_id']
+        if not Food.objects.filter(id=food_id).exists():
+            raise forms.ValidationError('Seleccione un alimento de la lista')
+        return food_id
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.contrib.auth.hashers import Argon2PasswordHasher
+
+
+# Argon2 con los parámetros medidos en el servidor con "manage.py calibrate_password_hasher" (ARGON2_TIME_COST,
+# ARGON2_MEMORY_COST y ARGON2_PARALLELISM en settings) en lugar de los valores fijos de Django.
+# El algoritmo sigue siendo "argon2", así que los hashes existentes se siguen verificando. Al iniciar sesión Django
+# vuelve a calcular el hash si la contraseña se guardó con otro algoritmo (PBKDF2) o con otros parámetros, de modo que
+# los usuarios pasan a la política nueva sin restablecer su contraseña.
+class CalibratedArgon2PasswordHasher(Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return getattr(settings, 'ARGON2_TIME_COST', Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return getattr(settings, 'ARGON2_MEMORY_COST', Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return getattr(settings, 'ARGON2_PARALLELISM', Argon2PasswordHasher.parallelism)
@@ -0,0 +1,184 @@
+import csv
+import io
+import json
+import time
+from itertools import islice
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .forms import ConsultationForm
+from .models import Patient, Consultation, PatientSummary, RollupChange
+from .nutrition import calculate_imc_batch
+from .public_cache import bump_patient_version
+
+
+# Importación masiva de consultas históricas desde archivos CSV o JSONL.
+# Cada fila debe traer las columnas patient, peso y observaciones; fecha_consulta es opcional.
+# Las filas se leen en streaming y se procesan por bloques: los pacientes del bloque se resuelven con in_bulk, el IMC
+# se calcula por lote y las consultas se insertan con bulk_create (sin disparar post_save por cada fila).
+
+IMPORT_FORMATS = ('csv', 'jsonl')
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+patient_field = forms.IntegerField(min_value=1)
+fecha_field = forms.DateTimeField(required=False)
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows_read = 0
+        self.rows_imported = 0
+        self.error_count = 0
+        self.errors = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add_error(self, line, messages):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, messages))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        if not self.elapsed:
+            return 0.0
+        return self.rows_read / self.elapsed
+
+    def __str__(self):
+        return (f"{self.rows_imported} de {self.rows_read} filas importadas, {self.error_count} con errores, "
+                f"{self.elapsed:.2f} s ({self.rows_per_second:.0f} filas/s)")
+
+
+def guess_format(filename):
+    return 'jsonl' if filename.lower().endswith(('.jsonl', '.ndjson', '.json')) else 'csv'
+
+
+def read_rows(stream, file_format):
+    # Regresa pares (fila, errores de lectura) sin cargar el archivo completo en memoria
+    if file_format == 'csv':
+        for row in csv.DictReader(stream):
+            yield row, None
+    else:
+        for line in stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield None, [f"JSON inválido: {e}"]
+                continue
+            if not isinstance(row, dict):
+                yield None, ['Cada línea debe ser un objeto JSON']
+                continue
+            yield row, None
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Valida una fila con las mismas reglas de campo que ConsultationForm. El paciente se valida como entero y se resuelve
+# después por bloque.
+
+def clean_row(row):
+    cleaned = {}
+    errors = []
+    fields = (
+        ('patient', patient_field),
+        ('peso', ConsultationForm.base_fields['peso']),
+        ('observaciones', ConsultationForm.base_fields['observaciones']),
+        ('fecha_consulta', fecha_field),
+    )
+    for name, field in fields:
+        try:
+            cleaned[name] = field.clean(row.get(name))
+        except ValidationError as e:
+            errors.extend(f"{name}: {message}" for message in e.messages)
+    return cleaned, errors
+
+
+def import_chunk(rows, report):
+    patients = Patient.objects.only('id', 'altura').in_bulk({row['patient'] for _, row in rows})
+
+    valid = []
+    for line, row in rows:
+        patient = patients.get(row['patient'])
+        if patient is None:
+            report.add_error(line, [f"patient: no existe el paciente {row['patient']}"])
+        else:
+            valid.append((line, row, patient))
+
+    imcs = calculate_imc_batch([row['peso'] for _, row, _ in valid], [patient.altura for _, _, patient in valid])
+
+    consultations = []
+    for (line, row, patient), imc in zip(valid, imcs):
+        if imc is None:
+            report.add_error(line, ['patient: el paciente no tiene una altura válida'])
+            continue
+        consultation = Consultation(patient_id=patient.id, peso=row['peso'], observaciones=row['observaciones'], imc=imc)
+        if row['fecha_consulta']:
+            consultation.fecha_consulta = row['fecha_consulta']
+        consultations.append(consultation)
+
+    with transaction.atomic():
+        Consultation.objects.bulk_create(consultations)
+        RollupChange.record((consultation.patient_id, consultation.fecha_consulta) for consultation in consultations)
+    report.rows_imported += len(consultations)
+    return {consultation.patient_id for consultation in consultations}
+
+
+def import_consultations(stream, file_format='csv', chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError(f"Formato no soportado: {file_format}")
+
+    report = ImportReport()
+    touched_patients = set()
+    rows = enumerate(read_rows(stream, file_format), start=1)
+
+    while True:
+        block = list(islice(rows, chunk_size))
+        if not block:
+            break
+        report.rows_read += len(block)
+
+        pending = []
+        for line, (row, errors) in block:
+            if errors is None:
+                row, errors = clean_row(row)
+            if errors:
+                report.add_error(line, errors)
+            else:
+                pending.append((line, row))
+
+        if pending:
+            touched_patients |= import_chunk(pending, report)
+        if progress is not None:
+            progress(report)
+
+    # bulk_create no dispara las señales, así que los resúmenes se recalculan y las páginas en caché se invalidan una
+    # vez por paciente al final. Como en ConsultationForm.save, el peso del paciente es el de su última consulta, que
+    # el resumen recién calculado ya tiene (una importación retroactiva no lo cambia).
+    PatientSummary.rebuild_many(touched_patients)
+    latest_peso = PatientSummary.objects.filter(patient_id=OuterRef('pk')).values('latest_peso')[:1]
+    patient_ids = sorted(touched_patients)
+    for start in range(0, len(patient_ids), chunk_size):
+        Patient.objects.filter(id__in=patient_ids[start:start + chunk_size]).update(peso=Subquery(latest_peso))
+    for patient_id in touched_patients:
+        bump_patient_version(patient_id)
+    report.finish()
+    return report
+
+
+def import_uploaded_file(uploaded_file, file_format=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    file_format = file_format or guess_format(uploaded_file.name)
+    stream = io.TextIOWrapper(uploaded_file.file, encoding='utf-8-sig', newline='')
+    try:
+        return import_consultations(stream, file_format, chunk_size)
+    finally:
+        stream.detach()
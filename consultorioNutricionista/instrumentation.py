@@ -0,0 +1,240 @@
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.template.backends.django import Template as DjangoTemplate
+
+
+# Instrumentación de las vistas: por cada nombre de URL se acumulan las peticiones, el número de sentencias SQL, el
+# tiempo en SQL, el tiempo de render de plantillas, la latencia total y las sentencias repetidas dentro de una misma
+# petición (candidatas a N+1). Solo una fracción de las peticiones (QUERY_STATS_SAMPLE_RATE) registra el detalle de
+# SQL y plantillas; la latencia se mide en todas. Los datos viven en la memoria de cada proceso.
+
+# Veces que una misma sentencia (sin importar los parámetros) debe repetirse en una petición para reportarla
+N_PLUS_ONE_THRESHOLD = 3
+MAX_FINGERPRINTS_PER_VIEW = 20
+
+local = threading.local()
+END_OF_STREAM = object()
+whitespace = re.compile(r'\s+')
+in_list = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def fingerprint(sql):
+    return in_list.sub('IN (...)', whitespace.sub(' ', sql).strip())
+
+
+class RequestProfile:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.statements = Counter()
+
+    def add_query(self, sql, elapsed):
+        self.queries += 1
+        self.sql_time += elapsed
+        self.statements[fingerprint(sql)] += 1
+
+    def repeated(self):
+        return {sql: count for sql, count in self.statements.items() if count >= N_PLUS_ONE_THRESHOLD}
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.sampled = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.latency = 0.0
+        self.sampled_latency = 0.0
+        self.repeated = Counter()
+
+    def as_dict(self):
+        sampled = self.sampled or 1
+        return {
+            'requests': self.requests,
+            'sampled': self.sampled,
+            'avg_queries': round(self.queries / sampled, 2),
+            'max_queries': self.max_queries,
+            'avg_sql_ms': round(self.sql_time / sampled * 1000, 2),
+            'avg_template_ms': round(self.template_time / sampled * 1000, 2),
+            'avg_latency_ms': round(self.latency / (self.requests or 1) * 1000, 2),
+            'repeated_queries': self.repeated.most_common(5),
+        }
+
+
+class StatsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view_name, latency, profile=None):
+        with self.lock:
+            stats = self.views.setdefault(view_name, ViewStats())
+            stats.requests += 1
+            stats.latency += latency
+            if profile is None:
+                return
+            stats.sampled += 1
+            stats.sampled_latency += latency
+            stats.queries += profile.queries
+            stats.max_queries = max(stats.max_queries, profile.queries)
+            stats.sql_time += profile.sql_time
+            stats.template_time += profile.template_time
+            for sql in profile.repeated():
+                if sql in stats.repeated or len(stats.repeated) < MAX_FINGERPRINTS_PER_VIEW:
+                    stats.repeated[sql] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {name: stats.as_dict() for name, stats in sorted(self.views.items())}
+
+    def prometheus(self):
+        metrics = (
+            ('requests_total', 'counter', 'Peticiones atendidas', lambda s: s.requests),
+            ('sampled_requests_total', 'counter', 'Peticiones con detalle de SQL y plantillas', lambda s: s.sampled),
+            ('queries_total', 'counter', 'Sentencias SQL en peticiones muestreadas', lambda s: s.queries),
+            ('sql_seconds_total', 'counter', 'Tiempo en SQL en peticiones muestreadas', lambda s: s.sql_time),
+            ('template_seconds_total', 'counter', 'Tiempo de render de plantillas en peticiones muestreadas', lambda s: s.template_time),
+            ('latency_seconds_total', 'counter', 'Latencia total de todas las peticiones', lambda s: s.latency),
+            ('sampled_latency_seconds_total', 'counter', 'Latencia total de las peticiones muestreadas', lambda s: s.sampled_latency),
+            ('repeated_queries_total', 'counter', 'Peticiones con sentencias repetidas (N+1)', lambda s: sum(s.repeated.values())),
+        )
+        with self.lock:
+            lines = []
+            for name, kind, description, value in metrics:
+                lines.append(f'# HELP consultorio_view_{name} {description}')
+                lines.append(f'# TYPE consultorio_view_{name} {kind}')
+                for view_name, stats in sorted(self.views.items()):
+                    lines.append(f'consultorio_view_{name}{{view="{view_name}"}} {value(stats)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = StatsRegistry()
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+def timed_execute(execute, sql, params, many, context):
+    profile = getattr(local, 'profile', None)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if profile is not None:
+            profile.add_query(sql, time.perf_counter() - start)
+
+
+# Envuelve el render de las plantillas una sola vez por proceso. Fuera de una petición muestreada solo cuesta una
+# lectura del thread-local; los renders anidados no se cuentan dos veces.
+def install_template_timer():
+    if getattr(DjangoTemplate.render, 'instrumented', False):
+        return
+    original_render = DjangoTemplate.render
+
+    def render(self, context=None, request=None):
+        profile = getattr(local, 'profile', None)
+        if profile is None or profile.template_depth:
+            return original_render(self, context, request)
+        profile.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return original_render(self, context, request)
+        finally:
+            profile.template_depth -= 1
+            profile.template_time += time.perf_counter() - start
+
+    render.instrumented = True
+    DjangoTemplate.render = render
+
+
+# Activa el perfil de la petición (el thread-local que leen timed_execute y el render de plantillas) y el wrapper de
+# SQL en todas las conexiones mientras dura el bloque. Sin perfil no hace nada.
+@contextmanager
+def profiling(profile):
+    if profile is None:
+        yield
+        return
+    local.profile = profile
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timed_execute))
+            yield
+    finally:
+        local.profile = None
+
+
+# Bajo ASGI el middleware corre en modo asíncrono para no obligar a Django a pasar las vistas async a un hilo; en ese
+# modo solo se mide la latencia, porque las sentencias SQL se ejecutan en otros hilos.
+# En una respuesta en streaming la vista regresa antes de leer la base de datos y de renderizar: el trabajo ocurre al
+# recorrer el contenido. Por eso cada fragmento se genera dentro del perfil y la petición se registra cuando el
+# contenido se agota o se cierra; la latencia incluye entonces el envío de todos los fragmentos.
+class QueryStatsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = float(getattr(settings, 'QUERY_STATS_SAMPLE_RATE', 0.1))
+        install_template_timer()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        start = time.perf_counter()
+        profile = RequestProfile() if random.random() < self.sample_rate else None
+        with profiling(profile):
+            response = self.get_response(request)
+        return self.finish(request, response, start, profile)
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        return self.finish(request, response, start)
+
+    def finish(self, request, response, start, profile=None):
+        if not response.streaming:
+            self.record(request, start, profile)
+        elif response.is_async:
+            response.streaming_content = self.measure_async_chunks(request, response.streaming_content, start)
+        else:
+            response.streaming_content = self.measure_chunks(request, response.streaming_content, start, profile)
+        return response
+
+    def measure_chunks(self, request, chunks, start, profile):
+        chunks = iter(chunks)
+        try:
+            while True:
+                with profiling(profile):
+                    chunk = next(chunks, END_OF_STREAM)
+                if chunk is END_OF_STREAM:
+                    return
+                yield chunk
+        finally:
+            self.record(request, start, profile)
+
+    async def measure_async_chunks(self, request, chunks, start):
+        try:
+            async for chunk in chunks:
+                yield chunk
+        finally:
+            self.record(request, start)
+
+    def record(self, request, start, profile=None):
+        match = getattr(request, 'resolver_match', None)
+        view_name = match.view_name if match is not None else 'unresolved'
+        registry.record(view_name, time.perf_counter() - start, profile)
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from consultorioNutricionista.archive import DEFAULT_CHUNK_SIZE, DEFAULT_ROWS_CHUNK_SIZE, archive_patients
+
+
+class Command(BaseCommand):
+    help = 'Mueve los pacientes inactivos y sus consultas a las tablas de archivo por bloques'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inactive-days', type=int, default=0, help='Solo pacientes sin consultas en estos días')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Pacientes por transacción')
+        parser.add_argument('--rows-chunk-size', type=int, default=DEFAULT_ROWS_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        def progress(patients, consultations, elapsed):
+            self.stdout.write(f"{patients} pacientes y {consultations} consultas archivados ({elapsed:.1f} s)")
+
+        patients, consultations, elapsed = archive_patients(
+            options['inactive_days'], options['chunk_size'], options['rows_chunk_size'], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"{patients} pacientes y {consultations} consultas archivados en {elapsed:.2f} s"))
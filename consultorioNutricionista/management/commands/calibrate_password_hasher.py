@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+try:
+    import argon2
+except ImportError:  # argon2-cffi es opcional: sin él se siguen usando los hashers de Django
+    argon2 = None
+
+
+# Mide en este servidor cuánto tarda Argon2 y busca el time_cost más alto que no pasa del tiempo objetivo por inicio
+# de sesión con la memoria y el paralelismo dados. Imprime las variables de entorno para settings_production.py.
+
+class Command(BaseCommand):
+    help = 'Calibra los parámetros de Argon2 para un tiempo objetivo por hash'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target-ms', type=float, default=100.0, help='Tiempo objetivo por hash en milisegundos')
+        parser.add_argument('--memory-cost', type=int, default=65536, help='Memoria en KiB por hash')
+        parser.add_argument('--parallelism', type=int, default=2)
+        parser.add_argument('--max-time-cost', type=int, default=20)
+        parser.add_argument('--samples', type=int, default=5)
+
+    def measure(self, time_cost, memory_cost, parallelism, samples):
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            argon2.low_level.hash_secret(b'calibracion', b'salt-calibracion', time_cost=time_cost, memory_cost=memory_cost,
+                                         parallelism=parallelism, hash_len=32, type=argon2.low_level.Type.ID)
+            timings.append((time.perf_counter() - start) * 1000)
+        return sorted(timings)[len(timings) // 2]
+
+    def handle(self, *args, **options):
+        if argon2 is None:
+            raise CommandError('Instala argon2-cffi para usar Argon2')
+
+        memory_cost, parallelism = options['memory_cost'], options['parallelism']
+        time_cost = 1
+        for candidate in range(1, options['max_time_cost'] + 1):
+            elapsed = self.measure(candidate, memory_cost, parallelism, options['samples'])
+            self.stdout.write(f"time_cost={candidate}: {elapsed:.1f} ms")
+            if elapsed > options['target_ms']:
+                if candidate == 1:
+                    self.stdout.write(self.style.WARNING('Con time_cost=1 ya se pasa del objetivo; reduce --memory-cost'))
+                break
+            time_cost = candidate
+
+        self.stdout.write(self.style.SUCCESS(
+            f"PASSWORD_HASHER=argon2 ARGON2_TIME_COST={time_cost} ARGON2_MEMORY_COST={memory_cost} ARGON2_PARALLELISM={parallelism}"))
@@ -0,0 +1,38 @@
+import time
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore as DatabaseSessionStore
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+
+# Alternativa a "manage.py clearsessions" para tablas de sesiones grandes: borra las sesiones vencidas por bloques de
+# llaves primarias (DELETE ... WHERE session_key IN (...)) en lugar de un solo DELETE sobre todo el rango de
+# expire_date, así que cada sentencia bloquea pocas filas y no crece el log de la transacción.
+
+class Command(BaseCommand):
+    help = 'Borra las sesiones vencidas por bloques'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--pause', type=float, default=0.0, help='Segundos de espera entre bloques')
+
+    def handle(self, *args, **options):
+        store = import_module(settings.SESSION_ENGINE).SessionStore
+        if not issubclass(store, DatabaseSessionStore):
+            # Con sesiones en caché o en cookies firmadas no hay tabla que limpiar: vencen solas
+            self.stdout.write(f"{settings.SESSION_ENGINE} no guarda sesiones en la base de datos")
+            return
+
+        sessions = store.get_model_class().objects
+        expired = sessions.filter(expire_date__lt=timezone.now()).order_by('pk').values_list('pk', flat=True)
+        deleted = 0
+        while True:
+            keys = list(expired[:options['batch_size']])
+            if not keys:
+                break
+            deleted += sessions.filter(pk__in=keys).delete()[0]
+            if options['pause']:
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} sesiones vencidas borradas"))
@@ -0,0 +1,99 @@
+import json
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from consultorioNutricionista.analytics import day_consultations
+from consultorioNutricionista.models import Patient, Consultation
+from consultorioNutricionista.pagination import PATIENT_KEYSET_FIELDS, keyset_filter
+
+
+# Revisa con EXPLAIN que las consultas del historial y de la lista de pacientes se sirvan desde los índices: falla si
+# algún plan ordena en memoria (filesort / temp b-tree) o recorre la tabla completa. Funciona con MySQL y SQLite.
+
+# Un SCAN sin USING recorre la tabla completa. No cuenta el SCAN (subquery-N) de un co-routine (la subconsulta de la
+# ventana de consultation_history), que recorre filas que ya se leyeron del índice.
+SQLITE_FULL_SCAN = re.compile(r'\bSCAN (?!\(subquery-)(?!.*\bUSING\b)', re.MULTILINE)
+
+
+# Tablas del plan JSON de MySQL, sin contar las derivadas (<derived2>), que son resultados intermedios ya filtrados.
+def mysql_tables(node):
+    if isinstance(node, dict):
+        table = node.get('table')
+        if isinstance(table, dict) and not table.get('table_name', '').startswith('<'):
+            yield table
+        for value in node.values():
+            yield from mysql_tables(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from mysql_tables(value)
+
+
+def plan_problems(plan, vendor=None):
+    vendor = vendor or connection.vendor
+    problems = []
+    if vendor == 'mysql':
+        if re.search(r'"using_filesort":\s*true', plan):
+            problems.append('filesort')
+        if any(table.get('access_type') == 'ALL' for table in mysql_tables(json.loads(plan))):
+            problems.append('recorrido completo')
+    elif vendor == 'sqlite':
+        if 'USE TEMP B-TREE' in plan:
+            problems.append('ordenamiento temporal')
+        if SQLITE_FULL_SCAN.search(plan):
+            problems.append('recorrido completo')
+    return problems
+
+
+# Consultas que deben servirse desde los índices: las del historial de un paciente y las páginas de la lista de
+# pacientes activos (primera página y la siguiente a partir de un cursor, en el orden de PATIENT_KEYSET_FIELDS).
+def index_checks(patient_id):
+    patient = Patient(pk=patient_id)
+    active = Patient.objects.filter(is_active=True).order_by(*PATIENT_KEYSET_FIELDS)
+    cursor = ['M', 'M', 'M', 0]
+    return [
+        ('Última consulta (latest)', Consultation.objects.filter(patient_id=patient_id).order_by('-fecha_consulta', '-id')[:1]),
+        ('Últimas consultas', patient.latest_consultations(2)),
+        ('IMC actual', Consultation.objects.filter(patient_id=patient_id).order_by('-fecha_consulta', '-id').values_list('imc', flat=True)[:1]),
+        ('IMC anterior (ventana)', patient.consultation_history().values_list('imc_anterior', flat=True)[:1]),
+        ('Historial', patient.consultation_history()),
+        ('Pacientes activos por apellido', active[:20]),
+        ('Pacientes activos (página siguiente)', active.filter(keyset_filter(PATIENT_KEYSET_FIELDS, cursor, True))[:20]),
+        ('Consultas de un día (agregados)', day_consultations(timezone.localdate())),
+    ]
+
+
+def explain(queryset):
+    if connection.vendor == 'mysql':
+        return queryset.explain(format='JSON')
+    return queryset.explain()
+
+
+class Command(BaseCommand):
+    help = 'Verifica con EXPLAIN que el historial de consultas y la lista de pacientes usan los índices compuestos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, help='Paciente para las consultas de historial (por defecto el primero)')
+        parser.add_argument('--verbose-plans', action='store_true', help='Muestra el plan completo de cada consulta')
+
+    def handle(self, *args, **options):
+        patient_id = options['patient'] or Patient.objects.order_by('id').values_list('id', flat=True).first()
+        if patient_id is None:
+            raise CommandError('No hay pacientes para revisar')
+        checks = index_checks(patient_id)
+
+        failures = []
+        for name, queryset in checks:
+            plan = explain(queryset)
+            problems = plan_problems(plan)
+            status = self.style.ERROR('FALLA: ' + ', '.join(problems)) if problems else self.style.SUCCESS('ok')
+            self.stdout.write(f"{name}: {status}")
+            if options['verbose_plans'] or problems:
+                self.stdout.write(plan)
+            if problems:
+                failures.append(name)
+
+        if failures:
+            raise CommandError(f"{len(failures)} consultas no se sirven desde un índice: {', '.join(failures)}")
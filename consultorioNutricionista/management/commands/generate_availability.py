@@ -0,0 +1,39 @@
+from datetime import datetime
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from consultorioNutricionista.scheduling import BATCH_SIZE, generate_recurring_slots
+
+
+class Command(BaseCommand):
+    help = 'Genera por lote los bloques de disponibilidad semanales de un nutricionista'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nutritionist', required=True, help='Nombre de usuario del nutricionista')
+        parser.add_argument('--days', default='0,1,2,3,4', help='Días de la semana separados por comas (0 es lunes)')
+        parser.add_argument('--start', required=True, help='Hora inicial HH:MM')
+        parser.add_argument('--end', required=True, help='Hora final HH:MM')
+        parser.add_argument('--from', dest='desde', required=True, help='Fecha inicial AAAA-MM-DD')
+        parser.add_argument('--to', dest='hasta', required=True, help='Fecha final AAAA-MM-DD (incluida)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            dias = [int(day) for day in options['days'].split(',')]
+            hora_inicio = datetime.strptime(options['start'], '%H:%M').time()
+            hora_fin = datetime.strptime(options['end'], '%H:%M').time()
+            desde = datetime.strptime(options['desde'], '%Y-%m-%d').date()
+            hasta = datetime.strptime(options['hasta'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('Formato inválido: días 0-6 separados por comas, horas HH:MM y fechas AAAA-MM-DD')
+
+        nutritionist = User.objects.filter(username=options['nutritionist'], is_superuser=True).first()
+        if nutritionist is None:
+            raise CommandError(f"No existe el nutricionista {options['nutritionist']}")
+
+        try:
+            created, skipped = generate_recurring_slots(nutritionist.pk, desde, hasta, dias, hora_inicio, hora_fin, options['batch_size'])
+        except ValueError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(f"{created} bloques creados, {skipped} omitidos por empalmarse con otros"))
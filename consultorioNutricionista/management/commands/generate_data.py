@@ -0,0 +1,103 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from consultorioNutricionista.models import Patient, Consultation, PatientNameToken, PatientSummary, RollupChange
+from consultorioNutricionista.nutrition import calculate_imc_batch
+
+
+NOMBRES_M = ['José', 'Juan', 'Luis', 'Carlos', 'Miguel', 'Jorge', 'Daniel', 'Alejandro', 'Fernando', 'Ricardo', 'Andrés', 'Raúl']
+NOMBRES_F = ['María', 'Guadalupe', 'Ana', 'Laura', 'Sofía', 'Fernanda', 'Daniela', 'Lucía', 'Mónica', 'Patricia', 'Verónica', 'Inés']
+APELLIDOS = ['Hernández', 'García', 'Martínez', 'López', 'González', 'Pérez', 'Rodríguez', 'Sánchez', 'Ramírez', 'Cruz',
+             'Flores', 'Gómez', 'Morales', 'Vázquez', 'Jiménez', 'Reyes', 'Díaz', 'Torres', 'Gutiérrez', 'Ruiz', 'Núñez', 'Ávila']
+
+
+def two_places(value):
+    return Decimal(f'{value:.2f}')
+
+
+# Genera pacientes y consultas sintéticas con distribuciones realistas para pruebas de rendimiento:
+# estatura normal por sexo, IMC inicial alrededor de 26, visitas cada ~30 días y una tendencia ligera a bajar de peso.
+
+class Command(BaseCommand):
+    help = 'Genera N pacientes con M consultas cada uno para pruebas de rendimiento'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=1000)
+        parser.add_argument('--consultations', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        total, chunk_size = options['patients'], options['chunk_size']
+        next_id = (Patient.objects.aggregate(Max('id'))['id__max'] or 0) + 1
+
+        created = 0
+        while created < total:
+            size = min(chunk_size, total - created)
+            with transaction.atomic():
+                self.create_chunk(rng, next_id, size, options['consultations'])
+            next_id += size
+            created += size
+            self.stdout.write(f"{created}/{total} pacientes generados")
+
+        self.stdout.write(self.style.SUCCESS(f"{created} pacientes y {created * options['consultations']} consultas generados"))
+
+    def create_chunk(self, rng, first_id, size, visits):
+        today = date.today()
+        patients = []
+        for patient_id in range(first_id, first_id + size):
+            sexo = rng.choice('MF')
+            altura = rng.gauss(1.72, 0.07) if sexo == 'M' else rng.gauss(1.60, 0.065)
+            imc = min(max(rng.gauss(26, 4.5), 16), 45)
+            patients.append(Patient(
+                id=patient_id,
+                nombre=rng.choice(NOMBRES_M if sexo == 'M' else NOMBRES_F),
+                apellido_paterno=rng.choice(APELLIDOS),
+                apellido_materno=rng.choice(APELLIDOS),
+                fecha_nacimiento=today - timedelta(days=rng.randint(18 * 365, 80 * 365)),
+                sexo=sexo,
+                altura=two_places(altura),
+                peso=two_places(imc * altura * altura),
+                actividad_aerobica=rng.random() < 0.4,
+                is_active=rng.random() < 0.9,
+            ))
+
+        consultations = []
+        summaries = []
+        now = timezone.now()
+        for patient in patients:
+            fecha = now - timedelta(days=visits * 30 + rng.randint(0, 365))
+            peso = float(patient.peso)
+            history = []
+            for _ in range(visits):
+                peso = max(peso + rng.gauss(-0.3, 1.2), 35)
+                history.append(Consultation(patient_id=patient.id, fecha_consulta=fecha, peso=two_places(peso),
+                                            observaciones=rng.choice(['Control', 'Seguimiento', 'Ajuste de plan', 'Sin cambios'])))
+                fecha += timedelta(days=max(rng.gauss(30, 10), 7))
+            imcs = calculate_imc_batch([c.peso for c in history], [patient.altura] * len(history))
+            for consultation, imc in zip(history, imcs):
+                consultation.imc = imc
+            consultations.extend(history)
+            summaries.append(PatientSummary(
+                patient_id=patient.id,
+                consultation_count=len(history),
+                latest_imc=history[-1].imc if history else None,
+                previous_imc=history[-2].imc if len(history) > 1 else None,
+                latest_peso=history[-1].peso if history else None,
+                last_visit=history[-1].fecha_consulta if history else None,
+            ))
+
+        # bulk_create no dispara señales: los tokens de búsqueda, los resúmenes y los cambios para la analítica (todas las
+        # consultas de cada paciente) se crean aquí mismo
+        Patient.objects.bulk_create(patients)
+        Consultation.objects.bulk_create(consultations, batch_size=1000)
+        PatientNameToken.objects.bulk_create([token for patient in patients for token in PatientNameToken.tokens_for(patient)], batch_size=1000)
+        PatientSummary.objects.bulk_create(summaries)
+        RollupChange.record((patient.id, None) for patient in patients)
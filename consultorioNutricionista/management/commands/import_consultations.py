@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from consultorioNutricionista.importer import DEFAULT_CHUNK_SIZE, IMPORT_FORMATS, guess_format, import_consultations
+
+
+class Command(BaseCommand):
+    help = 'Importa consultas históricas desde un archivo CSV o JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Archivo con columnas patient, peso, observaciones y fecha_consulta (opcional)')
+        parser.add_argument('--format', choices=IMPORT_FORMATS, help='Formato del archivo (por defecto según la extensión)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or guess_format(path)
+
+        def progress(report):
+            self.stdout.write(f"{report.rows_read} filas leídas, {report.rows_imported} importadas, "
+                              f"{report.error_count} con errores")
+
+        try:
+            with open(path, encoding='utf-8-sig', newline='') as stream:
+                report = import_consultations(stream, file_format, options['chunk_size'], progress)
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for line, messages in report.errors:
+            self.stderr.write(f"Fila {line}: {'; '.join(messages)}")
+        if report.error_count > len(report.errors):
+            self.stderr.write(f"... y {report.error_count - len(report.errors)} errores más")
+        self.stdout.write(self.style.SUCCESS(str(report)))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from consultorioNutricionista.foods import IMPORT_CHUNK_SIZE, import_foods
+from consultorioNutricionista.models import Food
+
+
+class Command(BaseCommand):
+    help = 'Importa o actualiza la tabla de composición de alimentos desde un CSV'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help=f"CSV con columnas codigo, nombre, grupo, {', '.join(Food.NUTRIENTS)} (por 100 g)")
+        parser.add_argument('--delimiter', default=',')
+        parser.add_argument('--encoding', default='utf-8-sig')
+        parser.add_argument('--chunk-size', type=int, default=IMPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], encoding=options['encoding'], newline='') as stream:
+                imported, errors = import_foods(stream, options['chunk_size'], options['delimiter'])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        for line, message in errors:
+            self.stderr.write(f"Fila {line}: {message}")
+        self.stdout.write(self.style.SUCCESS(f"{imported} alimentos importados, {len(errors)} filas con errores"))
@@ -0,0 +1,24 @@
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from consultorioNutricionista.archive import DEFAULT_CHUNK_SIZE, DEFAULT_ROWS_CHUNK_SIZE, purge_archive
+
+
+class Command(BaseCommand):
+    help = 'Borra definitivamente los pacientes archivados antes de una fecha, por bloques'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True, help='Fecha AAAA-MM-DD: se borran los archivados antes de ese día')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--rows-chunk-size', type=int, default=DEFAULT_ROWS_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            day = datetime.strptime(options['before'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('La fecha debe tener el formato AAAA-MM-DD')
+
+        deleted = purge_archive(timezone.make_aware(datetime.combine(day, time.min)), options['chunk_size'], options['rows_chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f"{deleted} pacientes archivados borrados"))
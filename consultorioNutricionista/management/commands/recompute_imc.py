@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from consultorioNutricionista.recompute import DEFAULT_CHUNK_SIZE, recompute_imc
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el IMC de las consultas a partir de la altura actual de los pacientes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patient', type=int, action='append', dest='patients', help='Solo este paciente (se puede repetir)')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        def progress(patients, rows, elapsed):
+            rate = rows / elapsed if elapsed else 0
+            self.stdout.write(f"{patients} pacientes, {rows} consultas actualizadas ({rate:.0f} filas/s)")
+
+        patients, rows, elapsed = recompute_imc(options['patients'], options['chunk_size'], progress)
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"IMC recalculado en {rows} consultas de {patients} pacientes en {elapsed:.2f} s ({rate:.0f} filas/s)"))
+        if rows:
+            self.stdout.write("Los días afectados quedaron registrados: 'refresh_rollups' actualizará los agregados de analítica.")
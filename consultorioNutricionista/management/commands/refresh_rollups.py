@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from consultorioNutricionista.analytics import DEFAULT_CHUNK_SIZE, rebuild_rollups, refresh_rollups
+
+
+class Command(BaseCommand):
+    help = 'Actualiza los agregados de analítica con las consultas nuevas o modificadas (o los recalcula todos con --full)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recalcula los agregados desde cero')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+
+        def progress(processed):
+            self.stdout.write(f"{processed} consultas procesadas")
+
+        if options['full']:
+            processed = rebuild_rollups(options['chunk_size'], progress)
+        else:
+            processed = refresh_rollups(options['chunk_size'], progress)
+
+        elapsed = time.perf_counter() - start
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(f"{processed} consultas agregadas en {elapsed:.2f} s ({rate:.0f} consultas/s)"))
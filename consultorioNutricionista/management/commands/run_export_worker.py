@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from consultorioNutricionista.exports import DEFAULT_CHUNK_SIZE, STALE_MINUTES, claim_next_job, requeue_stale_jobs, run_job
+from consultorioNutricionista.models import ExportJob
+
+
+# Trabajador de la cola de exportaciones. Se pueden correr varios a la vez (por ejemplo uno por núcleo); cada trabajo
+# lo toma un solo trabajador.
+# Fuera del ciclo de peticiones Django no revisa las conexiones, así que el trabajador llama a close_old_connections
+# antes de cada consulta a la cola y después de cada trabajo, como al inicio y al final de una petición: cierra las
+# conexiones que pasaron CONN_MAX_AGE o que quedaron inservibles (por ejemplo si MySQL cerró una conexión inactiva
+# por wait_timeout) y la siguiente consulta abre una nueva.
+
+class Command(BaseCommand):
+    help = 'Procesa los trabajos de exportación pendientes (XLSX, PDF o CSV)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Termina cuando ya no hay trabajos pendientes')
+        parser.add_argument('--poll-interval', type=float, default=5.0, help='Segundos de espera cuando la cola está vacía')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--stale-minutes', type=int, default=STALE_MINUTES,
+                            help='Regresa a la cola los trabajos en proceso desde hace más de estos minutos')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(options['stale_minutes'])
+        if requeued:
+            self.stdout.write(f"{requeued} trabajos detenidos regresaron a la cola")
+
+        while True:
+            close_old_connections()
+            job = claim_next_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+
+            start = time.perf_counter()
+            job = run_job(job, options['chunk_size'])
+            close_old_connections()
+            elapsed = time.perf_counter() - start
+            if job.estado == ExportJob.TERMINADO:
+                self.stdout.write(self.style.SUCCESS(f"{job}: {job.filas} filas en {elapsed:.2f} s"))
+            else:
+                self.stdout.write(self.style.ERROR(f"{job}: {job.error}"))
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.1 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_summaries(apps, schema_editor):
+    Patient = apps.get_model('consultorioNutricionista', 'Patient')
+    Consultation = apps.get_model('consultorioNutricionista', 'Consultation')
+    PatientSummary = apps.get_model('consultorioNutricionista', 'PatientSummary')
+
+    summaries = []
+    for patient_id in Patient.objects.values_list('id', flat=True).iterator():
+        consultations = Consultation.objects.filter(patient_id=patient_id)
+        latest_two = list(consultations.order_by('-fecha_consulta', '-id').values_list('imc', 'peso', 'fecha_consulta')[:2])
+        summary = PatientSummary(patient_id=patient_id, consultation_count=consultations.count())
+        if latest_two:
+            summary.latest_imc, summary.latest_peso, summary.last_visit = latest_two[0]
+        if len(latest_two) > 1:
+            summary.previous_imc = latest_two[1][0]
+        summaries.append(summary)
+    PatientSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorioNutricionista', '0010_merge_20230519_1043'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientSummary',
+            fields=[
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='summary', serialize=False, to='consultorioNutricionista.patient')),
+                ('latest_imc', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('previous_imc', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('latest_peso', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True)),
+                ('consultation_count', models.PositiveIntegerField(default=0)),
+                ('last_visit', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(build_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorioNutricionista', '0011_patientsummary'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='consultation',
+            name='fecha_consulta',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
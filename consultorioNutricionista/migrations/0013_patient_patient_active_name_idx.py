@@ -0,0 +1,17 @@
+# Generated by Django 4.2.1 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorioNutricionista', '0012_alter_consultation_fecha_consulta'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(fields=['is_active', 'apellido_paterno', 'apellido_materno', 'nombre', 'id'], name='patient_active_name_idx'),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.1 on 2026-10-18 11:20
+
+import unicodedata
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def normalize_name(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def build_tokens(apps, schema_editor):
+    Patient = apps.get_model('consultorioNutricionista', 'Patient')
+    PatientNameToken = apps.get_model('consultorioNutricionista', 'PatientNameToken')
+
+    tokens = []
+    for patient in Patient.objects.only('id', 'apellido_paterno', 'apellido_materno', 'nombre').iterator():
+        for campo, field in enumerate(('apellido_paterno', 'apellido_materno', 'nombre')):
+            for token in set(normalize_name(getattr(patient, field)).split()):
+                tokens.append(PatientNameToken(patient_id=patient.id, token=token, campo=campo))
+        if len(tokens) >= 1000:
+            PatientNameToken.objects.bulk_create(tokens)
+            tokens = []
+    PatientNameToken.objects.bulk_create(tokens)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorioNutricionista', '0013_patient_patient_active_name_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PatientNameToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=50)),
+                ('campo', models.PositiveSmallIntegerField(choices=[(0, 'Apellido paterno'), (1, 'Apellido materno'), (2, 'Nombre')])),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='name_tokens', to='consultorioNutricionista.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'patient'], name='patient_name_token_idx')],
+            },
+        ),
+        migrations.RunPython(build_tokens, migrations.RunPython.noop),
+    ]
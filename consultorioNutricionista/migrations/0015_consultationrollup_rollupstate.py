@@ -0,0 +1,39 @@
+# Generated by Django 4.2.1 on 2026-10-18 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorioNutricionista', '0014_patientnametoken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConsultationRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('periodo', models.CharField(choices=[('D', 'Diario'), ('M', 'Mensual')], max_length=1)),
+                ('fecha', models.DateField()),
+                ('sexo', models.CharField(choices=[('M', 'Masculino'), ('F', 'Femenino')], max_length=1)),
+                ('grupo_edad', models.CharField(max_length=5)),
+                ('categoria', models.CharField(max_length=10)),
+                ('consultas', models.PositiveIntegerField(default=0)),
+                ('imc_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('peso_cambio_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('peso_cambio_consultas', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupState',
+            fields=[
+                ('nombre', models.CharField(max_length=30, primary_key=True, serialize=False)),
+                ('ultimo_id', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='consultationrollup',
+            constraint=models.UniqueConstraint(fields=('periodo', 'fecha', 'sexo', 'grupo_edad', 'categoria'), name='consultation_rollup_key'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.1 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorioNutricionista', '0015_consultationrollup_rollupstate'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='consultation',
+            options={'get_latest_by': ['fecha_consulta', 'id']},
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['patient', '-fecha_consulta', '-id'], name='consultation_patient_date_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 4.2.1 on 2026-10-18 15:20
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorioNutricionista', '0017_exportjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedPatient',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('nombre', models.CharField(max_length=50)),
+                ('apellido_paterno', models.CharField(max_length=50)),
+                ('apellido_materno', models.CharField(max_length=50)),
+                ('fecha_nacimiento', models.DateField()),
+                ('sexo', models.CharField(choices=[('M', 'Masculino'), ('F', 'Femenino')], max_length=1)),
+                ('altura', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('peso', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('actividad_aerobica', models.BooleanField()),
+                ('is_active', models.BooleanField(default=False)),
+                ('archivado', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedConsultation',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('fecha_consulta', models.DateTimeField()),
+                ('peso', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('observaciones', models.TextField()),
+                ('imc', models.DecimalField(decimal_places=2, default=0.0, max_digits=5)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='consultations', to='consultorioNutricionista.archivedpatient')),
+            ],
+        ),
+    ]
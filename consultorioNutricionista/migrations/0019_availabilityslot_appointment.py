@@ -0,0 +1,47 @@
+# Generated by Django 4.2.1 on 2026-10-18 15:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('consultorioNutricionista', '0018_archivedpatient_archivedconsultation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailabilitySlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fin', models.DateTimeField()),
+                ('nutritionist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='availability_slots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['nutritionist', 'inicio'], name='availability_start_idx')],
+                'constraints': [models.CheckConstraint(check=models.Q(('fin__gt', models.F('inicio'))), name='availability_slot_positive')],
+            },
+        ),
+        migrations.CreateModel(
+            name='Appointment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('inicio', models.DateTimeField()),
+                ('fin', models.DateTimeField()),
+                ('estado', models.CharField(choices=[('programada', 'Programada'), ('atendida', 'Atendida'), ('cancelada', 'Cancelada')], default='programada', max_length=10)),
+                ('creado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('consultation', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='appointment', to='consultorioNutricionista.consultation')),
+                ('nutritionist', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointments', to=settings.AUTH_USER_MODEL)),
+                ('patient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='appointments', to='consultorioNutricionista.patient')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['nutritionist', 'inicio'], name='appointment_start_idx'), models.Index(fields=['patient', 'inicio'], name='appointment_patient_idx')],
+                'constraints': [models.CheckConstraint(check=models.Q(('fin__gt', models.F('inicio'))), name='appointment_positive')],
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 4.2.1 on 2026-10-18 16:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorioNutricionista', '0019_availabilityslot_appointment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Food',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(max_length=20, unique=True)),
+                ('nombre', models.CharField(max_length=200)),
+                ('nombre_normalizado', models.CharField(db_index=True, max_length=200)),
+                ('grupo', models.CharField(blank=True, max_length=100)),
+                ('energia_kcal', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('proteina', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('grasa', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('carbohidratos', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('fibra', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('azucar', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('sodio', models.DecimalField(decimal_places=2, default=0, help_text='mg', max_digits=8)),
+                ('calcio', models.DecimalField(decimal_places=2, default=0, help_text='mg', max_digits=8)),
+                ('hierro', models.DecimalField(decimal_places=2, default=0, help_text='mg', max_digits=8)),
+                ('vitamina_c', models.DecimalField(decimal_places=2, default=0, help_text='mg', max_digits=8)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MealPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nombre', models.CharField(default='Plan de alimentación', max_length=100)),
+                ('creado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('consultation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='meal_plans', to='consultorioNutricionista.consultation')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='MealPlanItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('comida', models.CharField(choices=[('desayuno', 'Desayuno'), ('colacion', 'Colación'), ('comida', 'Comida'), ('cena', 'Cena')], default='comida', max_length=10)),
+                ('gramos', models.DecimalField(decimal_places=2, max_digits=7)),
+                ('food', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='consultorioNutricionista.food')),
+                ('plan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='consultorioNutricionista.mealplan')),
+            ],
+        ),
+    ]
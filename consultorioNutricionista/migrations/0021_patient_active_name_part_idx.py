@@ -0,0 +1,17 @@
+# Generated by Django 4.2.1 on 2026-10-18 17:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorioNutricionista', '0020_food_mealplan_mealplanitem'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='patient',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['apellido_paterno', 'apellido_materno', 'nombre', 'id'], name='patient_active_name_part_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 4.2.1 on 2026-10-18 19:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('consultorioNutricionista', '0021_patient_active_name_part_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('patient_id', models.BigIntegerField()),
+                ('fecha', models.DateField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RemoveField(
+            model_name='rollupstate',
+            name='ultimo_id',
+        ),
+        migrations.AddIndex(
+            model_name='consultation',
+            index=models.Index(fields=['fecha_consulta'], name='consultation_date_idx'),
+        ),
+    ]
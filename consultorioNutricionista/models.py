@@ -1,10 +1,20 @@
-from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin, Permission, Group
-from django.db import models
-from django.db.models.signals import post_save
+import unicodedata
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin, Permission, Group, User
+from django.db import models, router, transaction
+from django.db.models import F, Window
+from django.db.models.functions import Lead, TruncDate
+from django.db.models.signals import post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from .nutrition import calculate_imc
+from .public_cache import bump_patient_version
+from .roles import bump_role_version
+
 
 # La clase Patient es un modelo que representa la información de un paciente en el sistema
 
@@ -19,41 +29,612 @@ class Patient(models.Model):
     actividad_aerobica = models.BooleanField()
     is_active = models.BooleanField(default=True)
 
+    class Meta:
+        indexes = [
+            # Coincide con el ordenamiento de la paginación por llave de la lista de pacientes activos
+            models.Index(fields=['is_active', 'apellido_paterno', 'apellido_materno', 'nombre', 'id'], name='patient_active_name_idx'),
+            # Mismo orden solo sobre los pacientes activos. SQLite compila is_active=True como "is_active" a secas y no
+            # usa el índice anterior para esa condición; este índice parcial sí. MySQL no tiene índices parciales y
+            # Django lo omite ahí (por eso se silencia models.W037 en settings), así que MySQL sigue usando el anterior.
+            models.Index(fields=['apellido_paterno', 'apellido_materno', 'nombre', 'id'], condition=models.Q(is_active=True),
+                         name='patient_active_name_part_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Se guardan la altura, el sexo y la fecha de nacimiento cargados para detectar cambios al guardar (ver
+        # recompute_imc_on_height_change y log_patient_rollup_change)
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_altura = instance.__dict__.get('altura')
+        instance._loaded_cohort = (instance.__dict__.get('sexo'), instance.__dict__.get('fecha_nacimiento'))
+        return instance
+
+    # Historial de consultas de la más reciente a la más antigua. El orden coincide con consultation_patient_date_idx,
+    # así que se lee del índice sin ordenar; imc_anterior es el IMC de la consulta previa (la siguiente fila).
+    def consultation_history(self):
+        order = [F('fecha_consulta').desc(), F('id').desc()]
+        return (
+            Consultation.objects.filter(patient_id=self.pk)
+            .only('id', 'patient_id', 'fecha_consulta', 'peso', 'imc')
+            .annotate(imc_anterior=Window(Lead('imc'), order_by=order))
+            .order_by(*order)
+        )
+
+    def latest_consultations(self, n):
+        return Consultation.objects.filter(patient_id=self.pk).only('id', 'patient_id', 'fecha_consulta', 'peso', 'imc').order_by('-fecha_consulta', '-id')[:n]
+
+    def latest_imc(self):
+        return Consultation.objects.filter(patient_id=self.pk).order_by('-fecha_consulta', '-id').values_list('imc', flat=True).first()
+
+    def previous_imc(self):
+        return self.consultation_history().values_list('imc_anterior', flat=True).first()
+
     def __str__(self):
         return ' Paciente: ' + self.nombre + ' Apellido paterno: ' + self.apellido_paterno + ' Apellido materno: ' + self.apellido_materno + ' Fecha nacimiento: ' + str(self.fecha_nacimiento) + ' Sexo: ' + self.sexo + ' Altura: ' + str(self.altura) + ' Peso: ' + str(self.peso) + ' Actividad aeróbica: ' + str(self.actividad_aerobica)
 
+# Los borrados de consultas (de una instancia o de un queryset) programan el recálculo del resumen y la invalidación
+# de la caché del paciente. Se hace aquí y no con post_delete: con un receptor de post_delete, la cascada del paciente
+# (donde el resumen desaparece de todos modos) carga cada consulta completa para emitir la señal fila por fila; sin él
+# solo lee los ids.
+class ConsultationQuerySet(models.QuerySet):
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            deleted_rows = set(self.values_list('patient_id', 'fecha_consulta'))
+            deleted = super().delete()
+            RollupChange.record(deleted_rows, self.db)
+        consultations_deleted({patient_id for patient_id, _ in deleted_rows}, self.db)
+        return deleted
+
+
 class Consultation(models.Model):
     patient = models.ForeignKey(Patient, on_delete=models.CASCADE)
-    fecha_consulta = models.DateTimeField(auto_now_add=True)
+    fecha_consulta = models.DateTimeField(default=timezone.now)
     peso = models.DecimalField(max_digits=5, decimal_places=2)
     observaciones = models.TextField()
     imc = models.DecimalField(max_digits=5, decimal_places=2, default=0.0)
 
+    objects = ConsultationQuerySet.as_manager()
+
     class Meta:
-        get_latest_by = 'fecha_consulta'
+        get_latest_by = ['fecha_consulta', 'id']
+        indexes = [
+            # Sirve las búsquedas de la última consulta y el historial de un paciente sin ordenar en memoria
+            models.Index(fields=['patient', '-fecha_consulta', '-id'], name='consultation_patient_date_idx'),
+            # Sirve la lectura de las consultas de un día al recalcular los agregados de analítica
+            models.Index(fields=['fecha_consulta'], name='consultation_date_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        # El IMC se calcula antes del INSERT para que cada consulta se escriba una sola vez
+        if self._state.adding and not self.imc:
+            imc = calculate_imc(self.peso, self.patient.altura)
+            if imc is not None:
+                self.imc = imc
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # La fecha cargada permite recalcular también el día de origen de una consulta que se movió de fecha
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_fecha = instance.__dict__.get('fecha_consulta')
+        return instance
+
+    def delete(self, using=None, keep_parents=False):
+        using = using or router.db_for_write(Consultation, instance=self)
+        with transaction.atomic(using=using):
+            deleted = super().delete(using=using, keep_parents=keep_parents)
+            RollupChange.record([(self.patient_id, self.fecha_consulta)], using)
+        consultations_deleted([self.patient_id], using)
+        return deleted
 
     def __str__(self):
         return f"Consulta del paciente: {self.patient}, Fecha: {self.fecha_consulta}"
 
-def latest_imc(self):
-    latest_consultation = Consultation.objects.filter(patient=self.patient).order_by('-fecha_consulta').first()
-    if latest_consultation and latest_consultation.imc:
-        return latest_consultation.imc
-    return None
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Normaliza un texto para búsqueda: sin acentos y en minúsculas ("Ávila Peña" -> "avila pena").
+
+def normalize_name(text):
+    decomposed = unicodedata.normalize('NFKD', text or '')
+    return ''.join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+# La clase PatientNameToken es una tabla auxiliar con cada palabra normalizada del nombre y apellidos del paciente.
+# El índice sobre token permite búsquedas por prefijo ("gonz" -> "gonzalez") sin recorrer la tabla de pacientes.
+
+class PatientNameToken(models.Model):
+    APELLIDO_PATERNO = 0
+    APELLIDO_MATERNO = 1
+    NOMBRE = 2
+    CAMPOS = (
+        ('apellido_paterno', APELLIDO_PATERNO),
+        ('apellido_materno', APELLIDO_MATERNO),
+        ('nombre', NOMBRE),
+    )
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='name_tokens')
+    token = models.CharField(max_length=50)
+    campo = models.PositiveSmallIntegerField(choices=[(APELLIDO_PATERNO, 'Apellido paterno'), (APELLIDO_MATERNO, 'Apellido materno'), (NOMBRE, 'Nombre')])
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'patient'], name='patient_name_token_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.token} ({self.patient_id})"
+
+    @classmethod
+    def tokens_for(cls, patient):
+        return [
+            cls(patient_id=patient.pk, token=token, campo=campo)
+            for field, campo in cls.CAMPOS
+            for token in set(normalize_name(getattr(patient, field)).split())
+        ]
+
+    @classmethod
+    def rebuild(cls, patient):
+        cls.objects.filter(patient_id=patient.pk).delete()
+        cls.objects.bulk_create(cls.tokens_for(patient))
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# La clase PatientSummary guarda un resumen desnormalizado de las consultas de cada paciente (IMC actual, IMC anterior,
+# último peso, número de consultas y fecha de la última visita) para que el detalle del paciente lea una sola fila.
+# Una consulta nueva se aplica de forma incremental; ediciones, borrados y consultas retroactivas lo recalculan al
+# confirmar la transacción, una sola vez por paciente (ver schedule_summary_refresh).
+
+class PatientSummary(models.Model):
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    latest_imc = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    previous_imc = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    latest_peso = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
+    consultation_count = models.PositiveIntegerField(default=0)
+    last_visit = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Resumen del paciente {self.patient_id}: {self.consultation_count} consultas"
+
+    @staticmethod
+    def compute(patient_id):
+        # Calcula el resumen desde cero con dos consultas acotadas: un COUNT y las dos últimas consultas.
+        latest_two = list(
+            Consultation.objects.filter(patient_id=patient_id)
+            .order_by('-fecha_consulta', '-id')
+            .values_list('imc', 'peso', 'fecha_consulta')[:2]
+        )
+        values = {
+            'consultation_count': Consultation.objects.filter(patient_id=patient_id).count(),
+            'latest_imc': None,
+            'previous_imc': None,
+            'latest_peso': None,
+            'last_visit': None,
+        }
+        if latest_two:
+            values['latest_imc'], values['latest_peso'], values['last_visit'] = latest_two[0]
+        if len(latest_two) > 1:
+            values['previous_imc'] = latest_two[1][0]
+        return values
+
+    @classmethod
+    def rebuild(cls, patient_id):
+        summary, _ = cls.objects.update_or_create(patient_id=patient_id, defaults=cls.compute(patient_id))
+        return summary
+
+    @classmethod
+    def rebuild_many(cls, patient_ids):
+        for patient_id in set(patient_ids):
+            cls.rebuild(patient_id)
+
+    # Como rebuild_many, pero omite los pacientes que ya no existen (borrados después en la misma transacción)
+    @classmethod
+    def refresh_many(cls, patient_ids):
+        cls.rebuild_many(Patient.objects.filter(id__in=set(patient_ids)).values_list('id', flat=True))
 
-def previous_imc(self):
-    latest_consultation = Consultation.objects.filter(patient=self.patient).order_by('-fecha_consulta').first()
-    previous_consultation = Consultation.objects.filter(patient=self.patient, fecha_consulta__lt=latest_consultation.fecha_consulta).order_by('-fecha_consulta').first()
-    if previous_consultation and previous_consultation.imc:
-        return previous_consultation.imc
-    return None
+    @classmethod
+    def for_patient(cls, patient):
+        try:
+            return cls.objects.get(patient=patient)
+        except cls.DoesNotExist:
+            return cls.rebuild(patient.pk)
 
 #----------------------------------------------------------------------------------------------------------------------#
+
+# Las clases ConsultationRollup y RollupState guardan agregados diarios y mensuales de las consultas por sexo, grupo de
+# edad y categoría de IMC de la OMS. El tablero de analítica lee solo estas tablas; la fila de RollupState sirve de
+# candado para que solo una actualización de los agregados corra a la vez.
+
+class ConsultationRollup(models.Model):
+    DIARIO = 'D'
+    MENSUAL = 'M'
+
+    periodo = models.CharField(max_length=1, choices=[(DIARIO, 'Diario'), (MENSUAL, 'Mensual')])
+    fecha = models.DateField()
+    sexo = models.CharField(max_length=1, choices=[('M', 'Masculino'), ('F', 'Femenino')])
+    grupo_edad = models.CharField(max_length=5)
+    categoria = models.CharField(max_length=10)
+    consultas = models.PositiveIntegerField(default=0)
+    imc_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    peso_cambio_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    peso_cambio_consultas = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['periodo', 'fecha', 'sexo', 'grupo_edad', 'categoria'], name='consultation_rollup_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_periodo_display()} {self.fecha} {self.sexo} {self.grupo_edad} {self.categoria}: {self.consultas}"
+
+
+class RollupState(models.Model):
+    nombre = models.CharField(max_length=30, primary_key=True)
+
+    def __str__(self):
+        return self.nombre
+
+
+# Registro de cambios pendientes de agregar: cada escritura de consultas inserta, en su misma transacción, el paciente
+# y el día (local) afectados, o solo el paciente cuando cambian todas sus consultas (su sexo, su fecha de nacimiento
+# o el IMC recalculado). refresh_rollups recalcula esos días y borra exactamente las filas que leyó, así que un cambio
+# que se confirma tarde (con un id menor que otros ya procesados) se agrega en la siguiente corrida.
+# Las escrituras que no pasan por save() ni delete() (bulk_create, bulk_update, borrados por conjuntos) registran sus
+# cambios con record o record_patients.
+class RollupChange(models.Model):
+    patient_id = models.BigIntegerField()
+    fecha = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Paciente {self.patient_id}: {self.fecha or 'todas las consultas'}"
+
+    # changes son pares (paciente, fecha de la consulta); una fecha None marca todas las consultas del paciente
+    @classmethod
+    def record(cls, changes, using=None):
+        days = {(patient_id, timezone.localtime(fecha).date() if fecha is not None else None) for patient_id, fecha in changes}
+        cls.objects.using(using).bulk_create([cls(patient_id=patient_id, fecha=day) for patient_id, day in days], batch_size=1000)
+
+    # Registra los días de todas las consultas de los pacientes, antes de que se borren o después de copiarlas
+    @classmethod
+    def record_patients(cls, patient_ids, using=None):
+        days = (Consultation.objects.using(using).filter(patient_id__in=list(patient_ids))
+                .values_list('patient_id', TruncDate('fecha_consulta')).distinct())
+        cls.objects.using(using).bulk_create([cls(patient_id=patient_id, fecha=day) for patient_id, day in days], batch_size=1000)
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# La clase ExportJob es la cola de exportaciones en XLSX, PDF o CSV de las consultas de un paciente o de todo el
+# consultorio (opcionalmente en un rango de fechas). La vista solo crea el trabajo; el comando run_export_worker lo
+# toma con SELECT ... FOR UPDATE SKIP LOCKED, genera el archivo en MEDIA_ROOT y registra el estado.
+
+class ExportJob(models.Model):
+    CSV = 'csv'
+    XLSX = 'xlsx'
+    PDF = 'pdf'
+    FORMATOS = [(CSV, 'CSV'), (XLSX, 'Excel (XLSX)'), (PDF, 'PDF')]
+
+    PENDIENTE = 'pendiente'
+    EN_PROCESO = 'en_proceso'
+    TERMINADO = 'terminado'
+    ERROR = 'error'
+    ESTADOS = [(PENDIENTE, 'Pendiente'), (EN_PROCESO, 'En proceso'), (TERMINADO, 'Terminado'), (ERROR, 'Error')]
+
+    formato = models.CharField(max_length=4, choices=FORMATOS)
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, null=True, blank=True, related_name='export_jobs')
+    desde = models.DateField(null=True, blank=True)
+    hasta = models.DateField(null=True, blank=True)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=PENDIENTE)
+    archivo = models.FileField(upload_to='exports/', blank=True)
+    filas = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    solicitado_por = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='export_jobs')
+    creado = models.DateTimeField(default=timezone.now)
+    iniciado = models.DateTimeField(null=True, blank=True)
+    terminado = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['estado', 'id'], name='export_job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Exportación {self.id} ({self.formato}, {self.estado})"
+
+    @property
+    def finished(self):
+        return self.estado in (self.TERMINADO, self.ERROR)
+
+    def filename(self):
+        alcance = f"paciente_{self.patient_id}" if self.patient_id else 'consultorio'
+        return f"consultas_{alcance}_{self.id}.{self.formato}"
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Las clases ArchivedPatient y ArchivedConsultation son el almacén frío de los pacientes inactivos: mismas columnas y
+# mismos ids que Patient y Consultation, fuera de las tablas que recorren las listas y búsquedas. archive.py mueve los
+# pacientes por bloques y los regresa a las tablas principales cuando se consulta su detalle.
+
+class ArchivedPatient(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    nombre = models.CharField(max_length=50)
+    apellido_paterno = models.CharField(max_length=50)
+    apellido_materno = models.CharField(max_length=50)
+    fecha_nacimiento = models.DateField()
+    sexo = models.CharField(max_length=1, choices=[('M', 'Masculino'), ('F', 'Femenino')])
+    altura = models.DecimalField(max_digits=5, decimal_places=2)
+    peso = models.DecimalField(max_digits=5, decimal_places=2)
+    actividad_aerobica = models.BooleanField()
+    is_active = models.BooleanField(default=False)
+    archivado = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f"Paciente archivado {self.id}: {self.nombre} {self.apellido_paterno} {self.apellido_materno}"
+
+
+class ArchivedConsultation(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    patient = models.ForeignKey(ArchivedPatient, on_delete=models.CASCADE, related_name='consultations')
+    fecha_consulta = models.DateTimeField()
+    peso = models.DecimalField(max_digits=5, decimal_places=2)
+    observaciones = models.TextField()
+    imc = models.DecimalField(max_digits=5, decimal_places=2, default=0.0)
+
+    def __str__(self):
+        return f"Consulta archivada {self.id} del paciente {self.patient_id}"
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Agenda de citas. AvailabilitySlot son los bloques de horario en que atiende cada nutricionista (se generan por lote
+# para una semana tipo con generate_availability) y Appointment las citas reservadas dentro de esos bloques. Ambas
+# tablas se leen siempre por nutricionista y rango de fechas, con los índices (nutricionista, inicio); scheduling.py
+# arma con ellas los horarios libres y revisa los empalmes.
+
+class AvailabilitySlot(models.Model):
+    nutritionist = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='availability_slots')
+    inicio = models.DateTimeField()
+    fin = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['nutritionist', 'inicio'], name='availability_start_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(fin__gt=models.F('inicio')), name='availability_slot_positive'),
+        ]
+
+    def __str__(self):
+        return f"Horario de {self.nutritionist_id}: {self.inicio} - {self.fin}"
+
+
+class Appointment(models.Model):
+    PROGRAMADA = 'programada'
+    ATENDIDA = 'atendida'
+    CANCELADA = 'cancelada'
+    ESTADOS = [(PROGRAMADA, 'Programada'), (ATENDIDA, 'Atendida'), (CANCELADA, 'Cancelada')]
+
+    patient = models.ForeignKey(Patient, on_delete=models.CASCADE, related_name='appointments')
+    nutritionist = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='appointments')
+    inicio = models.DateTimeField()
+    fin = models.DateTimeField()
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=PROGRAMADA)
+    consultation = models.OneToOneField(Consultation, on_delete=models.SET_NULL, null=True, blank=True, related_name='appointment')
+    creado = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['nutritionist', 'inicio'], name='appointment_start_idx'),
+            models.Index(fields=['patient', 'inicio'], name='appointment_patient_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(check=models.Q(fin__gt=models.F('inicio')), name='appointment_positive'),
+        ]
+
+    def __str__(self):
+        return f"Cita {self.id} del paciente {self.patient_id} ({self.inicio}, {self.estado})"
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# La clase Food es la tabla de composición de alimentos (valores por 100 g), que se carga por lote con import_foods
+# desde el CSV de una base de datos de alimentos. MealPlan y MealPlanItem son el plan de alimentación que se entrega
+# en una consulta. Los totales de nutrientes de un plan se calculan con el índice en memoria de foods.py.
+
+class Food(models.Model):
+    NUTRIENTS = ('energia_kcal', 'proteina', 'grasa', 'carbohidratos', 'fibra', 'azucar', 'sodio', 'calcio', 'hierro', 'vitamina_c')
+
+    codigo = models.CharField(max_length=20, unique=True)
+    nombre = models.CharField(max_length=200)
+    nombre_normalizado = models.CharField(max_length=200, db_index=True)
+    grupo = models.CharField(max_length=100, blank=True)
+    energia_kcal = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    proteina = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    grasa = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    carbohidratos = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    fibra = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    azucar = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    sodio = models.DecimalField(max_digits=8, decimal_places=2, default=0, help_text='mg')
+    calcio = models.DecimalField(max_digits=8, decimal_places=2, default=0, help_text='mg')
+    hierro = models.DecimalField(max_digits=8, decimal_places=2, default=0, help_text='mg')
+    vitamina_c = models.DecimalField(max_digits=8, decimal_places=2, default=0, help_text='mg')
+
+    def save(self, *args, **kwargs):
+        self.nombre_normalizado = normalize_name(self.nombre)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.codigo} {self.nombre}"
+
+
+class MealPlan(models.Model):
+    consultation = models.ForeignKey(Consultation, on_delete=models.CASCADE, related_name='meal_plans')
+    nombre = models.CharField(max_length=100, default='Plan de alimentación')
+    creado = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.nombre} (consulta {self.consultation_id})"
+
+
+class MealPlanItem(models.Model):
+    DESAYUNO = 'desayuno'
+    COLACION = 'colacion'
+    COMIDA = 'comida'
+    CENA = 'cena'
+    COMIDAS = [(DESAYUNO, 'Desayuno'), (COLACION, 'Colación'), (COMIDA, 'Comida'), (CENA, 'Cena')]
+
+    plan = models.ForeignKey(MealPlan, on_delete=models.CASCADE, related_name='items')
+    food = models.ForeignKey(Food, on_delete=models.PROTECT, related_name='+')
+    comida = models.CharField(max_length=10, choices=COMIDAS, default=COMIDA)
+    gramos = models.DecimalField(max_digits=7, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.gramos} g de {self.food_id} ({self.comida})"
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Mantiene los tokens de búsqueda del nombre cada vez que se guarda un paciente.
+@receiver(post_save, sender=Patient)
+def update_patient_name_tokens(sender, instance, **kwargs):
+    PatientNameToken.rebuild(instance)
+
+
+# Si cambió la altura de un paciente existente, se recalcula el IMC de todas sus consultas.
+@receiver(post_save, sender=Patient)
+def recompute_imc_on_height_change(sender, instance, created, **kwargs):
+    loaded_altura = getattr(instance, '_loaded_altura', None)
+    if created or loaded_altura is None or loaded_altura == instance.altura:
+        return
+    from .recompute import recompute_imc
+    recompute_imc([instance.pk])
+    instance._loaded_altura = instance.altura
+
+
+# Resúmenes por recalcular al confirmar la transacción, uno por conexión. El callback se registra una sola vez y junta
+# los pacientes de toda la transacción; si se revierte la transacción (o el savepoint donde se registró), Django
+# descarta el callback y la siguiente llamada registra uno nuevo.
+class PendingSummaries:
+    def __init__(self):
+        self.patient_ids = set()
+
+    def __call__(self):
+        PatientSummary.refresh_many(self.patient_ids)
+
+
+def schedule_summary_refresh(patient_ids, using=None):
+    connection = transaction.get_connection(using)
+    if not connection.in_atomic_block:
+        PatientSummary.refresh_many(patient_ids)
+        return
+    pending = getattr(connection, 'pending_summaries', None)
+    if pending is None or not any(callback[1] is pending for callback in connection.run_on_commit):
+        pending = connection.pending_summaries = PendingSummaries()
+        transaction.on_commit(pending, using=using)
+    pending.patient_ids.update(patient_ids)
+
+
+def consultations_deleted(patient_ids, using=None):
+    schedule_summary_refresh(patient_ids, using)
+    for patient_id in patient_ids:
+        transaction.on_commit(partial(bump_patient_version, patient_id), using=using)
+
+
+# Mantiene PatientSummary al guardar una consulta. Una consulta nueva y posterior a la última visita se aplica con un
+# solo UPDATE; si el resumen no existe, la consulta es retroactiva o se editó una existente (su peso, su IMC o su
+# fecha), el resumen se recalcula al confirmar la transacción.
 @receiver(post_save, sender=Consultation)
-def calculate_imc(sender, instance, created, **kwargs):
+def update_patient_summary(sender, instance, created, using, **kwargs):
     if created:
-        height = instance.patient.altura
-        if height:
-            imc = instance.peso / (height * height)
-            instance.imc = round(imc, 2)
-            instance.save()
+        updated = PatientSummary.objects.filter(patient_id=instance.patient_id, last_visit__lte=instance.fecha_consulta).update(
+            previous_imc=F('latest_imc'),
+            latest_imc=instance.imc,
+            latest_peso=instance.peso,
+            last_visit=instance.fecha_consulta,
+            consultation_count=F('consultation_count') + 1,
+        )
+        if updated:
+            return
+    schedule_summary_refresh([instance.patient_id], using)
+
+
+# Registra los días que deben recalcularse en los agregados de analítica, en la misma transacción que la consulta: el
+# día de la consulta y, si se movió de fecha, también el día anterior.
+@receiver(post_save, sender=Consultation)
+def log_consultation_rollup_change(sender, instance, created, using, **kwargs):
+    changes = [(instance.patient_id, instance.fecha_consulta)]
+    loaded_fecha = getattr(instance, '_loaded_fecha', None)
+    if not created and loaded_fecha is not None and loaded_fecha != instance.fecha_consulta:
+        changes.append((instance.patient_id, loaded_fecha))
+    RollupChange.record(changes, using)
+    instance._loaded_fecha = instance.fecha_consulta
+
+
+# El sexo y la fecha de nacimiento definen el grupo de cada consulta en los agregados: si cambian, se recalculan
+# todas las consultas del paciente.
+@receiver(post_save, sender=Patient)
+def log_patient_rollup_change(sender, instance, created, using, **kwargs):
+    loaded_cohort = getattr(instance, '_loaded_cohort', None)
+    cohort = (instance.sexo, instance.fecha_nacimiento)
+    if not created and loaded_cohort is not None and loaded_cohort != cohort:
+        RollupChange.record([(instance.pk, None)], using)
+    instance._loaded_cohort = cohort
+
+
+# En el borrado de un paciente con delete() sus consultas se borran en cascada sin señales: los días se registran antes,
+# dentro de la transacción del borrado.
+@receiver(pre_delete, sender=Patient)
+def log_deleted_patient_rollup_change(sender, instance, using, **kwargs):
+    RollupChange.record_patients([instance.pk], using)
+
+
+# Invalida los fragmentos públicos cacheados del paciente cuando cambian sus datos o sus consultas.
+# Las versiones (de paciente, de roles y de alimentos) se incrementan con on_commit: si se incrementaran dentro de la
+# transacción, otra petición podría leer los datos anteriores, guardarlos en caché con la versión nueva y dejarlos ahí
+# aunque la transacción se confirme. Fuera de una transacción on_commit ejecuta la función de inmediato.
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def invalidate_patient_pages(sender, instance, **kwargs):
+    transaction.on_commit(partial(bump_patient_version, instance.pk))
+
+
+@receiver(post_save, sender=Consultation)
+def invalidate_consultation_pages(sender, instance, **kwargs):
+    transaction.on_commit(partial(bump_patient_version, instance.patient_id))
+
+
+# Invalida los roles guardados en la sesión cuando se edita o borra el usuario (AssistantForm, NutritionistForm,
+# cambio de contraseña, admin) o cambian sus grupos o permisos.
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_roles(sender, instance, **kwargs):
+    transaction.on_commit(partial(bump_role_version, instance.pk))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def invalidate_user_roles_relations(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        transaction.on_commit(partial(bump_role_version, instance.pk))
+    elif action == 'post_clear':
+        # Desde el grupo o el permiso no se sabe qué usuarios tenía; se invalidan todos los del personal
+        for user_id in User.objects.filter(is_staff=True).values_list('id', flat=True):
+            transaction.on_commit(partial(bump_role_version, user_id))
+    else:
+        for user_id in pk_set:
+            transaction.on_commit(partial(bump_role_version, user_id))
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_roles(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    groups = [instance.pk] if not reverse else pk_set
+    users = User.objects.filter(groups__in=groups) if groups else User.objects.filter(is_staff=True)
+    for user_id in users.values_list('id', flat=True).distinct():
+        transaction.on_commit(partial(bump_role_version, user_id))
+
+
+# Los procesos vuelven a construir su índice de alimentos (foods.py) cuando cambia la tabla.
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+def invalidate_food_index(sender, instance, **kwargs):
+    from .foods import bump_food_version
+    transaction.on_commit(bump_food_version)
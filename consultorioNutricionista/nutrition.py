@@ -0,0 +1,170 @@
+from datetime import date
+from decimal import Decimal, ROUND_HALF_EVEN
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: sin él los lotes se calculan elemento por elemento
+    np = None
+
+
+# Cálculos nutricionales del consultorio: IMC, gasto energético basal (BMR), gasto energético total (TDEE) y rango de
+# peso saludable.
+# Los valores se manejan en centésimas enteras para que el redondeo coincida exactamente con las columnas
+# DecimalField(decimal_places=2) del modelo (redondeo mitad al par, igual que round() sobre Decimal). Cada fórmula
+# se escribe una sola vez sobre enteros y sirve tanto para valores sueltos como para arreglos de NumPy, así que la
+# API escalar (Decimal) y la API por lotes (arreglos de centésimas) dan exactamente el mismo resultado.
+
+MIFFLIN_ST_JEOR = 'mifflin'
+HARRIS_BENEDICT = 'harris_benedict'
+FORMULAS = (MIFFLIN_ST_JEOR, HARRIS_BENEDICT)
+
+# Factores de actividad (x100) para el TDEE: sedentario o con actividad aeróbica moderada
+ACTIVITY_FACTORS = {False: 120, True: 155}
+
+# Rango de IMC saludable de la OMS (x100) para el peso ideal
+IDEAL_IMC_CENTS = (1850, 2490)
+
+
+def to_cents(value):
+    return int((Decimal(value) * 100).to_integral_value(rounding=ROUND_HALF_EVEN))
+
+
+def from_cents(cents):
+    return Decimal(int(cents)).scaleb(-2)
+
+
+def divide_half_even(numerator, denominator):
+    quotient, remainder = divmod(numerator, denominator)
+    if 2 * remainder > denominator or (2 * remainder == denominator and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def divide_half_even_array(numerator, denominator):
+    quotient, remainder = np.divmod(numerator, denominator)
+    round_up = (2 * remainder > denominator) | ((2 * remainder == denominator) & (quotient % 2 == 1))
+    return quotient + round_up
+
+
+def cents_array(values):
+    # Convierte una secuencia de Decimal o float con dos decimales a un arreglo de centésimas
+    return np.rint(np.asarray(values, dtype=np.float64) * 100).astype(np.int64)
+
+
+def age_on(fecha_nacimiento, day=None):
+    day = day or date.today()
+    return day.year - fecha_nacimiento.year - ((day.month, day.day) < (fecha_nacimiento.month, fecha_nacimiento.day))
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Fórmulas en centésimas. peso en centésimas de kg, altura en centésimas de metro (es decir, centímetros), edad en
+# años y mujer como 0/1. Funcionan igual con int de Python o con arreglos de NumPy.
+
+def mifflin_st_jeor_cents(peso, altura, edad, mujer):
+    # 10·peso + 6.25·altura(cm) − 5·edad + 5 (hombres) o − 161 (mujeres)
+    return 10 * peso + 625 * altura - 500 * edad + 500 - 16600 * mujer
+
+
+def harris_benedict_scaled(peso, altura, edad, mujer):
+    # Revisión de Roza y Shizgal; resultado en cienmilésimas de kcal para mantener todo entero
+    hombre = 1 - mujer
+    return (hombre * (8836200 + 13397 * peso + 479900 * altura - 567700 * edad)
+            + mujer * (44759300 + 9247 * peso + 309800 * altura - 433000 * edad))
+
+
+# Calcula el IMC (peso en kg / altura en metros al cuadrado) redondeado a dos decimales.
+# Regresa None si la altura no es válida.
+
+def calculate_imc(peso, altura):
+    altura_cents = to_cents(altura)
+    if altura_cents <= 0:
+        return None
+    return from_cents(divide_half_even(to_cents(peso) * 10000, altura_cents * altura_cents))
+
+
+def calculate_bmr(peso, altura, edad, sexo, formula=MIFFLIN_ST_JEOR):
+    mujer = int(sexo == 'F')
+    if formula == MIFFLIN_ST_JEOR:
+        return from_cents(mifflin_st_jeor_cents(to_cents(peso), to_cents(altura), edad, mujer))
+    if formula == HARRIS_BENEDICT:
+        return from_cents(divide_half_even(harris_benedict_scaled(to_cents(peso), to_cents(altura), edad, mujer), 1000))
+    raise ValueError(f"Fórmula desconocida: {formula}")
+
+
+# El TDEE se calcula sobre el BMR ya redondeado a dos decimales.
+
+def calculate_tdee(bmr, actividad_aerobica):
+    return from_cents(divide_half_even(to_cents(bmr) * ACTIVITY_FACTORS[bool(actividad_aerobica)], 100))
+
+
+def ideal_weight_range(altura):
+    altura_cents = to_cents(altura)
+    return tuple(from_cents(divide_half_even(imc * altura_cents * altura_cents, 10000)) for imc in IDEAL_IMC_CENTS)
+
+
+def patient_profile(patient, day=None):
+    edad = age_on(patient.fecha_nacimiento, day)
+    bmr = calculate_bmr(patient.peso, patient.altura, edad, patient.sexo)
+    return {
+        'edad': edad,
+        'imc': calculate_imc(patient.peso, patient.altura),
+        'bmr': bmr,
+        'bmr_harris_benedict': calculate_bmr(patient.peso, patient.altura, edad, patient.sexo, HARRIS_BENEDICT),
+        'tdee': calculate_tdee(bmr, patient.actividad_aerobica),
+        'peso_ideal': ideal_weight_range(patient.altura),
+    }
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# API por lotes sobre arreglos de NumPy. Todas reciben y regresan centésimas enteras (int64); cents_array convierte
+# columnas Decimal y from_cents convierte un valor de regreso. El IMC inválido (altura <= 0) se marca con -1.
+
+def imc_cents_batch(peso_cents, altura_cents):
+    valid = altura_cents > 0
+    denominator = np.where(valid, altura_cents * altura_cents, 1)
+    return np.where(valid, divide_half_even_array(peso_cents * 10000, denominator), -1)
+
+
+def bmr_cents_batch(peso_cents, altura_cents, edades, mujeres, formula=MIFFLIN_ST_JEOR):
+    edades = np.asarray(edades, dtype=np.int64)
+    mujeres = np.asarray(mujeres, dtype=np.int64)
+    if formula == MIFFLIN_ST_JEOR:
+        return mifflin_st_jeor_cents(peso_cents, altura_cents, edades, mujeres)
+    if formula == HARRIS_BENEDICT:
+        return divide_half_even_array(harris_benedict_scaled(peso_cents, altura_cents, edades, mujeres), 1000)
+    raise ValueError(f"Fórmula desconocida: {formula}")
+
+
+def tdee_cents_batch(bmr_cents, actividad_aerobica):
+    factors = np.where(np.asarray(actividad_aerobica, dtype=bool), ACTIVITY_FACTORS[True], ACTIVITY_FACTORS[False])
+    return divide_half_even_array(bmr_cents * factors, 100)
+
+
+def ideal_weight_cents_batch(altura_cents):
+    squared = altura_cents * altura_cents
+    return tuple(divide_half_even_array(imc * squared, 10000) for imc in IDEAL_IMC_CENTS)
+
+
+# Versión por lotes de calculate_imc para listas de Decimal: regresa una lista de Decimal (None donde la altura no es
+# válida). Con NumPy la división y el redondeo se hacen vectorizados sobre enteros.
+
+def calculate_imc_batch(pesos, alturas):
+    if np is None:
+        return [calculate_imc(peso, altura) for peso, altura in zip(pesos, alturas)]
+    imc_cents = imc_cents_batch(cents_array(pesos), cents_array(alturas))
+    return [from_cents(cents) if cents >= 0 else None for cents in imc_cents.tolist()]
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Clasificación de la OMS según el IMC. Los límites están en centésimas para clasificar igual que las columnas IMC.
+
+WHO_CATEGORIES = ('bajo_peso', 'normal', 'sobrepeso', 'obesidad')
+WHO_LIMITS_CENTS = (1850, 2500, 3000)
+
+
+def who_category(imc):
+    cents = to_cents(imc)
+    return WHO_CATEGORIES[sum(cents >= limit for limit in WHO_LIMITS_CENTS)]
@@ -0,0 +1,122 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Q
+
+
+# Paginación por llave (keyset): en lugar de OFFSET, cada página continúa a partir de la última fila de la anterior.
+# El cursor es opaco para el cliente (JSON en base64) y contiene la dirección y los valores de la fila de referencia.
+# Con un índice que coincide con el ordenamiento, cualquier página cuesta lo mismo que la primera.
+
+PATIENT_KEYSET_FIELDS = ('apellido_paterno', 'apellido_materno', 'nombre', 'id')
+
+
+def encode_cursor(direction, values):
+    payload = json.dumps([direction, list(values)], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+# El cursor llega del cliente: cada valor se valida contra el tipo de su campo antes de llegar al ORM, para que un
+# cursor alterado (con listas, objetos o texto donde va un id) sea un ValueError y no un error de la consulta.
+
+def decode_cursor(cursor, fields, model):
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(payload)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError('Cursor inválido')
+    if direction not in ('next', 'previous') or not isinstance(values, list) or len(values) != len(fields):
+        raise ValueError('Cursor inválido')
+    return direction, [clean_cursor_value(model._meta.get_field(field), value) for field, value in zip(fields, values)]
+
+
+def clean_cursor_value(field, value):
+    if not isinstance(value, (str, int)) or isinstance(value, bool):
+        raise ValueError('Cursor inválido')
+    try:
+        value = field.to_python(value)
+        field.run_validators(value)
+    except ValidationError:
+        raise ValueError('Cursor inválido')
+    return value
+
+
+# Construye la condición (a, b, c) > (x, y, z) expandida en OR, más un rango sobre la primera columna para que el
+# motor pueda recorrer el índice desde la posición del cursor.
+
+def keyset_filter(fields, values, forward):
+    lookup = 'gt' if forward else 'lt'
+    condition = Q()
+    for position, field in enumerate(fields):
+        equal = {name: value for name, value in zip(fields[:position], values[:position])}
+        condition |= Q(**equal) & Q(**{f'{field}__{lookup}': values[position]})
+    return Q(**{f'{fields[0]}__{lookup}e': values[0]}) & condition
+
+
+# Conteo aproximado para tablas grandes: en MySQL se toma la estadística de information_schema (sin recorrer la
+# tabla); en otros motores se hace el COUNT normal.
+
+def estimated_count(queryset):
+    if connection.vendor == 'mysql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT TABLE_ROWS FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] is not None:
+            return row[0]
+    return queryset.count()
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor, estimated_total=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.estimated_total = estimated_total
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def paginate_keyset(queryset, fields, cursor=None, per_page=5, with_total=False):
+    direction, values = decode_cursor(cursor, fields, queryset.model) if cursor else ('next', None)
+    forward = direction == 'next'
+
+    ordered = queryset.order_by(*(fields if forward else ['-' + field for field in fields]))
+    if values is not None:
+        ordered = ordered.filter(keyset_filter(fields, values, forward))
+
+    rows = list(ordered[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    has_next = has_more if forward else values is not None
+    has_previous = values is not None if forward else has_more
+
+    def key(obj):
+        return [getattr(obj, field) for field in fields]
+
+    next_cursor = encode_cursor('next', key(rows[-1])) if rows and has_next else None
+    previous_cursor = encode_cursor('previous', key(rows[0])) if rows and has_previous else None
+    estimated_total = estimated_count(queryset) if with_total else None
+    return KeysetPage(rows, next_cursor, previous_cursor, estimated_total)
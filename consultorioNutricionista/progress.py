@@ -0,0 +1,93 @@
+from datetime import datetime, time, timedelta
+
+from django.utils import timezone
+
+from .models import Consultation
+
+
+# Serie de progreso (peso e IMC) de un paciente para las gráficas.
+# La serie sale de una sola consulta ordenada con values_list y se reduce en el servidor para que el tamaño de la
+# respuesta no crezca con los años de historial: LTTB (Largest-Triangle-Three-Buckets) o promedios por semana o mes.
+
+DEFAULT_MAX_POINTS = 500
+MAX_POINTS_LIMIT = 5000
+BUCKETS = ('week', 'month')
+
+
+def load_series(patient_id, desde=None, hasta=None):
+    consultations = Consultation.objects.filter(patient_id=patient_id)
+    if desde:
+        consultations = consultations.filter(fecha_consulta__gte=timezone.make_aware(datetime.combine(desde, time.min)))
+    if hasta:
+        consultations = consultations.filter(fecha_consulta__lt=timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min)))
+    return list(consultations.order_by('fecha_consulta', 'id').values_list('fecha_consulta', 'peso', 'imc'))
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+def position(fecha):
+    return fecha.timestamp() if isinstance(fecha, datetime) else float(fecha.toordinal() * 86400)
+
+
+# Reduce la serie a max_points puntos conservando la forma de la curva de peso. Los puntos elegidos conservan su IMC.
+
+def lttb(points, max_points):
+    if max_points >= len(points) or max_points < 3:
+        return points
+
+    xs = [position(point[0]) for point in points]
+    ys = [float(point[1]) for point in points]
+    sampled = [points[0]]
+    bucket_size = (len(points) - 2) / (max_points - 2)
+    selected = 0
+
+    for bucket in range(max_points - 2):
+        start = int(bucket * bucket_size) + 1
+        end = int((bucket + 1) * bucket_size) + 1
+
+        # Promedio del siguiente bucket (o el último punto) como tercer vértice del triángulo
+        next_start = end
+        next_end = min(int((bucket + 2) * bucket_size) + 1, len(points))
+        if next_start >= next_end:
+            next_start, next_end = len(points) - 1, len(points)
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        best, best_area = start, -1.0
+        for index in range(start, end):
+            area = abs((xs[selected] - avg_x) * (ys[index] - ys[selected]) - (xs[selected] - xs[index]) * (avg_y - ys[selected]))
+            if area > best_area:
+                best, best_area = index, area
+        sampled.append(points[best])
+        selected = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+# Promedia peso e IMC por semana (a partir del lunes) o por mes. La fecha de cada punto es el inicio del periodo.
+
+def bucket_series(points, bucket):
+    buckets = {}
+    for fecha, peso, imc in points:
+        day = timezone.localtime(fecha).date()
+        if bucket == 'week':
+            start = day - timedelta(days=day.weekday())
+        else:
+            start = day.replace(day=1)
+        total = buckets.setdefault(start, [0, 0, 0])
+        total[0] += 1
+        total[1] += peso
+        total[2] += imc
+
+    return [
+        (start, round(peso / count, 2), round(imc / count, 2))
+        for start, (count, peso, imc) in sorted(buckets.items())
+    ]
+
+
+def downsample(points, max_points=DEFAULT_MAX_POINTS, bucket=None):
+    if bucket:
+        points = bucket_series(points, bucket)
+    # Aun agrupados, los periodos se limitan al máximo de puntos pedido
+    return lttb(points, max_points)
@@ -0,0 +1,142 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.checks import Error
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+
+# Caché de lectura para los fragmentos de las páginas públicas del paciente.
+# La llave de cada fragmento incluye una versión por paciente; guardar un paciente o una de sus consultas incrementa
+# la versión y los fragmentos anteriores dejan de usarse hasta que expiran o el backend los desaloja (LRU en memoria
+# local). Los fragmentos se guardan en el alias de CACHES configurado en PUBLIC_CACHE_ALIAS, que puede ser local a
+# cada proceso; las versiones, en PUBLIC_VERSION_CACHE_ALIAS, que con varios procesos debe ser compartido para que un
+# cambio atendido por un proceso invalide los fragmentos de todos ("manage.py check --deploy" falla con un caché
+# local).
+
+lock = threading.Lock()
+counters = {'hits': 0, 'misses': 0}
+
+
+def get_cache():
+    return caches[getattr(settings, 'PUBLIC_CACHE_ALIAS', 'default')]
+
+
+def get_version_cache():
+    return caches[version_cache_alias()]
+
+
+def version_cache_alias():
+    return getattr(settings, 'PUBLIC_VERSION_CACHE_ALIAS', getattr(settings, 'PUBLIC_CACHE_ALIAS', 'default'))
+
+
+def version_key(patient_id):
+    return f'patient-version:{patient_id}'
+
+
+def new_version():
+    # Si la versión se desaloja, la nueva nunca coincide con la de fragmentos viejos que sigan en caché
+    return int(time.time() * 1000)
+
+
+def patient_version(patient_id):
+    cache = get_version_cache()
+    version = cache.get(version_key(patient_id))
+    if version is None:
+        version = new_version()
+        if not cache.add(version_key(patient_id), version, timeout=None):
+            version = cache.get(version_key(patient_id), version)
+    return version
+
+
+def bump_patient_version(patient_id):
+    cache = get_version_cache()
+    try:
+        cache.incr(version_key(patient_id))
+    except ValueError:
+        cache.set(version_key(patient_id), new_version(), timeout=None)
+
+
+def record(outcome):
+    with lock:
+        counters[outcome] += 1
+
+
+def stats():
+    with lock:
+        hits, misses = counters['hits'], counters['misses']
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / total, 4) if total else 0.0}
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Regresa el HTML de un fragmento del paciente desde la caché o lo renderiza con el contexto que regresa load_context.
+# load_context solo se llama en un fallo de caché, así que un acierto no consulta la base de datos.
+
+def patient_fragment(patient_id, template_name, load_context):
+    cache = get_cache()
+    key = f'public-fragment:{template_name}:{patient_id}:{patient_version(patient_id)}'
+    html = cache.get(key)
+    if html is not None:
+        record('hits')
+        return mark_safe(html)
+
+    record('misses')
+    html = render_to_string(template_name, load_context())
+    cache.set(key, html, getattr(settings, 'PUBLIC_CACHE_TTL', 300))
+    return html
+
+
+# Versión asíncrona de patient_fragment para las vistas ASGI: usa la API async del caché y load_context es una
+# corrutina (por ejemplo con Patient.objects.aget).
+
+async def apatient_version(patient_id):
+    cache = get_version_cache()
+    version = await cache.aget(version_key(patient_id))
+    if version is None:
+        version = new_version()
+        if not await cache.aadd(version_key(patient_id), version, timeout=None):
+            version = await cache.aget(version_key(patient_id), version)
+    return version
+
+
+async def apatient_fragment(patient_id, template_name, load_context):
+    cache = get_cache()
+    key = f'public-fragment:{template_name}:{patient_id}:{await apatient_version(patient_id)}'
+    html = await cache.aget(key)
+    if html is not None:
+        record('hits')
+        return mark_safe(html)
+
+    record('misses')
+    html = render_to_string(template_name, await load_context())
+    await cache.aset(key, html, getattr(settings, 'PUBLIC_CACHE_TTL', 300))
+    return html
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Las versiones (de pacientes, de roles y de alimentos) tienen que ser visibles para todos los procesos; con un caché
+# local por proceso un cambio solo invalida lo que cacheó el proceso que lo atendió.
+LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache', 'django.core.cache.backends.dummy.DummyCache')
+
+
+def shared_cache_errors(setting, alias, purpose, ids):
+    backend = settings.CACHES.get(alias, {}).get('BACKEND')
+    if backend is None:
+        return [Error(f"{setting} apunta a '{alias}', que no está en CACHES", id=ids[0])]
+    if backend in LOCAL_CACHE_BACKENDS:
+        return [Error(
+            f"{setting} ('{alias}') usa {backend.rsplit('.', 1)[-1]}, que no se comparte entre procesos",
+            hint=f'Use un caché compartido (archivos, Redis o Memcached) para {purpose}.',
+            id=ids[1],
+        )]
+    return []
+
+
+def check_version_cache(app_configs, **kwargs):
+    return shared_cache_errors('PUBLIC_VERSION_CACHE_ALIAS', version_cache_alias(), 'las versiones de pacientes y alimentos',
+                               ('consultorioNutricionista.E003', 'consultorioNutricionista.E004'))
@@ -0,0 +1,77 @@
+import time
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .models import Patient, Consultation, PatientSummary, RollupChange
+from .nutrition import calculate_imc_batch
+from .public_cache import bump_patient_version
+
+
+# Recalcula el IMC de las consultas cuando cambia la altura de los pacientes.
+# Las consultas de cada bloque de pacientes se leen por llave (id, peso, IMC y altura del paciente en una sola
+# sentencia), el IMC se calcula por lote con nutrition.calculate_imc_batch y solo las filas cuyo IMC cambió se
+# escriben con bulk_update (un UPDATE ... CASE por lote); después se actualizan con otra sentencia el IMC actual y el
+# anterior de PatientSummary. El redondeo no se deja a la base de datos: ROUND de MySQL y de SQLite redondea la mitad
+# hacia arriba y nutrition redondea mitad al par, así que 50.02 kg / 2.00 m daría 12.50 al guardar la consulta y
+# 12.51 al recalcularla.
+
+DEFAULT_CHUNK_SIZE = 1000
+UPDATE_BATCH_SIZE = 1000
+
+
+# Regresa el número de consultas recalculadas (las de pacientes con altura válida).
+def update_consultations(patient_ids, batch_size=UPDATE_BATCH_SIZE):
+    consultations = (Consultation.objects.filter(patient_id__in=patient_ids, patient__altura__gt=0)
+                     .order_by('id').values_list('id', 'peso', 'imc', 'patient__altura', 'patient_id', 'fecha_consulta'))
+    recomputed = 0
+    last_id = 0
+    while True:
+        rows = list(consultations.filter(id__gt=last_id)[:batch_size])
+        if not rows:
+            break
+        imcs = calculate_imc_batch([row[1] for row in rows], [row[3] for row in rows])
+        changed = [(row, new_imc) for row, new_imc in zip(rows, imcs) if new_imc is not None and new_imc != row[2]]
+        Consultation.objects.bulk_update([Consultation(id=row[0], imc=new_imc) for row, new_imc in changed], ['imc'], batch_size=batch_size)
+        # El IMC define la categoría de la consulta en los agregados de analítica
+        RollupChange.record((row[4], row[5]) for row, _ in changed)
+        recomputed += len(rows)
+        last_id = rows[-1][0]
+    return recomputed
+
+
+def update_summaries(patient_ids):
+    ordered = Consultation.objects.filter(patient_id=OuterRef('patient_id')).order_by('-fecha_consulta', '-id').values('imc')
+    PatientSummary.objects.filter(patient_id__in=patient_ids).update(
+        latest_imc=Subquery(ordered[:1]),
+        previous_imc=Subquery(ordered[1:2]),
+    )
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Recalcula el IMC de todos los pacientes (o solo de patient_ids) por bloques. Regresa (pacientes, consultas, segundos).
+
+def recompute_imc(patient_ids=None, chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    patients = Patient.objects.all()
+    if patient_ids is not None:
+        patients = patients.filter(id__in=list(patient_ids))
+
+    start = time.perf_counter()
+    patient_count = rows = 0
+    last_id = 0
+    while True:
+        # Los bloques se leen por llave (id > último) para no mantener un cursor abierto mientras se actualiza
+        chunk = list(patients.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not chunk:
+            break
+        with transaction.atomic():
+            rows += update_consultations(chunk)
+            update_summaries(chunk)
+        for patient_id in chunk:
+            bump_patient_version(patient_id)
+        last_id = chunk[-1]
+        patient_count += len(chunk)
+        if progress is not None:
+            progress(patient_count, rows, time.perf_counter() - start)
+    return patient_count, rows, time.perf_counter() - start
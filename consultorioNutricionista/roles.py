@@ -0,0 +1,195 @@
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth import HASH_SESSION_KEY, SESSION_KEY as AUTH_SESSION_KEY
+from django.contrib.auth.views import redirect_to_login
+from django.core.cache import caches
+from django.shortcuts import redirect
+from django.utils.functional import SimpleLazyObject
+
+from .public_cache import new_version, shared_cache_errors
+
+
+# Roles y permisos del personal resueltos una sola vez por usuario.
+# RoleMiddleware pone en request.roles un RoleSet con el rol (nutricionista o asistente) y los permisos del usuario.
+# El RoleSet se guarda en la sesión junto con una versión por usuario que vive en el caché (ROLES_CACHE_ALIAS); mientras
+# la versión no cambie, revisar el rol no carga el usuario ni consulta grupos o permisos. Guardar o borrar el usuario
+# (AssistantForm, NutritionistForm, cambio de contraseña, admin) o cambiar sus grupos o permisos incrementa la versión
+# (ver los receptores en models.py) y en la siguiente petición el RoleSet se vuelve a construir.
+# Con varios procesos, ROLES_CACHE_ALIAS debe apuntar a un caché compartido para que la invalidación llegue a todos
+# (settings_production usa el caché de sesiones; "manage.py check --deploy" falla con un caché local).
+# El RoleSet guardado también lleva el hash de autenticación de la sesión y la hora en que se verificó el usuario: si
+# el hash de la sesión cambió (cambio de contraseña con update_session_auth_hash) o pasaron ROLES_RECHECK_SECONDS, se
+# carga el usuario, con lo que Django vuelve a comparar get_session_auth_hash() y cierra las sesiones que ya no son
+# válidas aunque la invalidación del caché no haya llegado.
+# Política de acceso: administrar al personal (asistentes y nutricionistas) requiere el rol de nutricionista; los
+# pacientes y las consultas los maneja cualquier miembro del personal, como antes de los roles; los datos clínicos
+# (peso, IMC, exportaciones) son solo del nutricionista. En la agenda cada nutricionista reserva y cancela sus propias
+# citas, y un asistente lo hace en la agenda de cualquier nutricionista solo si tiene el permiso del modelo
+# (add_appointment para reservar, change_appointment para cancelar).
+
+NUTRICIONISTA = 'nutricionista'
+ASISTENTE = 'asistente'
+SESSION_KEY = '_roles'
+BOOK_APPOINTMENT = 'consultorioNutricionista.add_appointment'
+CANCEL_APPOINTMENT = 'consultorioNutricionista.change_appointment'
+DEFAULT_RECHECK_SECONDS = 300
+
+
+class RoleSet:
+    def __init__(self, user_id=None, username='', roles=(), permissions=()):
+        self.user_id = user_id
+        self.username = username
+        self.roles = frozenset(roles)
+        self.permissions = frozenset(permissions)
+
+    @property
+    def is_authenticated(self):
+        return self.user_id is not None
+
+    @property
+    def is_nutritionist(self):
+        return NUTRICIONISTA in self.roles
+
+    @property
+    def is_assistant(self):
+        return ASISTENTE in self.roles
+
+    @property
+    def is_staff(self):
+        return bool(self.roles)
+
+    def has_role(self, *roles):
+        return not self.roles.isdisjoint(roles)
+
+    def has_perm(self, perm):
+        return self.is_nutritionist or perm in self.permissions
+
+    def manages_agenda(self, nutritionist_id, perm):
+        if self.is_nutritionist:
+            return self.user_id == nutritionist_id
+        return self.is_assistant and perm in self.permissions
+
+    def as_session(self, version, auth_hash, checked):
+        return {
+            'user_id': self.user_id,
+            'username': self.username,
+            'roles': sorted(self.roles),
+            'permissions': sorted(self.permissions),
+            'version': version,
+            'auth_hash': auth_hash,
+            'checked': checked,
+        }
+
+
+ANONYMOUS = RoleSet()
+
+
+def get_cache():
+    return caches[getattr(settings, 'ROLES_CACHE_ALIAS', 'default')]
+
+
+def version_key(user_id):
+    return f'user-roles-version:{user_id}'
+
+
+def role_version(user_id):
+    cache = get_cache()
+    version = cache.get(version_key(user_id))
+    if version is None:
+        version = new_version()
+        if not cache.add(version_key(user_id), version, timeout=None):
+            version = cache.get(version_key(user_id), version)
+    return version
+
+
+def bump_role_version(user_id):
+    cache = get_cache()
+    try:
+        cache.incr(version_key(user_id))
+    except ValueError:
+        cache.set(version_key(user_id), new_version(), timeout=None)
+
+
+def build_roles(user):
+    roles = []
+    if user.is_superuser:
+        roles.append(NUTRICIONISTA)
+    elif user.is_staff:
+        roles.append(ASISTENTE)
+    return RoleSet(user.pk, user.get_username(), roles, user.get_all_permissions())
+
+
+def get_roles(request):
+    session = getattr(request, 'session', None)
+    if session is None or AUTH_SESSION_KEY not in session:
+        return ANONYMOUS
+
+    user_id = int(session[AUTH_SESSION_KEY])
+    version = role_version(user_id)
+    auth_hash = session.get(HASH_SESSION_KEY)
+    now = time.time()
+    cached = session.get(SESSION_KEY)
+    if (cached and cached['user_id'] == user_id and cached['version'] == version and cached.get('auth_hash') == auth_hash
+            and now - cached.get('checked', 0) < getattr(settings, 'ROLES_RECHECK_SECONDS', DEFAULT_RECHECK_SECONDS)):
+        return RoleSet(cached['user_id'], cached['username'], cached['roles'], cached['permissions'])
+
+    # La versión o el hash cambiaron, venció la verificación o es la primera petición: se carga el usuario, lo que
+    # también verifica el hash de autenticación de la sesión
+    user = request.user
+    if not user.is_authenticated:
+        return ANONYMOUS
+    roles = build_roles(user)
+    session[SESSION_KEY] = roles.as_session(version, session.get(HASH_SESSION_KEY), now)
+    return roles
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class RoleMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request.roles = SimpleLazyObject(lambda: get_roles(request))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.roles = SimpleLazyObject(lambda: get_roles(request))
+        return await self.get_response(request)
+
+
+# Requiere un usuario autenticado y, si se indican, alguno de los roles; sin sesión redirige al login y sin el rol a
+# access_denied.
+def role_required(*roles):
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if not request.roles.is_authenticated:
+                return redirect_to_login(request.get_full_path())
+            if roles and not request.roles.has_role(*roles):
+                return redirect('access_denied')
+            return view(request, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# "manage.py check --deploy" falla si la versión de roles vive en un caché local a cada proceso
+def check_roles_cache(app_configs, **kwargs):
+    return shared_cache_errors('ROLES_CACHE_ALIAS', getattr(settings, 'ROLES_CACHE_ALIAS', 'default'), 'la versión de roles',
+                               ('consultorioNutricionista.E001', 'consultorioNutricionista.E002'))
+
+
+def roles(request):
+    return {'roles': getattr(request, 'roles', ANONYMOUS)}
@@ -0,0 +1,124 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+# Enrutamiento de lecturas a la réplica de la base de datos.
+# ReplicaRoutingMiddleware marca las peticiones GET/HEAD de las vistas de solo lectura (READ_ONLY_VIEWS); durante esas
+# peticiones PrimaryReplicaRouter manda las lecturas de los modelos del consultorio al alias 'replica'. Las escrituras,
+# la sesión y la autenticación siempre usan 'default'. Después de guardar una consulta o un paciente, pin_to_primary
+# guarda en la sesión una ventana de REPLICA_STICKY_SECONDS durante la cual el usuario lee del primario, para que vea
+# sus propios cambios aunque la réplica vaya atrasada. Sin el alias 'replica' en DATABASES todo va a 'default'.
+
+REPLICA_ALIAS = 'replica'
+SESSION_KEY = 'primary_until'
+APP_LABEL = 'consultorioNutricionista'
+
+READ_ONLY_VIEWS = {
+    'view_patients',
+    'view_patients_pagination',
+    'view_patients_keyset',
+    'view_list_patients',
+    'view_patients_stream',
+    'search_patients_by_name',
+    'schedule',
+    'patient_progress',
+    'patient_progress_data',
+    'patient_detail',
+    'analytics_dashboard',
+    'export_consultations_csv',
+}
+
+use_replica = contextvars.ContextVar('use_replica', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+# Dentro del bloque las lecturas van a 'default' aunque la petición sea de solo lectura: para lo que lee y después
+# escribe a partir de lo leído, o para volver a leer algo que se acaba de escribir.
+@contextmanager
+def reading_from_primary():
+    token = use_replica.set(False)
+    try:
+        yield
+    finally:
+        use_replica.reset(token)
+
+
+def pin_to_primary(request):
+    # Sin réplica no hay nada que fijar; escribir la sesión obligaría a guardarla en cada escritura
+    if not replica_configured():
+        return
+    request.session[SESSION_KEY] = time.time() + getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+
+
+def pinned_to_primary(request):
+    session = getattr(request, 'session', None)
+    return session is not None and session.get(SESSION_KEY, 0) > time.time()
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == APP_LABEL and use_replica.get() and replica_configured():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # La réplica tiene los mismos datos que el primario
+        return True
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Las respuestas en streaming se generan después de que el middleware regresa, así que su contenido se recorre con la
+# marca de réplica activa.
+def stream_from_replica(content):
+    token = use_replica.set(True)
+    try:
+        yield from content
+    finally:
+        use_replica.reset(token)
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = use_replica.set(False)
+        try:
+            return self.finish(self.get_response(request))
+        finally:
+            use_replica.reset(token)
+
+    async def __acall__(self, request):
+        token = use_replica.set(False)
+        try:
+            return self.finish(await self.get_response(request))
+        finally:
+            use_replica.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (replica_configured() and request.method in ('GET', 'HEAD')
+                and request.resolver_match.url_name in READ_ONLY_VIEWS and not pinned_to_primary(request)):
+            use_replica.set(True)
+
+    def finish(self, response):
+        if use_replica.get() and response.streaming and not response.is_async:
+            response.streaming_content = stream_from_replica(response.streaming_content)
+        return response
@@ -0,0 +1,153 @@
+import bisect
+from datetime import datetime, time, timedelta
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Appointment, AvailabilitySlot
+
+
+# Agenda de los nutricionistas. Los bloques de disponibilidad y las citas de una semana se leen con una sentencia cada
+# uno por el índice (nutricionista, inicio) y se guardan en un IntervalIndex: dos listas ordenadas de inicios y fines
+# en las que, con bisect, saber si un horario se empalma con otro o si cae dentro de la disponibilidad cuesta
+# O(log n), y los huecos libres de un rango se recorren a partir de su posición sin revisar toda la semana.
+# Ni los bloques ni las citas duran más de MAX_LENGTH, así que las lecturas por rango acotan el inicio por los dos
+# lados y no recorren el historial completo del nutricionista.
+
+DEFAULT_DURATION = timedelta(minutes=30)
+MAX_LENGTH = timedelta(hours=12)
+BATCH_SIZE = 500
+
+
+class IntervalIndex:
+    # Intervalos [inicio, fin) ordenados por inicio; los que se empalman o se tocan al cargarlos se unen en uno
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return iter(zip(self.starts, self.ends))
+
+    def overlaps(self, start, end):
+        # El último intervalo que empieza antes de end es el único que puede llegar más allá de start
+        index = bisect.bisect_left(self.starts, end)
+        return index > 0 and self.ends[index - 1] > start
+
+    def covers(self, start, end):
+        index = bisect.bisect_right(self.starts, start)
+        return index > 0 and self.ends[index - 1] >= end
+
+    def add(self, start, end):
+        if self.overlaps(start, end):
+            raise ValueError('El intervalo se empalma con otro')
+        index = bisect.bisect_left(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+
+    # Partes de [start, end) que no cubre ningún intervalo
+    def gaps(self, start, end):
+        index = bisect.bisect_right(self.ends, start)
+        cursor = start
+        while index < len(self.starts) and self.starts[index] < end:
+            if self.starts[index] > cursor:
+                yield cursor, self.starts[index]
+            cursor = max(cursor, self.ends[index])
+            index += 1
+        if cursor < end:
+            yield cursor, end
+
+
+def availability_intervals(nutritionist_id, desde, hasta):
+    return (AvailabilitySlot.objects.filter(nutritionist_id=nutritionist_id, inicio__gte=desde - MAX_LENGTH, inicio__lt=hasta, fin__gt=desde)
+            .order_by('inicio').values_list('inicio', 'fin'))
+
+
+def booked_appointments(nutritionist_id, desde, hasta):
+    return (Appointment.objects.filter(nutritionist_id=nutritionist_id, inicio__gte=desde - MAX_LENGTH, inicio__lt=hasta, fin__gt=desde)
+            .exclude(estado=Appointment.CANCELADA).order_by('inicio'))
+
+
+def week_bounds(day):
+    monday = day - timedelta(days=day.weekday())
+    return (timezone.make_aware(datetime.combine(monday, time.min)),
+            timezone.make_aware(datetime.combine(monday + timedelta(days=7), time.min)))
+
+
+# Horarios libres de duracion dentro de la disponibilidad del nutricionista entre desde y hasta.
+def free_slots(nutritionist_id, desde, hasta, duracion=DEFAULT_DURATION):
+    available = IntervalIndex(availability_intervals(nutritionist_id, desde, hasta))
+    booked = IntervalIndex(booked_appointments(nutritionist_id, desde, hasta).values_list('inicio', 'fin'))
+    slots = []
+    for start, end in available:
+        for free_start, free_end in booked.gaps(max(start, desde), min(end, hasta)):
+            cursor = free_start
+            while cursor + duracion <= free_end:
+                slots.append((cursor, cursor + duracion))
+                cursor += duracion
+    return slots
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+def lock_nutritionist(nutritionist_id):
+    # Bloquear la fila del nutricionista serializa los cambios a su agenda: dos reservas simultáneas del mismo horario
+    # no pueden pasar las dos la revisión de empalmes
+    if not User.objects.select_for_update().filter(pk=nutritionist_id, is_superuser=True).exists():
+        raise ValueError('No existe el nutricionista')
+
+
+def book_appointment(patient_id, nutritionist_id, inicio, fin):
+    if fin <= inicio or fin - inicio > MAX_LENGTH:
+        raise ValueError('La duración de la cita no es válida')
+    if inicio < timezone.now():
+        raise ValueError('No se pueden reservar citas en el pasado')
+    with transaction.atomic():
+        lock_nutritionist(nutritionist_id)
+        if not IntervalIndex(availability_intervals(nutritionist_id, inicio, fin)).covers(inicio, fin):
+            raise ValueError('El horario está fuera de la disponibilidad del nutricionista')
+        if IntervalIndex(booked_appointments(nutritionist_id, inicio, fin).values_list('inicio', 'fin')).overlaps(inicio, fin):
+            raise ValueError('El horario se empalma con otra cita del nutricionista')
+        patient_appointments = Appointment.objects.filter(patient_id=patient_id, estado=Appointment.PROGRAMADA,
+                                                          inicio__gte=inicio - MAX_LENGTH, inicio__lt=fin, fin__gt=inicio)
+        if patient_appointments.exists():
+            raise ValueError('El paciente ya tiene una cita en ese horario')
+        return Appointment.objects.create(patient_id=patient_id, nutritionist_id=nutritionist_id, inicio=inicio, fin=fin)
+
+
+# Crea por lote los bloques de disponibilidad de los días de la semana dados (0 es lunes) entre las fechas desde y
+# hasta. Los días cuyo bloque se empalma con uno existente se omiten. Regresa (creados, omitidos).
+def generate_recurring_slots(nutritionist_id, desde, hasta, dias, hora_inicio, hora_fin, batch_size=BATCH_SIZE):
+    length = datetime.combine(desde, hora_fin) - datetime.combine(desde, hora_inicio)
+    if length <= timedelta(0) or length > MAX_LENGTH:
+        raise ValueError('La hora final debe ser posterior a la inicial y el bloque no puede durar más de 12 horas')
+    dias = set(dias)
+    start = timezone.make_aware(datetime.combine(desde, time.min))
+    end = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min))
+
+    with transaction.atomic():
+        lock_nutritionist(nutritionist_id)
+        existing = IntervalIndex(availability_intervals(nutritionist_id, start, end))
+        slots, skipped = [], 0
+        day = desde
+        while day <= hasta:
+            if day.weekday() in dias:
+                inicio = timezone.make_aware(datetime.combine(day, hora_inicio))
+                fin = timezone.make_aware(datetime.combine(day, hora_fin))
+                if existing.overlaps(inicio, fin):
+                    skipped += 1
+                else:
+                    existing.add(inicio, fin)
+                    slots.append(AvailabilitySlot(nutritionist_id=nutritionist_id, inicio=inicio, fin=fin))
+            day += timedelta(days=1)
+        AvailabilitySlot.objects.bulk_create(slots, batch_size=batch_size)
+    return len(slots), skipped
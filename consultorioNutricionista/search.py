@@ -0,0 +1,34 @@
+from django.db.models import Count, Q
+
+from .models import Patient, PatientNameToken, normalize_name
+
+
+# Búsqueda de pacientes por nombre mientras se escribe.
+# Cada palabra de la búsqueda se compara por prefijo contra PatientNameToken (ya sin acentos ni mayúsculas) y el
+# paciente debe coincidir con todas. Se ordena primero por cantidad de palabras exactas y después alfabéticamente.
+
+MAX_SEARCH_TERMS = 4
+MIN_TERM_LENGTH = 2
+DEFAULT_SEARCH_LIMIT = 20
+PREFIX_UPPER_BOUND = '\uffff'
+
+
+def search_patients(query, limit=DEFAULT_SEARCH_LIMIT):
+    terms = [term for term in normalize_name(query).split() if len(term) >= MIN_TERM_LENGTH][:MAX_SEARCH_TERMS]
+    if not terms:
+        return []
+
+    patients = Patient.objects.filter(is_active=True)
+    for term in terms:
+        # SQLite no usa el índice para el LIKE ... ESCAPE de istartswith (recorre todo el índice), así que el prefijo
+        # también se expresa como rango token >= term AND token < term + U+FFFF, que ambos motores resuelven con un
+        # SEARCH sobre patient_name_token_idx; istartswith se queda como filtro exacto dentro del rango
+        matching = (PatientNameToken.objects.filter(token__gte=term, token__lt=term + PREFIX_UPPER_BOUND, token__istartswith=term)
+                    .values('patient_id'))
+        patients = patients.filter(id__in=matching)
+
+    return list(
+        patients.only('id', 'nombre', 'apellido_paterno', 'apellido_materno')
+        .annotate(exact_matches=Count('name_tokens', filter=Q(name_tokens__token__in=terms), distinct=True))
+        .order_by('-exact_matches', 'apellido_paterno', 'apellido_materno', 'nombre', 'id')[:limit]
+    )
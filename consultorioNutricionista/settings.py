@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,10 +49,19 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'consultorioNutricionista.roles.RoleMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'consultorioNutricionista.routers.ReplicaRoutingMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'consultorioNutricionista.instrumentation.QueryStatsMiddleware',
 ]
 
+# Fracción de peticiones que registran el detalle de SQL y plantillas (la latencia se mide en todas)
+QUERY_STATS_SAMPLE_RATE = float(os.environ.get('QUERY_STATS_SAMPLE_RATE', 0.1))
+
+# Token opcional para que Prometheus lea /metrics/ sin sesión (encabezado "Authorization: Bearer <token>")
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 ROOT_URLCONF = 'consultorioNutricionista.urls'
 
 TEMPLATES = [
@@ -66,6 +76,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'consultorioNutricionista.roles.roles',
             ],
         },
     },
@@ -96,6 +107,53 @@ DATABASES = {
     }
 }
 
+# Réplica de lectura opcional (DB_REPLICA_HOST). Las vistas de solo lectura leen de ella a través de
+# routers.PrimaryReplicaRouter; en las pruebas apunta a la base de datos de 'default' (TEST MIRROR).
+if os.environ.get('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.environ['DB_REPLICA_HOST'],
+        'PORT': os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['consultorioNutricionista.routers.PrimaryReplicaRouter']
+
+# Segundos que un usuario lee del primario después de guardar una consulta o un paciente
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+# El alias "public" guarda los fragmentos de las páginas públicas del paciente. Por defecto vive en la memoria local
+# del proceso (con desalojo LRU); en despliegues con varios procesos se puede apuntar a un caché compartido, por
+# ejemplo PUBLIC_CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache con PUBLIC_CACHE_LOCATION=/tmp/consultorio
+# o django.core.cache.backends.db.DatabaseCache con una tabla creada por "manage.py createcachetable".
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'public': {
+        'BACKEND': os.environ.get('PUBLIC_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('PUBLIC_CACHE_LOCATION', 'public-patient-pages'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('PUBLIC_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+}
+
+PUBLIC_CACHE_ALIAS = 'public'
+PUBLIC_CACHE_TTL = int(os.environ.get('PUBLIC_CACHE_TTL', 300))
+# Versiones por paciente de los fragmentos (ver public_cache.py); con varios procesos debe ser un caché compartido
+PUBLIC_VERSION_CACHE_ALIAS = PUBLIC_CACHE_ALIAS
+
+# Versión por usuario de los roles guardados en la sesión (ver roles.py); usa el mismo caché que las páginas públicas
+# para que, con un caché compartido, la invalidación llegue a todos los procesos.
+ROLES_CACHE_ALIAS = PUBLIC_CACHE_ALIAS
+# Cada cuántos segundos se vuelve a cargar el usuario para verificar la sesión aunque la versión de roles no cambie
+ROLES_RECHECK_SECONDS = int(os.environ.get('ROLES_RECHECK_SECONDS', 300))
 
 
 # Password validation
@@ -134,11 +192,19 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Archivos generados (exportaciones). Se descargan a través de la vista export_download, no desde MEDIA_URL.
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', str(BASE_DIR / 'media'))
+MEDIA_URL = 'media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# MySQL no soporta índices parciales; patient_active_name_part_idx solo se crea en SQLite y PostgreSQL, y en MySQL la
+# lista de pacientes activos usa patient_active_name_idx.
+SILENCED_SYSTEM_CHECKS = ['models.W037']
+
 LOGIN_REDIRECT_URL = 'home'
 LOGIN_URL = 'login'
 LOGOUT_REDIRECT_URL = 'logout'
@@ -0,0 +1,10 @@
+"""
+Settings para el perfil ASGI (por ejemplo "uvicorn consultorioNutricionista.asgi:application").
+
+Igual que settings_production.py (DEBUG apagado, MySQL con conexiones persistentes o pool, sesiones en caché
+compartido), pero con las rutas de urls_asgi.py, donde las páginas públicas del paciente son vistas asíncronas.
+"""
+
+from .settings_production import *  # noqa: F401,F403
+
+ROOT_URLCONF = 'consultorioNutricionista.urls_asgi'
@@ -0,0 +1,35 @@
+"""
+Settings para la suite de benchmarks (benchmarks/run_benchmarks.py).
+
+Usa una base de datos SQLite local en lugar del MySQL de settings.py para que los resultados se puedan comparar
+entre máquinas sin depender del contenedor de la base de datos.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('BENCHMARK_DB', str(BASE_DIR / 'benchmark.sqlite3')),
+    }
+}
+
+# Con BENCHMARK_REPLICA_DB una segunda base SQLite hace de réplica (por ejemplo una copia de benchmark.sqlite3) para
+# probar el enrutamiento de lecturas de routers.py
+if os.environ.get('BENCHMARK_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['BENCHMARK_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# El hash de contraseñas no es lo que se mide
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+# La instrumentación por petición se desactiva para no sumar su costo a las mediciones
+QUERY_STATS_SAMPLE_RATE = 0.0
+
+# Las exportaciones que genera la suite no se mezclan con las del consultorio
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', str(BASE_DIR / 'benchmark_media'))
@@ -0,0 +1,117 @@
+"""
+Settings para producción (gunicorn -c gunicorn.conf.py, servicio web_prod de docker-compose.yml).
+
+Parte de settings.py y toma del entorno la conexión a MySQL, el tiempo de vida de las conexiones persistentes y,
+opcionalmente, un pool de conexiones por proceso con django-db-connection-pool (DB_POOL=1). Las sesiones se leen de un
+caché compartido (cached_db) y las contraseñas se guardan con Argon2 calibrado cuando argon2-cffi está instalado.
+"""
+
+from .settings import *  # noqa: F401,F403
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY', SECRET_KEY)
+
+DEBUG = os.environ.get('DJANGO_DEBUG', '0') == '1'
+
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', '*').split(',')
+
+# gunicorn.conf.py usa urls_asgi cuando el worker es ASGI
+ROOT_URLCONF = os.environ.get('DJANGO_ROOT_URLCONF', ROOT_URLCONF)
+
+
+# Database
+# Cada hilo del servidor conserva su conexión entre peticiones durante DB_CONN_MAX_AGE segundos y la verifica antes de
+# reutilizarla (CONN_HEALTH_CHECKS), en lugar de abrir una conexión nueva en cada petición.
+
+DATABASES['default'].update({
+    'NAME': os.environ.get('DB_NAME', DATABASES['default']['NAME']),
+    'USER': os.environ.get('DB_USER', DATABASES['default']['USER']),
+    'PASSWORD': os.environ.get('DB_PASSWORD', DATABASES['default']['PASSWORD']),
+    'HOST': os.environ.get('DB_HOST', DATABASES['default']['HOST']),
+    'PORT': os.environ.get('DB_PORT', DATABASES['default']['PORT']),
+    'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+    'CONN_HEALTH_CHECKS': True,
+})
+
+# La réplica usa las mismas credenciales y opciones de conexión que el primario
+if 'replica' in DATABASES:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': DATABASES['replica']['HOST'],
+        'PORT': DATABASES['replica']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+# Con el pool, Django "cierra" la conexión al final de cada petición y el pool la conserva abierta, así que
+# CONN_MAX_AGE se deja en 0 y el tamaño se controla con DB_POOL_SIZE / DB_POOL_MAX_OVERFLOW por proceso.
+if os.environ.get('DB_POOL', '0') == '1':
+    for database in DATABASES.values():
+        database.update({
+            'ENGINE': 'dj_db_conn_pool.backends.mysql',
+            'CONN_MAX_AGE': 0,
+            'POOL_OPTIONS': {
+                'POOL_SIZE': int(os.environ.get('DB_POOL_SIZE', 10)),
+                'MAX_OVERFLOW': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),
+                'RECYCLE': int(os.environ.get('DB_POOL_RECYCLE', 3600)),
+                'PRE_PING': True,
+            },
+        })
+
+
+# Templates
+# Las plantillas compiladas se guardan en memoria en cada proceso; un cambio en las plantillas requiere reiniciar.
+
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+
+# Sessions
+# Con cached_db cada petición autenticada lee la sesión del caché y solo va a django_session cuando no está ahí; las
+# escrituras van a los dos. El caché debe ser compartido por todos los procesos (por defecto archivos en
+# SESSION_CACHE_LOCATION; con varios servidores, Redis u otro caché de red con SESSION_CACHE_BACKEND) para que un
+# cierre de sesión se vea en todos. Con DJANGO_SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies la
+# sesión viaja firmada en la cookie y no se toca ni la base de datos ni el caché.
+# Las sesiones vencidas de django_session se borran con "manage.py cleanup_sessions" (por ejemplo desde cron).
+
+SESSION_ENGINE = os.environ.get('DJANGO_SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+SESSION_COOKIE_AGE = int(os.environ.get('SESSION_COOKIE_AGE', 60 * 60 * 24 * 14))
+SESSION_CACHE_ALIAS = 'sessions'
+CACHES['sessions'] = {
+    'BACKEND': os.environ.get('SESSION_CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+    'LOCATION': os.environ.get('SESSION_CACHE_LOCATION', '/tmp/consultorio-sessions'),
+    'TIMEOUT': SESSION_COOKIE_AGE,
+}
+
+# La versión de roles por usuario (roles.py) y las versiones de pacientes y alimentos (public_cache.py, foods.py) tienen
+# que ser las mismas en todos los procesos (WEB_WORKERS, comandos de manage.py); el caché público puede ser local a
+# cada proceso, así que se guardan en el caché de sesiones, que ya es compartido.
+ROLES_CACHE_ALIAS = os.environ.get('ROLES_CACHE_ALIAS', SESSION_CACHE_ALIAS)
+PUBLIC_VERSION_CACHE_ALIAS = os.environ.get('PUBLIC_VERSION_CACHE_ALIAS', SESSION_CACHE_ALIAS)
+
+
+# Password hashing
+# Argon2 con parámetros medidos con "manage.py calibrate_password_hasher" (ver hashers.py). PBKDF2 queda en la lista
+# para verificar las contraseñas existentes, que se vuelven a guardar con Argon2 en el siguiente inicio de sesión.
+# Con PASSWORD_HASHER=pbkdf2, o sin argon2-cffi instalado, se usan los hashers de Django.
+
+try:
+    import argon2
+except ImportError:  # argon2-cffi es opcional
+    argon2 = None
+
+ARGON2_TIME_COST = int(os.environ.get('ARGON2_TIME_COST', 2))
+ARGON2_MEMORY_COST = int(os.environ.get('ARGON2_MEMORY_COST', 102400))
+ARGON2_PARALLELISM = int(os.environ.get('ARGON2_PARALLELISM', 8))
+
+if argon2 is not None and os.environ.get('PASSWORD_HASHER', 'argon2') == 'argon2':
+    PASSWORD_HASHERS = [
+        'consultorioNutricionista.hashers.CalibratedArgon2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+        'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+        'django.contrib.auth.hashers.ScryptPasswordHasher',
+    ]
@@ -0,0 +1,1132 @@
+"""
+Pruebas del consultorio. Corren sobre SQLite con la configuración de benchmark:
+
+    python manage.py test consultorioNutricionista --settings=consultorioNutricionista.settings_benchmark
+"""
+import io
+import random
+import tempfile
+import unittest
+from unittest import mock
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_EVEN
+
+from django.contrib.auth.models import Permission, User
+from django.contrib.auth.hashers import get_hasher
+from django.contrib.sessions.backends.db import SessionStore
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import RequestFactory, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from .forms import ConsultationForm
+from .archive import archive_patients
+from .detail import load_patient_detail
+from .importer import import_consultations
+from .management.commands import calibrate_password_hasher
+from .management.commands.explain_queries import explain, index_checks, plan_problems
+from .models import (Patient, Consultation, ConsultationRollup, PatientSummary, PatientNameToken, ExportJob, RollupChange,
+                     Appointment, AvailabilitySlot, Food, MealPlan, MealPlanItem)
+from . import analytics, async_views, foods, instrumentation, nutrition, roles, routers, views
+from . import public_cache
+from .pagination import PATIENT_KEYSET_FIELDS, encode_cursor, paginate_keyset
+from .public_cache import patient_version
+from .scheduling import IntervalIndex, book_appointment
+from .search import PREFIX_UPPER_BOUND, search_patients
+
+
+def create_patient(**fields):
+    values = {
+        'nombre': 'Ana', 'apellido_paterno': 'López', 'apellido_materno': 'Pérez', 'fecha_nacimiento': date(1990, 5, 17),
+        'sexo': 'F', 'altura': Decimal('1.65'), 'peso': Decimal('60.00'), 'actividad_aerobica': True,
+    }
+    values.update(fields)
+    return Patient.objects.create(**values)
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+TRANSACTION_CONTROL = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+def statements(captured):
+    return [query['sql'] for query in captured.captured_queries if not query['sql'].upper().startswith(TRANSACTION_CONTROL)]
+
+
+# TransactionTestCase para que la transacción de ConsultationForm.save sea la externa, como en la vista.
+class ConsultationWritePathTests(TransactionTestCase):
+    def consultation_form(self, patient, peso):
+        form = ConsultationForm({'patient': patient.pk, 'peso': peso, 'observaciones': 'Control'})
+        self.assertTrue(form.is_valid(), form.errors)
+        return form
+
+    def test_consultation_costs_one_statement_per_table(self):
+        patient = create_patient()
+        self.consultation_form(patient, '61.00').save()
+
+        # INSERT de la consulta (con el IMC ya calculado), UPDATE del peso del paciente, UPDATE incremental de
+        # PatientSummary e INSERT del día en RollupChange, sin ningún SELECT. El pedido original eran 2 sentencias; el
+        # resumen y el registro de cambios de la analítica, agregados después, suman las otras dos.
+        form = self.consultation_form(patient, '62.50')
+        with CaptureQueriesContext(connection) as captured:
+            consultation = form.save()
+        written = statements(captured)
+        self.assertEqual(len(written), 4, written)
+        self.assertFalse([sql for sql in written if sql.startswith('SELECT')])
+
+        self.assertEqual(consultation.imc, Decimal('22.96'))
+        self.assertEqual(Patient.objects.get(pk=patient.pk).peso, Decimal('62.50'))
+        summary = PatientSummary.objects.get(patient=patient)
+        self.assertEqual(summary.consultation_count, 2)
+        self.assertEqual(summary.latest_imc, Decimal('22.96'))
+        self.assertEqual(summary.previous_imc, Decimal('22.41'))
+        self.assertEqual(Consultation.objects.filter(patient=patient).count(), 2)
+
+    def test_consultation_date_is_aware(self):
+        consultation = self.consultation_form(create_patient(), '61.00').save()
+        self.assertTrue(timezone.is_aware(consultation.fecha_consulta))
+        self.assertEqual(PatientSummary.objects.get(patient_id=consultation.patient_id).last_visit, consultation.fecha_consulta)
+
+
+    def test_moving_a_consultation_date_refreshes_the_summary(self):
+        patient = create_patient()
+        start = timezone.now() - timedelta(days=60)
+        first = Consultation.objects.create(patient=patient, peso=Decimal('61.00'), observaciones='Control', fecha_consulta=start)
+        latest = Consultation.objects.create(patient=patient, peso=Decimal('62.50'), observaciones='Control',
+                                             fecha_consulta=start + timedelta(days=30))
+
+        latest.fecha_consulta = start - timedelta(days=30)
+        latest.save()
+
+        summary = PatientSummary.objects.get(patient=patient)
+        self.assertEqual((summary.last_visit, summary.latest_peso), (first.fecha_consulta, first.peso))
+        self.assertEqual(summary.previous_imc, latest.imc)
+
+    def test_changes_in_a_transaction_refresh_each_summary_once(self):
+        patient = create_patient()
+        for peso in ('61.00', '62.00', '63.00', '64.00'):
+            Consultation.objects.create(patient=patient, peso=Decimal(peso), observaciones='Control')
+        newest = Consultation.objects.filter(patient=patient).latest()
+
+        with CaptureQueriesContext(connection) as captured, transaction.atomic():
+            Consultation.objects.filter(patient=patient, peso__lt=Decimal('63.00')).delete()
+            newest.delete()
+        counts = [sql for sql in statements(captured) if 'COUNT(' in sql]
+        self.assertEqual(len(counts), 1, counts)
+
+        summary = PatientSummary.objects.get(patient=patient)
+        self.assertEqual((summary.consultation_count, summary.latest_peso, summary.previous_imc), (1, Decimal('63.00'), None))
+
+    def test_rolled_back_changes_leave_the_summary(self):
+        patient = create_patient()
+        Consultation.objects.create(patient=patient, peso=Decimal('61.00'), observaciones='Control')
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Consultation.objects.filter(patient=patient).delete()
+            raise RuntimeError
+        with transaction.atomic():
+            Consultation.objects.create(patient=patient, peso=Decimal('62.50'), observaciones='Control',
+                                        fecha_consulta=timezone.now() - timedelta(days=10))
+        summary = PatientSummary.objects.get(patient=patient)
+        self.assertEqual((summary.consultation_count, summary.latest_peso), (2, Decimal('61.00')))
+
+    def test_patient_delete_cascades_without_loading_consultations(self):
+        patient = create_patient()
+        Consultation.objects.create(patient=patient, peso=Decimal('61.00'), observaciones='Control')
+        with CaptureQueriesContext(connection) as captured:
+            patient.delete()
+        loaded = [sql for sql in statements(captured) if sql.startswith('SELECT') and '"peso"' in sql]
+        self.assertFalse(loaded, loaded)
+        self.assertFalse(PatientSummary.objects.filter(patient_id=patient.pk).exists())
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class ImporterTests(TransactionTestCase):
+    def test_import_invalidates_cached_patient_pages(self):
+        patient = create_patient()
+        version = patient_version(patient.pk)
+
+        report = import_consultations(io.StringIO(f"patient,peso,observaciones\n{patient.pk},61.00,Histórica\n"))
+
+        self.assertEqual(report.rows_imported, 1)
+        self.assertEqual(PatientSummary.objects.get(patient=patient).consultation_count, 1)
+        self.assertNotEqual(patient_version(patient.pk), version)
+
+    def test_import_sets_the_weight_of_the_latest_consultation(self):
+        patient, other = create_patient(), create_patient(nombre='Lucía')
+        Consultation.objects.create(patient=other, peso=Decimal('70.00'), observaciones='Control')
+        rows = [
+            f'{{"patient": {patient.pk}, "peso": "64.00", "observaciones": "Nueva", "fecha_consulta": "2026-03-01T09:00:00Z"}}',
+            f'{{"patient": {patient.pk}, "peso": "66.00", "observaciones": "Antigua", "fecha_consulta": "2025-03-01T09:00:00Z"}}',
+            f'{{"patient": {other.pk}, "peso": "75.00", "observaciones": "Antigua", "fecha_consulta": "2025-03-01T09:00:00Z"}}',
+        ]
+
+        report = import_consultations(io.StringIO('\n'.join(rows)), 'jsonl', chunk_size=1)
+
+        self.assertEqual(report.rows_imported, 3)
+        self.assertEqual(Patient.objects.get(pk=patient.pk).peso, Decimal('64.00'))
+        # La consulta importada es anterior a la que ya tenía el paciente: el peso sigue siendo el de esa consulta
+        self.assertEqual(Patient.objects.get(pk=other.pk).peso, Decimal('70.00'))
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class KeysetPaginationTests(TransactionTestCase):
+    def setUp(self):
+        # Apellidos repetidos para que el orden dependa también del nombre y del id
+        self.patients = [create_patient(apellido_paterno=apellido, nombre=nombre)
+                         for apellido in ('Gómez', 'López', 'Ruiz') for nombre in ('Ana', 'Ana', 'Berta')]
+        create_patient(apellido_paterno='Alba', is_active=False)
+        self.expected = sorted(self.patients, key=lambda p: (p.apellido_paterno, p.apellido_materno, p.nombre, p.id))
+        self.active = Patient.objects.filter(is_active=True)
+
+    def page(self, cursor=None):
+        return paginate_keyset(self.active, PATIENT_KEYSET_FIELDS, cursor, per_page=4)
+
+    def test_next_pages_cover_the_list_once(self):
+        first = self.page()
+        second = self.page(first.next_cursor)
+        last = self.page(second.next_cursor)
+        self.assertEqual(list(first) + list(second) + list(last), self.expected)
+        self.assertEqual((first.has_previous, first.has_next), (False, True))
+        self.assertEqual((last.has_previous, last.has_next, len(last)), (True, False, 1))
+
+    def test_previous_returns_the_same_page(self):
+        first = self.page()
+        second = self.page(first.next_cursor)
+        last = self.page(second.next_cursor)
+        self.assertEqual(list(self.page(last.previous_cursor)), list(second))
+        back = self.page(second.previous_cursor)
+        self.assertEqual(list(back), list(first))
+        self.assertEqual((back.has_previous, back.has_next), (False, True))
+
+    def test_exact_multiple_has_no_empty_last_page(self):
+        self.patients[0].delete()
+        first = self.page()
+        second = self.page(first.next_cursor)
+        self.assertEqual((len(second), second.has_next), (4, False))
+
+    def test_tampered_cursors_are_rejected(self):
+        for cursor in ['no-es-base64!', encode_cursor('next', [['Gómez'], {}, 'Ana', 1]), encode_cursor('next', ['Gómez', 'Pérez', 'Ana', 'x']),
+                       encode_cursor('next', ['Gómez', 'Pérez', 'Ana', True]), encode_cursor('next', ['G' * 51, 'Pérez', 'Ana', 1]),
+                       encode_cursor('sideways', ['Gómez', 'Pérez', 'Ana', 1]), encode_cursor('next', ['Gómez', 'Pérez', 'Ana'])]:
+            with self.assertRaises(ValueError, msg=cursor):
+                self.page(cursor)
+
+    def test_views_answer_bad_request_for_a_tampered_cursor(self):
+        self.client.force_login(User.objects.create_superuser('nutri', password='secreta'))
+        cursor = encode_cursor('next', [{'apellido_paterno__gt': ''}, 'Pérez', 'Ana', 1])
+        for name in ('patient_list', 'view_patients_keyset'):
+            self.assertEqual(self.client.get(reverse(name), {'cursor': cursor}).status_code, 400, name)
+        response = self.client.get(reverse('view_patients_keyset'), {'cursor': self.page().next_cursor})
+        self.assertEqual(list(response.context['patients']), self.expected[4:])
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class StreamingListTests(TransactionTestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('nutri', password='secreta'))
+
+    def test_rows_stream_in_index_order_with_one_query(self):
+        for apellido in ('Ruiz', 'Alba', 'Mora', 'Díaz', 'Soto'):
+            create_patient(apellido_paterno=apellido)
+        create_patient(apellido_paterno='Baja', is_active=False)
+
+        with mock.patch.object(views, 'STREAM_CHUNK_SIZE', 2):
+            response = self.client.get(reverse('view_patients_stream'))
+            self.assertTrue(response.streaming)
+            with CaptureQueriesContext(connection) as captured:
+                parts = [part.decode() for part in response.streaming_content]
+
+        # Cabecera, tres bloques de filas y el resto de la página; las filas salen de un solo SELECT
+        self.assertEqual(len(parts), 5)
+        self.assertIn('<table', parts[0])
+        self.assertIn('</html>', parts[-1])
+        page = ''.join(parts)
+        positions = [page.index(f'<td>{apellido}</td>') for apellido in ('Alba', 'Díaz', 'Mora', 'Ruiz', 'Soto')]
+        self.assertEqual(positions, sorted(positions))
+        self.assertNotIn('Baja', page)
+        self.assertEqual(len([sql for sql in statements(captured) if 'consultorioNutricionista_patient' in sql]), 1)
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+@override_settings(QUERY_STATS_SAMPLE_RATE=1.0)
+class QueryStatsTests(TransactionTestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('nutri', password='secreta'))
+        self.registry = instrumentation.StatsRegistry()
+        patcher = mock.patch.object(instrumentation, 'registry', self.registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sampled_request_counts_queries_and_templates(self):
+        patient = create_patient()
+        self.client.get(reverse('patient_detail', args=[patient.pk]))
+        stats = self.registry.snapshot()['patient_detail']
+        self.assertEqual((stats['requests'], stats['sampled']), (1, 1))
+        self.assertGreater(stats['avg_queries'], 0)
+        self.assertGreater(stats['avg_template_ms'], 0)
+
+    def test_streamed_response_is_measured_when_consumed(self):
+        for apellido in ('Ruiz', 'Alba', 'Mora'):
+            create_patient(apellido_paterno=apellido)
+        with mock.patch.object(views, 'STREAM_CHUNK_SIZE', 1):
+            response = self.client.get(reverse('view_patients_stream'))
+            self.assertNotIn('view_patients_stream', self.registry.snapshot())
+            b''.join(response.streaming_content)
+
+        stats = self.registry.snapshot()['view_patients_stream']
+        self.assertEqual((stats['requests'], stats['sampled']), (1, 1))
+        # El SELECT de las filas y el render de la página ocurren al recorrer el contenido
+        self.assertGreaterEqual(stats['avg_queries'], 1)
+        self.assertGreater(stats['avg_template_ms'], 0)
+
+    def test_unsampled_requests_only_count_latency(self):
+        with self.settings(QUERY_STATS_SAMPLE_RATE=0.0):
+            self.client.get(reverse('home'))
+        stats = self.registry.snapshot()['home']
+        self.assertEqual((stats['requests'], stats['sampled'], stats['avg_queries']), (1, 0, 0))
+
+    def test_repeated_statements_are_reported_as_n_plus_one(self):
+        profile = instrumentation.RequestProfile()
+        for patient_id in range(3):
+            profile.add_query(f'SELECT * FROM paciente WHERE id IN ({", ".join(["%s"] * (patient_id + 1))})', 0.001)
+        profile.add_query('SELECT 1', 0.001)
+        self.assertEqual(profile.repeated(), {'SELECT * FROM paciente WHERE id IN (...)': 3})
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class SearchTests(TransactionTestCase):
+    def test_prefix_search_ignores_accents_and_case(self):
+        gonzalez = create_patient(nombre='Lucía', apellido_paterno='González')
+        create_patient(nombre='Luis', apellido_paterno='Gómez')
+        create_patient(nombre='Lucía', apellido_paterno='Ramírez', is_active=False)
+
+        self.assertEqual(search_patients('GONZ luc'), [gonzalez])
+        self.assertEqual(len(search_patients('luc')), 1)
+
+    def test_prefix_is_a_range_on_the_token_index(self):
+        term = 'gonz'
+        plan = (PatientNameToken.objects.filter(token__gte=term, token__lt=term + PREFIX_UPPER_BOUND, token__istartswith=term)
+                .values('patient_id').explain())
+        self.assertIn('SEARCH', plan)
+        self.assertIn('patient_name_token_idx', plan)
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class ProgressDataTests(TransactionTestCase):
+    def setUp(self):
+        self.nutritionist = User.objects.create_superuser('nutri', password='secreta')
+        self.client.force_login(self.nutritionist)
+        self.patient = create_patient()
+        start = timezone.now() - timedelta(days=90)
+        self.consultations = [
+            Consultation.objects.create(patient=self.patient, peso=Decimal(peso), observaciones='Control', fecha_consulta=start + timedelta(days=30 * n))
+            for n, peso in enumerate(['64.00', '62.00', '61.00'])
+        ]
+        self.url = reverse('patient_progress_data', args=[self.patient.pk])
+
+    def test_unchanged_series_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_editing_an_older_consultation_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        oldest = self.consultations[0]
+        oldest.peso, oldest.imc = Decimal('66.00'), Decimal('24.24')
+        oldest.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class RollupTests(TransactionTestCase):
+    def rollups(self):
+        return sorted(ConsultationRollup.objects.values_list('periodo', 'fecha', 'sexo', 'grupo_edad', 'categoria', 'consultas',
+                                                             'imc_total', 'peso_cambio_total', 'peso_cambio_consultas'))
+
+    def consult(self, patient, peso, days_ago):
+        return Consultation.objects.create(patient=patient, peso=Decimal(peso), observaciones='Control',
+                                           fecha_consulta=timezone.now() - timedelta(days=days_ago))
+
+    def test_incremental_refresh_matches_a_full_rebuild(self):
+        ana, luis = create_patient(), create_patient(nombre='Luis', sexo='M', altura=Decimal('1.80'))
+        first = self.consult(ana, '61.00', 60)
+        self.consult(ana, '62.50', 30)
+        latest = self.consult(luis, '80.00', 5)
+        analytics.refresh_rollups()
+
+        # Consulta retroactiva, cambio de fecha, borrado, importación con fecha pasada, cambio de sexo y de altura
+        self.consult(ana, '60.00', 45)
+        first.fecha_consulta -= timedelta(days=40)
+        first.save()
+        latest.delete()
+        import_consultations(io.StringIO(f"patient,peso,observaciones,fecha_consulta\n{luis.pk},82.00,Histórica,2026-01-15T10:00:00Z\n"))
+        luis = Patient.objects.get(pk=luis.pk)
+        luis.sexo, luis.altura = 'F', Decimal('1.70')
+        luis.save()
+
+        # Los cambios se procesan en bloques de uno para cruzar varias transacciones
+        analytics.refresh_rollups(chunk_size=1)
+        self.assertFalse(RollupChange.objects.exists())
+        incremental = self.rollups()
+        analytics.rebuild_rollups()
+        self.assertEqual(incremental, self.rollups())
+
+    def test_late_commit_below_the_last_processed_change_is_aggregated(self):
+        patient = create_patient()
+        self.consult(patient, '61.00', 10)
+        pending = RollupChange.objects.create(patient_id=patient.pk, fecha=timezone.localdate() - timedelta(days=3))
+        analytics.refresh_rollups()
+        # Un cambio con id menor que el último procesado, confirmado después por otra transacción
+        late = self.consult(patient, '62.00', 3)
+        RollupChange.objects.filter(fecha=timezone.localtime(late.fecha_consulta).date()).update(id=pending.pk)
+        analytics.refresh_rollups()
+        self.assertEqual(sum(ConsultationRollup.objects.filter(periodo=ConsultationRollup.DIARIO).values_list('consultas', flat=True)), 2)
+
+    def test_invalid_imc_is_not_underweight(self):
+        patient = create_patient(altura=Decimal('0.00'))
+        consultation = self.consult(patient, '61.00', 1)
+        self.assertEqual(consultation.imc, 0)
+        analytics.refresh_rollups()
+        self.assertFalse(ConsultationRollup.objects.exists())
+        self.assertEqual([share[1] for share in analytics.patient_category_share()], [0, 0, 0, 0])
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class CacheInvalidationTests(TransactionTestCase):
+    def test_patient_version_changes_after_commit(self):
+        patient = create_patient()
+        version = patient_version(patient.pk)
+        with transaction.atomic():
+            Consultation.objects.create(patient=patient, peso=Decimal('61.00'), observaciones='Control')
+            self.assertEqual(patient_version(patient.pk), version)
+        self.assertNotEqual(patient_version(patient.pk), version)
+
+    def test_rolled_back_changes_keep_the_version(self):
+        patient = create_patient()
+        version = patient_version(patient.pk)
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            patient.peso = Decimal('70.00')
+            patient.save()
+            raise RuntimeError
+        self.assertEqual(patient_version(patient.pk), version)
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+@override_settings(ROOT_URLCONF='consultorioNutricionista.urls_asgi')
+class AsyncPublicPagesTests(TransactionTestCase):
+    def setUp(self):
+        self.patient = create_patient(nombre='Lucía')
+        public_cache.get_cache().clear()
+
+    async def test_detail_is_rendered_once_and_then_served_from_the_cache(self):
+        url = reverse('patient_public_detail', args=[self.patient.pk])
+        self.assertIs(resolve(url).func, async_views.patient_public_detail)
+        misses = public_cache.counters['misses']
+        cold = await self.async_client.get(url)
+        self.assertContains(cold, 'Nombre: Lucía')
+        warm = await self.async_client.get(url)
+        self.assertEqual(public_cache.counters['misses'], misses + 1)
+        self.assertEqual(warm.content, cold.content)
+
+    async def test_unknown_patient(self):
+        response = await self.async_client.get(reverse('patient_public_detail', args=[self.patient.pk + 100]))
+        self.assertContains(response, 'No se encontró el paciente')
+
+    async def test_search_form(self):
+        url = reverse('search_patient')
+        self.assertEqual((await self.async_client.get(url)).status_code, 200)
+        self.assertContains(await self.async_client.post(url, {'patient_id': self.patient.pk}), 'Lucía')
+        missing = await self.async_client.post(url, {'patient_id': self.patient.pk + 100})
+        self.assertRedirects(missing, reverse('patient_public_not_found'), fetch_redirect_response=False)
+        self.assertEqual((await self.async_client.get(reverse('patient_public_not_found'))).status_code, 200)
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class StaffPagesTests(TransactionTestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('nutri', password='secreta'))
+
+    def test_assistant_pages_resolve_their_argument(self):
+        assistant = User.objects.create_user('asistente', password='secreta', is_staff=True)
+        self.assertEqual(self.client.get(reverse('edit_assistant', args=[assistant.pk])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('delete_assistant', args=[assistant.pk])).status_code, 200)
+
+    def test_patient_list_shows_active_patients(self):
+        active = create_patient(nombre='Lucía')
+        create_patient(nombre='Marta', is_active=False)
+        response = self.client.get(reverse('patient_list'))
+        self.assertEqual(list(response.context['patients']), [active])
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+CENT = Decimal('0.01')
+
+
+def reference(value):
+    return value.quantize(CENT, rounding=ROUND_HALF_EVEN)
+
+
+def sample_patients(count, seed=20261018):
+    generator = random.Random(seed)
+    return [
+        (Decimal(generator.randint(3000, 15000)).scaleb(-2), Decimal(generator.randint(140, 200)).scaleb(-2),
+         generator.randint(18, 90), generator.choice('MF'), generator.random() < 0.5)
+        for _ in range(count)
+    ]
+
+
+class NutritionTests(SimpleTestCase):
+    def test_divide_half_even_table(self):
+        for numerator, denominator, expected in [(1, 2, 0), (3, 2, 2), (5, 2, 2), (7, 2, 4), (5, 4, 1), (7, 4, 2), (10, 4, 2),
+                                                 (14, 4, 4), (2, 3, 1), (0, 7, 0)]:
+            self.assertEqual(nutrition.divide_half_even(numerator, denominator), expected, (numerator, denominator))
+
+    def test_imc_table(self):
+        for peso, altura, expected in [('50.02', '2.00', '12.50'), ('50.06', '2.00', '12.52'), ('50.10', '2.00', '12.52'),
+                                       ('60.00', '1.65', '22.04'), ('62.50', '1.65', '22.96'), ('70.00', '0.00', None)]:
+            imc = nutrition.calculate_imc(Decimal(peso), Decimal(altura))
+            self.assertEqual(imc, Decimal(expected) if expected else None, (peso, altura))
+
+    def test_scalar_matches_decimal_half_even(self):
+        for peso, altura, edad, sexo, actividad in sample_patients(2000):
+            self.assertEqual(nutrition.calculate_imc(peso, altura), reference(peso / (altura * altura)))
+            mujer = sexo == 'F'
+            mifflin = 10 * peso + Decimal('6.25') * altura * 100 - 5 * edad + (-161 if mujer else 5)
+            self.assertEqual(nutrition.calculate_bmr(peso, altura, edad, sexo), reference(mifflin))
+            if mujer:
+                harris = Decimal('447.593') + Decimal('9.247') * peso + Decimal('3.098') * altura * 100 - Decimal('4.330') * edad
+            else:
+                harris = Decimal('88.362') + Decimal('13.397') * peso + Decimal('4.799') * altura * 100 - Decimal('5.677') * edad
+            self.assertEqual(nutrition.calculate_bmr(peso, altura, edad, sexo, nutrition.HARRIS_BENEDICT), reference(harris))
+            bmr = nutrition.calculate_bmr(peso, altura, edad, sexo)
+            factor = Decimal('1.55') if actividad else Decimal('1.20')
+            self.assertEqual(nutrition.calculate_tdee(bmr, actividad), reference(bmr * factor))
+
+    @unittest.skipIf(nutrition.np is None, 'NumPy no está instalado')
+    def test_batch_matches_scalar(self):
+        patients = sample_patients(5000)
+        pesos, alturas, edades, sexos, actividades = (list(column) for column in zip(*patients))
+        peso_cents, altura_cents = nutrition.cents_array(pesos), nutrition.cents_array(alturas)
+        mujeres = [int(sexo == 'F') for sexo in sexos]
+
+        self.assertEqual(nutrition.calculate_imc_batch(pesos, alturas), [nutrition.calculate_imc(p, a) for p, a in zip(pesos, alturas)])
+        for formula in nutrition.FORMULAS:
+            bmr_cents = nutrition.bmr_cents_batch(peso_cents, altura_cents, edades, mujeres, formula)
+            expected = [nutrition.calculate_bmr(*patient[:4], formula=formula) for patient in patients]
+            self.assertEqual([nutrition.from_cents(cents) for cents in bmr_cents.tolist()], expected, formula)
+        tdee_cents = nutrition.tdee_cents_batch(nutrition.bmr_cents_batch(peso_cents, altura_cents, edades, mujeres), actividades)
+        expected = [nutrition.calculate_tdee(nutrition.calculate_bmr(*patient[:4]), patient[4]) for patient in patients]
+        self.assertEqual([nutrition.from_cents(cents) for cents in tdee_cents.tolist()], expected)
+        minimum, maximum = nutrition.ideal_weight_cents_batch(altura_cents)
+        expected = [nutrition.ideal_weight_range(altura) for altura in alturas]
+        self.assertEqual(list(zip(map(nutrition.from_cents, minimum.tolist()), map(nutrition.from_cents, maximum.tolist()))), expected)
+
+    @unittest.skipIf(nutrition.np is None, 'NumPy no está instalado')
+    def test_batch_imc_marks_invalid_heights(self):
+        self.assertEqual(nutrition.calculate_imc_batch([Decimal('50.02'), Decimal('70.00')], [Decimal('2.00'), Decimal('0.00')]),
+                         [Decimal('12.50'), None])
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class RecomputeTests(TransactionTestCase):
+    def test_height_change_rounds_like_the_insert(self):
+        patient = create_patient(altura=Decimal('2.00'))
+        consultation = Consultation.objects.create(patient=patient, peso=Decimal('50.02'), observaciones='Control')
+        self.assertEqual(consultation.imc, Decimal('12.50'))
+
+        patient = Patient.objects.get(pk=patient.pk)
+        patient.altura = Decimal('1.90')
+        patient.save()
+        self.assertEqual(Consultation.objects.get(pk=consultation.pk).imc, nutrition.calculate_imc(Decimal('50.02'), Decimal('1.90')))
+
+        patient.altura = Decimal('2.00')
+        patient.save()
+        self.assertEqual(Consultation.objects.get(pk=consultation.pk).imc, Decimal('12.50'))
+        self.assertEqual(PatientSummary.objects.get(patient=patient).latest_imc, Decimal('12.50'))
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class PinToPrimaryTests(SimpleTestCase):
+    def request(self):
+        request = RequestFactory().post('/')
+        request.session = {}
+        return request
+
+    def test_without_replica_the_session_is_untouched(self):
+        request = self.request()
+        with mock.patch.object(routers, 'replica_configured', return_value=False):
+            routers.pin_to_primary(request)
+        self.assertEqual(request.session, {})
+
+    def test_with_replica_reads_stay_on_primary(self):
+        request = self.request()
+        with mock.patch.object(routers, 'replica_configured', return_value=True):
+            routers.pin_to_primary(request)
+            self.assertTrue(routers.pinned_to_primary(request))
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class ExplainTests(TransactionTestCase):
+    def test_coroutine_scan_is_not_a_full_scan(self):
+        plan = ('3 0 0 CO-ROUTINE (subquery-2)\n'
+                '7 3 0 SEARCH consultorioNutricionista_consultation USING INDEX consultation_patient_date_idx (patient_id=?)\n'
+                '28 0 0 SCAN (subquery-2)')
+        self.assertEqual(plan_problems(plan, 'sqlite'), [])
+        self.assertEqual(plan_problems('4 0 0 SCAN consultorioNutricionista_patient\n26 0 0 USE TEMP B-TREE FOR ORDER BY', 'sqlite'),
+                         ['ordenamiento temporal', 'recorrido completo'])
+
+    def test_mysql_derived_table_is_not_a_full_scan(self):
+        plan = ('{"query_block": {"table": {"table_name": "<derived2>", "access_type": "ALL", "materialized_from_subquery": '
+                '{"query_block": {"table": {"table_name": "c", "access_type": "ref", "key": "consultation_patient_date_idx"}}}}}}')
+        self.assertEqual(plan_problems(plan, 'mysql'), [])
+        self.assertEqual(plan_problems('{"query_block": {"table": {"table_name": "p", "access_type": "ALL"}}}', 'mysql'),
+                         ['recorrido completo'])
+
+    def test_history_and_patient_list_use_the_indexes(self):
+        patient = create_patient()
+        for _ in range(3):
+            create_patient(apellido_paterno='Martínez', is_active=False)
+        for peso in ('61.00', '62.00', '63.00'):
+            Consultation.objects.create(patient=patient, peso=Decimal(peso), observaciones='Control')
+
+        for name, queryset in index_checks(patient.pk):
+            plan = explain(queryset)
+            self.assertEqual(plan_problems(plan), [], f"{name}:\n{plan}")
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class PatientDetailCacheTests(TransactionTestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('nutri', password='secreta'))
+        self.patient = create_patient()
+        Consultation.objects.create(patient=self.patient, peso=Decimal('61.00'), observaciones='Control')
+        self.url = reverse('patient_detail', args=[self.patient.pk])
+        public_cache.get_cache().clear()
+
+    def test_warm_detail_is_served_from_the_fragments(self):
+        cold = self.client.get(self.url)
+        hits = public_cache.counters['hits']
+
+        # Con los dos fragmentos en caché solo se lee la sesión; ni el paciente ni su historial
+        with CaptureQueriesContext(connection) as captured:
+            warm = self.client.get(self.url)
+        self.assertEqual(public_cache.counters['hits'], hits + 1)
+        self.assertEqual(len(captured), 1, [query['sql'] for query in captured.captured_queries])
+        self.assertIn('django_session', captured.captured_queries[0]['sql'])
+        self.assertEqual(warm.content, cold.content)
+
+    def test_new_consultation_misses_the_fragments(self):
+        self.client.get(self.url)
+        Consultation.objects.create(patient=self.patient, peso=Decimal('62.50'), observaciones='Control')
+        misses = public_cache.counters['misses']
+        self.assertContains(self.client.get(self.url), '22.96')
+        self.assertEqual(public_cache.counters['misses'], misses + 1)
+
+
+# Dos procesos: cada uno con su caché local de fragmentos y las versiones en un caché común (dos LocMemCache con la
+# misma LOCATION comparten los datos dentro del proceso de pruebas).
+TWO_WORKER_CACHES = {
+    'worker_a': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-a'},
+    'worker_b': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'worker-b'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'shared-versions'},
+}
+
+
+@override_settings(CACHES=TWO_WORKER_CACHES, PUBLIC_VERSION_CACHE_ALIAS='shared')
+class SharedVersionTests(TransactionTestCase):
+    def render_card(self, worker, patient):
+        with self.settings(PUBLIC_CACHE_ALIAS=worker):
+            return public_cache.patient_fragment(patient.pk, 'patient_public_card.html',
+                                                 lambda: {'patient': Patient.objects.get(pk=patient.pk)})
+
+    def test_change_in_one_worker_invalidates_the_other(self):
+        patient = create_patient(nombre='Lucía')
+        self.assertIn('Lucía', self.render_card('worker_b', patient))
+
+        with self.settings(PUBLIC_CACHE_ALIAS='worker_a'):
+            patient.nombre = 'Lucila'
+            patient.save()
+
+        self.assertIn('Lucila', self.render_card('worker_b', patient))
+
+    def test_deploy_check_rejects_a_per_process_version_cache(self):
+        self.assertEqual([error.id for error in public_cache.check_version_cache(None)], ['consultorioNutricionista.E004'])
+        with self.settings(PUBLIC_VERSION_CACHE_ALIAS='missing'):
+            self.assertEqual([error.id for error in public_cache.check_version_cache(None)], ['consultorioNutricionista.E003'])
+        with self.settings(PUBLIC_VERSION_CACHE_ALIAS='files', CACHES={'files': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                                                                 'LOCATION': '/tmp/consultorio-versions-check'}}):
+            self.assertEqual(public_cache.check_version_cache(None), [])
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class ClinicalDataAccessTests(TransactionTestCase):
+    def setUp(self):
+        self.patient = create_patient()
+        Consultation.objects.create(patient=self.patient, peso=Decimal('61.00'), observaciones='Control')
+
+    def test_assistant_cannot_read_weight_or_imc(self):
+        self.client.force_login(User.objects.create_user('asistente', password='secreta', is_staff=True))
+        job = ExportJob.objects.create(formato=ExportJob.CSV, patient=self.patient)
+        denied = reverse('access_denied')
+        for url in [reverse('export_consultations_csv'), reverse('request_export'), reverse('export_status', args=[job.pk]),
+                    reverse('export_download', args=[job.pk]), reverse('patient_progress', args=[self.patient.pk])]:
+            self.assertRedirects(self.client.get(url), denied, fetch_redirect_response=False, msg_prefix=url)
+        self.assertEqual(self.client.get(reverse('patient_progress_data', args=[self.patient.pk])).status_code, 403)
+
+    def test_nutritionist_downloads_the_csv(self):
+        self.client.force_login(User.objects.create_superuser('nutri', password='secreta'))
+        response = self.client.get(reverse('export_consultations_csv'), {'patient_id': self.patient.pk})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('22.41', b''.join(response.streaming_content).decode())
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class ExportWorkerTests(TransactionTestCase):
+    def test_worker_checks_connections_around_each_job(self):
+        patient = create_patient()
+        Consultation.objects.create(patient=patient, peso=Decimal('61.00'), observaciones='Control')
+        job = ExportJob.objects.create(formato=ExportJob.CSV, patient=patient)
+        output = io.StringIO()
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root), \
+                mock.patch('consultorioNutricionista.management.commands.run_export_worker.close_old_connections') as close:
+            call_command('run_export_worker', once=True, stdout=output)
+            job.refresh_from_db()
+            self.assertEqual(job.estado, ExportJob.TERMINADO)
+        # Antes de tomar el trabajo, al terminarlo y antes de la consulta que encuentra la cola vacía
+        self.assertEqual(close.call_count, 3)
+        self.assertIn('1 filas', output.getvalue())
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+# Sin una segunda base en las pruebas, REPLICA_ALIAS apunta a 'default' y se registra qué modelos habría leído la
+# réplica: la restauración de un paciente archivado no debe leer de ella.
+class RestoreFromReplicaTests(TransactionTestCase):
+    def setUp(self):
+        patient = create_patient(is_active=False)
+        for peso in ('61.00', '62.50'):
+            Consultation.objects.create(patient=patient, peso=Decimal(peso), observaciones='Control')
+        self.assertEqual(archive_patients()[0], 1)
+        self.patient_id = patient.pk
+
+        self.replica_reads = []
+        original = routers.PrimaryReplicaRouter.db_for_read
+
+        def db_for_read(router_self, model, **hints):
+            alias = original(router_self, model, **hints)
+            if alias == routers.REPLICA_ALIAS:
+                self.replica_reads.append(model.__name__)
+            return alias
+
+        for patcher in [mock.patch.object(routers, 'replica_configured', return_value=True),
+                        mock.patch.object(routers, 'REPLICA_ALIAS', 'default'),
+                        mock.patch.object(routers.PrimaryReplicaRouter, 'db_for_read', db_for_read)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_restore_reads_and_rereads_on_the_primary(self):
+        restored = []
+        token = routers.use_replica.set(True)
+        try:
+            detail = load_patient_detail(self.patient_id, on_restore=lambda: restored.append(True))
+        finally:
+            routers.use_replica.reset(token)
+
+        self.assertEqual(restored, [True])
+        self.assertEqual(detail.consultation_count, 2)
+        self.assertEqual(len(detail.history), 2)
+        # Solo la primera lectura del paciente (que no lo encuentra) va a la réplica
+        self.assertEqual(self.replica_reads, ['Patient'])
+
+    def test_detail_view_pins_the_user_to_the_primary(self):
+        self.client.force_login(User.objects.create_superuser('nutri', password='secreta'))
+        response = self.client.get(reverse('patient_detail', args=[self.patient_id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(routers.SESSION_KEY, self.client.session)
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class RoleSessionTests(TransactionTestCase):
+    def setUp(self):
+        self.nutritionist = User.objects.create_superuser('nutri', password='secreta')
+        self.client.force_login(self.nutritionist)
+        self.url = reverse('view_assistants')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def expire_role_check(self):
+        session = self.client.session
+        session[roles.SESSION_KEY]['checked'] = 0
+        session.save()
+
+    def test_password_changed_elsewhere_ends_the_session_on_recheck(self):
+        # UPDATE sin señales: la versión de roles no cambia, como cuando la invalidación no llega a este proceso
+        User.objects.filter(pk=self.nutritionist.pk).update(password='!')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        self.expire_role_check()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(response['Location'].startswith(reverse('login')))
+
+    def test_changed_session_hash_rebuilds_the_roles(self):
+        session = self.client.session
+        session[roles.SESSION_KEY]['roles'] = []
+        session[roles.SESSION_KEY]['auth_hash'] = 'otro'
+        session.save()
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_assistant_cannot_manage_staff(self):
+        self.client.force_login(User.objects.create_user('asistente', password='secreta', is_staff=True))
+        denied = reverse('access_denied')
+        for url in [self.url, reverse('add_assistant'), reverse('add_nutritionist'),
+                    reverse('edit_assistant', args=[self.nutritionist.pk]), reverse('delete_assistant', args=[self.nutritionist.pk])]:
+            self.assertRedirects(self.client.get(url), denied, fetch_redirect_response=False, msg_prefix=url)
+        self.assertTrue(User.objects.filter(pk=self.nutritionist.pk).exists())
+
+    def test_assistant_manages_patients_and_consultations(self):
+        patient = create_patient()
+        self.client.force_login(User.objects.create_user('asistente', password='secreta', is_staff=True))
+        for url in [reverse('initiate_consultation'), reverse('edit_patient', args=[patient.pk])]:
+            self.assertEqual(self.client.get(url).status_code, 200, msg=url)
+
+    def test_deploy_check_rejects_a_per_process_cache(self):
+        with self.settings(ROLES_CACHE_ALIAS='default'):
+            self.assertEqual([error.id for error in roles.check_roles_cache(None)], ['consultorioNutricionista.E002'])
+        with self.settings(ROLES_CACHE_ALIAS='shared', CACHES={'shared': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                                                          'LOCATION': '/tmp/consultorio-roles-check'}}):
+            self.assertEqual(roles.check_roles_cache(None), [])
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class CleanupSessionsTests(TransactionTestCase):
+    def create_session(self, expire_date):
+        store = SessionStore()
+        store['dato'] = 1
+        store.create()
+        Session.objects.filter(pk=store.session_key).update(expire_date=expire_date)
+        return store.session_key
+
+    def test_deletes_expired_sessions_in_batches(self):
+        now = timezone.now()
+        live = self.create_session(now + timedelta(days=1))
+        for days in range(1, 6):
+            self.create_session(now - timedelta(days=days))
+        output = io.StringIO()
+
+        with CaptureQueriesContext(connection) as captured:
+            call_command('cleanup_sessions', batch_size=2, stdout=output)
+
+        self.assertEqual(list(Session.objects.values_list('pk', flat=True)), [live])
+        self.assertEqual(len([sql for sql in statements(captured) if sql.startswith('DELETE')]), 3)
+        self.assertIn('5 sesiones vencidas borradas', output.getvalue())
+
+    @override_settings(SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+    def test_sessions_outside_the_database_are_left_alone(self):
+        self.create_session(timezone.now() - timedelta(days=1))
+        output = io.StringIO()
+        call_command('cleanup_sessions', stdout=output)
+        self.assertEqual(Session.objects.count(), 1)
+        self.assertIn('no guarda sesiones en la base de datos', output.getvalue())
+
+
+HASHER = 'consultorioNutricionista.hashers.CalibratedArgon2PasswordHasher'
+
+
+@override_settings(PASSWORD_HASHERS=[HASHER, 'django.contrib.auth.hashers.MD5PasswordHasher'],
+                   ARGON2_TIME_COST=1, ARGON2_MEMORY_COST=8, ARGON2_PARALLELISM=1)
+class PasswordHasherTests(TransactionTestCase):
+    def test_parameters_come_from_settings(self):
+        hasher = get_hasher('argon2')
+        self.assertEqual((hasher.time_cost, hasher.memory_cost, hasher.parallelism), (1, 8, 1))
+        with self.settings(ARGON2_TIME_COST=3):
+            self.assertEqual(hasher.time_cost, 3)
+
+    @unittest.skipIf(calibrate_password_hasher.argon2 is None, 'argon2-cffi no está instalado')
+    def test_login_rehashes_with_the_calibrated_parameters(self):
+        user = User.objects.create_user('nutri', password='secreta')
+        User.objects.filter(pk=user.pk).update(password=get_hasher('md5').encode('secreta', 'sal'))
+
+        self.assertTrue(self.client.login(username='nutri', password='secreta'))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('argon2$argon2id$v=19$m=8,t=1,p=1$'))
+
+        with self.settings(ARGON2_TIME_COST=2):
+            self.assertTrue(self.client.login(username='nutri', password='secreta'))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('argon2$argon2id$v=19$m=8,t=2,p=1$'))
+
+
+# La medición se sustituye por tiempos fijos: lo que se prueba es la elección de time_cost
+class CalibratePasswordHasherTests(SimpleTestCase):
+    def calibrate(self, timings, **options):
+        output = io.StringIO()
+        with mock.patch.object(calibrate_password_hasher, 'argon2', mock.Mock()), \
+                mock.patch.object(calibrate_password_hasher.Command, 'measure',
+                                  side_effect=lambda time_cost, *args: timings[time_cost]) as measure:
+            call_command('calibrate_password_hasher', stdout=output, **options)
+        return output.getvalue(), measure
+
+    def test_picks_the_highest_time_cost_under_the_target(self):
+        output, measure = self.calibrate({1: 40.0, 2: 80.0, 3: 130.0, 4: 170.0}, target_ms=100, memory_cost=1024, parallelism=1)
+        self.assertEqual(measure.call_count, 3)
+        self.assertIn('ARGON2_TIME_COST=2 ARGON2_MEMORY_COST=1024 ARGON2_PARALLELISM=1', output)
+
+    def test_warns_when_the_lowest_cost_is_too_slow(self):
+        output, _ = self.calibrate({1: 150.0}, target_ms=100)
+        self.assertIn('reduce --memory-cost', output)
+        self.assertIn('ARGON2_TIME_COST=1', output)
+
+    def test_requires_argon2(self):
+        with mock.patch.object(calibrate_password_hasher, 'argon2', None):
+            with self.assertRaises(CommandError):
+                call_command('calibrate_password_hasher', stdout=io.StringIO())
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+@override_settings(CACHES=TWO_WORKER_CACHES, PUBLIC_CACHE_ALIAS='worker_a', PUBLIC_VERSION_CACHE_ALIAS='shared',
+                   ROLES_CACHE_ALIAS='shared')
+class AgendaAccessTests(TransactionTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_superuser('nutri', password='secreta')
+        self.other = User.objects.create_superuser('otra', password='secreta')
+        self.assistant = User.objects.create_user('asistente', password='secreta', is_staff=True)
+        inicio = timezone.now() + timedelta(days=1)
+        self.appointment = Appointment.objects.create(patient=create_patient(), nutritionist=self.owner, inicio=inicio,
+                                                      fin=inicio + timedelta(minutes=30))
+        self.url = reverse('cancel_appointment', args=[self.appointment.pk])
+
+    def cancel(self):
+        response = self.client.post(self.url)
+        self.appointment.refresh_from_db()
+        return response
+
+    def grant_cancel(self):
+        self.assistant.user_permissions.add(Permission.objects.get(codename='change_appointment'))
+
+    def test_nutritionist_cancels_only_their_own_appointments(self):
+        self.client.force_login(self.other)
+        self.assertRedirects(self.cancel(), reverse('access_denied'), fetch_redirect_response=False)
+        self.assertEqual(self.appointment.estado, Appointment.PROGRAMADA)
+        self.assertEqual(self.client.get(reverse('start_appointment', args=[self.appointment.pk])).status_code, 302)
+
+        self.client.force_login(self.owner)
+        self.cancel()
+        self.assertEqual(self.appointment.estado, Appointment.CANCELADA)
+
+    def test_permission_granted_in_one_worker_reaches_the_other(self):
+        self.client.force_login(self.assistant)
+        self.assertRedirects(self.cancel(), reverse('access_denied'), fetch_redirect_response=False)
+
+        # El permiso se concede en otro proceso; la versión compartida hace que esta sesión reconstruya sus roles
+        self.grant_cancel()
+        self.cancel()
+        self.assertEqual(self.appointment.estado, Appointment.CANCELADA)
+
+    def test_per_process_role_cache_misses_changes_from_other_workers(self):
+        self.client.force_login(self.assistant)
+        with self.settings(ROLES_CACHE_ALIAS='worker_b'):
+            self.cancel()
+        with self.settings(ROLES_CACHE_ALIAS='worker_a'):
+            self.grant_cancel()
+        with self.settings(ROLES_CACHE_ALIAS='worker_b'):
+            self.assertRedirects(self.cancel(), reverse('access_denied'), fetch_redirect_response=False)
+        self.assertEqual(self.appointment.estado, Appointment.PROGRAMADA)
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class ArchiveTests(TransactionTestCase):
+    def test_patients_with_appointments_or_exports_stay_active(self):
+        nutritionist = User.objects.create_superuser('nutri', password='secreta')
+        plain, with_appointment, with_export = [create_patient(nombre=nombre, is_active=False) for nombre in ('Ana', 'Luis', 'Eva')]
+        inicio = timezone.now() - timedelta(days=30)
+        Appointment.objects.create(patient=with_appointment, nutritionist=nutritionist, inicio=inicio,
+                                   fin=inicio + timedelta(minutes=30), estado=Appointment.CANCELADA)
+        ExportJob.objects.create(formato=ExportJob.CSV, patient=with_export)
+
+        self.assertEqual(archive_patients()[0], 1)
+        self.assertEqual(set(Patient.objects.values_list('pk', flat=True)), {with_appointment.pk, with_export.pk})
+        self.assertFalse(Patient.objects.filter(pk=plain.pk).exists())
+        self.assertEqual(Appointment.objects.count(), 1)
+        self.assertEqual(ExportJob.objects.count(), 1)
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+class IntervalIndexTests(SimpleTestCase):
+    def setUp(self):
+        # [10, 20) y [20, 30) se tocan y se unen; [40, 50) queda aparte
+        self.index = IntervalIndex([(40, 50), (20, 30), (10, 20)])
+
+    def test_touching_intervals_are_merged(self):
+        self.assertEqual(list(self.index), [(10, 30), (40, 50)])
+
+    def test_overlaps(self):
+        self.assertTrue(self.index.overlaps(25, 35))
+        self.assertTrue(self.index.overlaps(5, 11))
+        self.assertTrue(self.index.overlaps(0, 60))
+        self.assertFalse(self.index.overlaps(30, 40))
+        self.assertFalse(self.index.overlaps(0, 10))
+        self.assertFalse(self.index.overlaps(50, 60))
+
+    def test_covers(self):
+        self.assertTrue(self.index.covers(10, 30))
+        self.assertTrue(self.index.covers(42, 48))
+        self.assertFalse(self.index.covers(25, 45))
+        self.assertFalse(self.index.covers(5, 15))
+
+    def test_gaps(self):
+        self.assertEqual(list(self.index.gaps(0, 60)), [(0, 10), (30, 40), (50, 60)])
+        self.assertEqual(list(self.index.gaps(15, 45)), [(30, 40)])
+        self.assertEqual(list(self.index.gaps(12, 28)), [])
+        self.assertEqual(list(IntervalIndex().gaps(0, 5)), [(0, 5)])
+
+    def test_add_rejects_overlaps(self):
+        self.index.add(30, 40)
+        self.assertEqual(list(self.index.gaps(0, 60)), [(0, 10), (50, 60)])
+        with self.assertRaises(ValueError):
+            self.index.add(45, 55)
+
+
+class BookAppointmentTests(TransactionTestCase):
+    def setUp(self):
+        self.nutritionist = User.objects.create_superuser('nutri', password='secreta')
+        self.patient = create_patient()
+        self.inicio = (timezone.now() + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+        AvailabilitySlot.objects.create(nutritionist=self.nutritionist, inicio=self.inicio, fin=self.inicio + timedelta(hours=4))
+
+    def book(self, patient, minutes, length=30):
+        inicio = self.inicio + timedelta(minutes=minutes)
+        return book_appointment(patient.pk, self.nutritionist.pk, inicio, inicio + timedelta(minutes=length))
+
+    def assertRejected(self, message, *args):
+        with self.assertRaisesMessage(ValueError, message):
+            self.book(*args)
+
+    def test_books_inside_the_availability(self):
+        self.book(self.patient, 0)
+        self.book(create_patient(nombre='Luis'), 30)
+        self.assertEqual(Appointment.objects.filter(nutritionist=self.nutritionist).count(), 2)
+
+    def test_rejects_conflicts(self):
+        self.book(self.patient, 60)
+        self.assertRejected('se empalma con otra cita', create_patient(nombre='Luis'), 75)
+        self.assertRejected('fuera de la disponibilidad', self.patient, 230)
+
+        # El mismo paciente no puede estar a la vez con otro nutricionista
+        other = User.objects.create_superuser('otra', password='secreta')
+        AvailabilitySlot.objects.create(nutritionist=other, inicio=self.inicio, fin=self.inicio + timedelta(hours=4))
+        inicio = self.inicio + timedelta(minutes=75)
+        with self.assertRaisesMessage(ValueError, 'ya tiene una cita'):
+            book_appointment(self.patient.pk, other.pk, inicio, inicio + timedelta(minutes=30))
+        self.assertEqual(Appointment.objects.count(), 1)
+
+    def test_cancelled_appointments_free_the_slot(self):
+        self.book(self.patient, 60)
+        Appointment.objects.update(estado=Appointment.CANCELADA)
+        self.book(create_patient(nombre='Luis'), 60)
+
+    def test_rejects_start_times_in_the_past(self):
+        inicio = timezone.now() - timedelta(hours=1)
+        AvailabilitySlot.objects.create(nutritionist=self.nutritionist, inicio=inicio - timedelta(hours=1), fin=inicio + timedelta(hours=2))
+        with self.assertRaisesMessage(ValueError, 'en el pasado'):
+            book_appointment(self.patient.pk, self.nutritionist.pk, inicio, inicio + timedelta(minutes=30))
+        self.assertFalse(Appointment.objects.exists())
+
+
+#----------------------------------------------------------------------------------------------------------------------#
+
+FOODS_CSV = """codigo,nombre,grupo,energia_kcal,proteina,grasa,carbohidratos
+F1,Manzana roja,Frutas,52,"0,3",0.2,14
+F2,Jugo de manzana,Bebidas,46,0.1,0.1,11
+F3,Plátano,Frutas,89,1.1,0.3,23
+,Sin código,Frutas,10,0,0,0
+F4,Pan dulce,Cereales,abc,0,0,0
+"""
+
+
+class FoodIndexTests(TransactionTestCase):
+    def setUp(self):
+        foods.loaded.update(version=None, index=None)
+        self.addCleanup(foods.loaded.update, version=None, index=None)
+        self.imported, self.errors = foods.import_foods(io.StringIO(FOODS_CSV))
+        self.ids = dict(Food.objects.values_list('codigo', 'id'))
+
+    def test_import_reports_bad_rows_and_updates_by_code(self):
+        self.assertEqual(self.imported, 3)
+        self.assertEqual([line for line, _ in self.errors], [5, 6])
+        self.assertEqual(Food.objects.get(codigo='F1').proteina, Decimal('0.30'))
+        self.assertEqual(Food.objects.get(codigo='F3').nombre_normalizado, 'platano')
+
+        version = foods.food_version()
+        foods.import_foods(io.StringIO('codigo,nombre,energia_kcal\nF1,Manzana verde,58\n'))
+        self.assertEqual(Food.objects.count(), 3)
+        self.assertEqual(Food.objects.get(codigo='F1').energia_kcal, Decimal('58.00'))
+        self.assertNotEqual(foods.food_version(), version)
+        self.assertEqual(foods.food_index().name(self.ids['F1']), 'Manzana verde')
+
+    def test_prefix_search(self):
+        index = foods.food_index()
+        self.assertEqual(len(index), 3)
+        # Las coincidencias al inicio del nombre van antes que las de otras palabras
+        self.assertEqual([name for _, name in index.search('manz')], ['Manzana roja', 'Jugo de manzana'])
+        self.assertEqual(index.search('PLATA'), [(self.ids['F3'], 'Plátano')])
+        self.assertEqual(index.search('manz', limit=1), [(self.ids['F1'], 'Manzana roja')])
+        self.assertEqual(index.search('  '), [])
+
+    def test_plan_totals(self):
+        consultation = Consultation.objects.create(patient=create_patient(), peso=Decimal('61.00'), observaciones='Control')
+        plan = MealPlan.objects.create(consultation=consultation)
+        MealPlanItem.objects.bulk_create([
+            MealPlanItem(plan=plan, food_id=self.ids['F1'], comida=MealPlanItem.DESAYUNO, gramos=Decimal('150')),
+            MealPlanItem(plan=plan, food_id=self.ids['F3'], comida=MealPlanItem.DESAYUNO, gramos=Decimal('100')),
+            MealPlanItem(plan=plan, food_id=self.ids['F2'], comida=MealPlanItem.CENA, gramos=Decimal('200')),
+        ])
+        totals = foods.plan_totals(plan.pk)
+        self.assertEqual(totals['total']['energia_kcal'], 259.0)
+        self.assertEqual(totals['total']['proteina'], 1.75)
+        self.assertEqual(totals['comidas'][MealPlanItem.DESAYUNO]['carbohidratos'], 44.0)
+        self.assertEqual(totals['comidas'][MealPlanItem.CENA]['energia_kcal'], 92.0)
+        self.assertEqual(foods.food_index().totals([]), dict.fromkeys(Food.NUTRIENTS, 0.0))
+
+    def test_missing_food_reloads_the_index(self):
+        index = foods.food_index()
+        # Sin señales la versión no cambia, como cuando la invalidación todavía no llega a este proceso
+        food = Food.objects.bulk_create([Food(codigo='F9', nombre='Avena', nombre_normalizado='avena', energia_kcal=389)])[0]
+        self.assertEqual(index.name(food.pk), 'Avena')
+        self.assertEqual(index.totals([(food.pk, 50)])['energia_kcal'], 194.5)
+        self.assertIsNot(foods.food_index(), index)
+        with self.assertRaises(KeyError):
+            foods.food_index().name(0)
+
+    @override_settings(CACHES=TWO_WORKER_CACHES, PUBLIC_CACHE_ALIAS='worker_a', PUBLIC_VERSION_CACHE_ALIAS='shared')
+    def test_version_lives_in_the_shared_cache(self):
+        foods.bump_food_version()
+        self.assertIsNotNone(caches['shared'].get(foods.VERSION_KEY))
+        self.assertIsNone(caches['worker_a'].get(foods.VERSION_KEY))
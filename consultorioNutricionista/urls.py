@@ -36,14 +36,29 @@ urlpatterns = [
     # 'View' urls
     path('patients/', views.view_patients, name='view_patients'),
     path('view-patients/pagination/', views.view_patients, {'option': 'pagination'}, name='view_patients_pagination'),
+    path('view-patients/keyset/', views.view_patients, {'option': 'keyset'}, name='view_patients_keyset'),
     path('patients/list/', views.view_patients, {'option': 'list'}, name='view_list_patients'),
+    path('patients/stream/', views.view_patients, {'option': 'stream'}, name='view_patients_stream'),
+    path('patients/search/', views.search_patients_by_name, name='search_patients_by_name'),
     path('assistants/', views.view_assistants, name='view_assistants'),
     path('patient_list/', views.patient_list, name='patient_list'),
     path('patient_progress/<int:patient_id>/', views.patient_progress, name='patient_progress'),
+    path('patient_progress/<int:patient_id>/data/', views.patient_progress_data, name='patient_progress_data'),
     path('patient_detail/<int:patient_id>/', views.patient_detail, name='patient_detail'),
+    path('analytics/', views.analytics_dashboard, name='analytics_dashboard'),
     # Ruta para iniciar la consulta
     path('patient/initiate-consultation/', views.initiate_consultation, name='initiate_consultation'),
     path('patient/consultation-detail/<int:consultation_id>/', views.consultation_detail, name='consultation_detail'),
+    path('patient/consultation-detail/<int:consultation_id>/meal-plan/', views.consultation_meal_plan, name='consultation_meal_plan'),
+    path('foods/search/', views.food_search, name='food_search'),
+    path('patient/import-consultations/', views.import_consultations, name='import_consultations'),
+    path('schedule/', views.schedule, name='schedule'),
+    path('appointments/<int:appointment_id>/start/', views.start_appointment, name='start_appointment'),
+    path('appointments/<int:appointment_id>/cancel/', views.cancel_appointment, name='cancel_appointment'),
+    path('exports/', views.request_export, name='request_export'),
+    path('exports/consultations.csv', views.export_consultations_csv, name='export_consultations_csv'),
+    path('exports/<int:job_id>/', views.export_status, name='export_status'),
+    path('exports/<int:job_id>/download/', views.export_download, name='export_download'),
 
     # 'Add' urls
     path('patients/add/', views.add_patient, name='add_patient'),
@@ -51,17 +66,22 @@ urlpatterns = [
     path('assistants/add/', views.add_assistant, name='add_assistant'),
 
     # 'Edit' urls
-    path('patients/edit/<int:pk>/', views.edit_patient, name='edit_patient'),
-    path('assistants/edit/<int:pk>/', views.edit_assistant, name='edit_assistant'),
+    path('patients/edit/<int:patient_id>/', views.edit_patient, name='edit_patient'),
+    path('assistants/edit/<int:assistant_id>/', views.edit_assistant, name='edit_assistant'),
 
     # 'Delete' urls
-    path('patients/delete/<int:pk>/', views.delete_patient, name='delete_patient'),
-    path('assistants/delete/<int:pk>/', views.delete_assistant, name='delete_assistant'),
+    path('patients/delete/<int:patient_id>/', views.delete_patient, name='delete_patient'),
+    path('assistants/delete/<int:assistant_id>/', views.delete_assistant, name='delete_assistant'),
 
     # Public urls
     path('patient_public_detail/<int:patient_id>/', views.patient_public_detail, name='patient_public_detail'),
     path('patient_public_not_found/', views.patient_public_not_found, name='patient_public_not_found'),
     path('patient_public_form/', views.search_patient, name='search_patient'),
     path('patient_public_form/', views.search_patient, name='patient_public_form'),
+    path('public-cache/stats/', views.public_cache_stats, name='public_cache_stats'),
+
+    # Instrumentation urls
+    path('stats/queries/', views.query_stats, name='query_stats'),
+    path('metrics/', views.metrics, name='metrics'),
 ]
 
@@ -0,0 +1,23 @@
+"""
+URL configuration for the ASGI deployment profile.
+
+Son las mismas rutas de urls.py, pero las páginas públicas del paciente se atienden con las vistas asíncronas de
+async_views.py.
+"""
+from django.urls import path
+
+from . import async_views
+from .urls import urlpatterns as sync_urlpatterns
+
+ASYNC_VIEWS = {
+    'patient_public_detail': async_views.patient_public_detail,
+    'patient_public_not_found': async_views.patient_public_not_found,
+    'search_patient': async_views.search_patient,
+    'patient_public_form': async_views.search_patient,
+}
+
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name], pattern.default_args, name=pattern.name)
+    if getattr(pattern, 'name', None) in ASYNC_VIEWS else pattern
+    for pattern in sync_urlpatterns
+]
@@ -1,11 +1,17 @@
+import csv
+import hashlib
 import time
-from datetime import datetime
+from datetime import date, datetime, timedelta
+from functools import partial
+from itertools import islice
 from django.core.paginator import Paginator
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.models import User
 from django.contrib.auth.views import LoginView, LogoutView
-from django.http import Http404, HttpResponseForbidden, HttpResponse, HttpResponseServerError
+from django.http import Http404, HttpResponseForbidden, HttpResponse, HttpResponseServerError, StreamingHttpResponse, JsonResponse, \
+    FileResponse, HttpResponseBadRequest
 from django.shortcuts import render, redirect, get_object_or_404, reverse
+from django.template.loader import get_template, render_to_string
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
@@ -13,16 +19,38 @@ from django.contrib.auth.decorators import permission_required
 from django.core.exceptions import PermissionDenied
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse_lazy
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
+from django.views.decorators.http import condition
 from django.views.generic import FormView
 from django.contrib.auth import logout
-
-from .forms import PatientForm, SearchPatientForm, AssistantForm, NutritionistForm, ConsultationForm
-from .models import Patient, Consultation
+from django.db import transaction
+
+from .forms import PatientForm, SearchPatientForm, AssistantForm, NutritionistForm, ConsultationForm, ConsultationImportForm, \
+    ProgressFilterForm, ExportForm, AppointmentForm, MealPlanItemForm
+from .importer import import_uploaded_file
+from .pagination import PATIENT_KEYSET_FIELDS, paginate_keyset
+from .search import search_patients
+from .progress import DEFAULT_MAX_POINTS, downsample, load_series
+from .models import Patient, Consultation, PatientSummary, ExportJob, Appointment, Food, MealPlan, MealPlanItem
+from .exports import consultation_rows, csv_lines, export_queryset
+from . import public_cache
+from .instrumentation import registry
+from .analytics import dashboard_data
+from .archive import purge_patients
+from .detail import detail_fragments, fragments_cached, load_patient_detail
+from .routers import pin_to_primary
+from .roles import BOOK_APPOINTMENT, CANCEL_APPOINTMENT, NUTRICIONISTA, role_required
+from .scheduling import book_appointment, booked_appointments, free_slots, week_bounds
+from .foods import food_index, plan_totals
+from .nutrition import patient_profile
 import logging
 logger = logging.getLogger(__name__)
 
 
-@login_required
+@role_required()
 def home(request):
     return render(request, 'home.html', {'section': 'home'})
 
@@ -39,9 +67,31 @@ def logout_view(request):
 def access_denied(request):
     return render(request, 'access_denied.html')
 
+# Filas que se leen de la base de datos y se renderizan por cada fragmento de la lista en streaming
+STREAM_CHUNK_SIZE = 500
+STREAM_ROWS_MARKER = '<!-- patient-rows -->'
+
+
+# Genera la lista de pacientes por partes: primero la página hasta el marcador de filas, después las filas por
+# bloques y al final el resto de la página. Ni el queryset ni el HTML completo se guardan en memoria.
+def stream_patient_rows(request, patients):
+    page = render_to_string('view_patients_stream.html', {'rows_marker': STREAM_ROWS_MARKER}, request=request)
+    head, tail = page.split(STREAM_ROWS_MARKER, 1)
+    yield head
+
+    rows_template = get_template('patient_rows.html')
+    rows = patients.iterator(chunk_size=STREAM_CHUNK_SIZE)
+    while True:
+        chunk = list(islice(rows, STREAM_CHUNK_SIZE))
+        if not chunk:
+            break
+        yield rows_template.render({'patients': chunk})
+    yield tail
+
+
 def view_patients(request, option=None):
     if option == 'pagination':
-        if request.user.is_staff and not request.user.is_superuser:
+        if request.roles.is_assistant:
             return redirect('access_denied')
         else:
             # Lógica para mostrar la lista de pacientes en paginación
@@ -53,6 +103,23 @@ def view_patients(request, option=None):
             page = request.GET.get('page')
             patients_page = paginator.get_page(page)
             return render(request, 'view_patients_pagination.html', {'patients': patients_page})
+    elif option == 'keyset':
+        if request.roles.is_assistant:
+            return redirect('access_denied')
+        # Paginación por cursor: no hace COUNT ni OFFSET, cada página se lee desde el índice
+        patients = Patient.objects.filter(is_active=True)
+        try:
+            patients_page = paginate_keyset(patients, PATIENT_KEYSET_FIELDS, request.GET.get('cursor'),
+                                            per_page=5, with_total=bool(request.GET.get('total')))
+        except ValueError:
+            return HttpResponseBadRequest('Cursor inválido')
+        return render(request, 'view_patients_keyset.html', {'patients': patients_page})
+    elif option == 'stream':
+        # Solo se leen las columnas que muestra la tabla, en el orden del índice de pacientes activos
+        patients = (Patient.objects.filter(is_active=True)
+                    .only('id', 'nombre', 'apellido_paterno', 'apellido_materno')
+                    .order_by('apellido_paterno', 'apellido_materno', 'nombre', 'id'))
+        return StreamingHttpResponse(stream_patient_rows(request, patients))
     else:
         # Lógica para mostrar la lista de pacientes en orden ascendente por apellidos
         # Obtener la lista de pacientes activos ordenados por apellidos
@@ -61,18 +128,37 @@ def view_patients(request, option=None):
         return render(request, 'view_patients.html', {'patients': patients})
 
 
-@login_required
+# Búsqueda por nombre para el personal del consultorio: regresa JSON para autocompletar mientras se escribe
+@role_required()
+def search_patients_by_name(request):
+    if not request.roles.is_staff:
+        return redirect('access_denied')
+    results = [
+        {
+            'id': patient.id,
+            'nombre': patient.nombre,
+            'apellido_paterno': patient.apellido_paterno,
+            'apellido_materno': patient.apellido_materno,
+            'url': reverse('patient_detail', args=[patient.id]),
+        }
+        for patient in search_patients(request.GET.get('q', ''))
+    ]
+    return JsonResponse({'results': results})
+
+
+@role_required(NUTRICIONISTA)
 def view_assistants(request):
     assistants = User.objects.filter(is_staff=True).exclude(is_superuser=True)
     return render(request, 'view_assistants.html', {'assistants': assistants})
 
-@login_required
+@role_required()
 def delete_patient(request, patient_id):
-    patient = Patient.objects.get(id=patient_id)
-    patient.delete()
+    get_object_or_404(Patient.objects.only('id'), id=patient_id)
+    # Borrado por conjuntos y por bloques de las consultas y demás tablas del paciente (ver archive.py)
+    purge_patients([patient_id])
     return redirect('view_patients')
 
-@login_required
+@role_required(NUTRICIONISTA)
 def delete_assistant(request, assistant_id):
     assistant = get_object_or_404(User, id=assistant_id, is_staff=True, is_superuser=False)
     if request.method == 'POST':
@@ -81,19 +167,21 @@ def delete_assistant(request, assistant_id):
         return redirect('view_assistants')
     return render(request, 'delete_assistant.html', {'assistant': assistant})
 
-@login_required
+@role_required()
 def edit_patient(request, patient_id):
     patient = Patient.objects.get(id=patient_id)
     if request.method == 'POST':
         form = PatientForm(request.POST, instance=patient)
         if form.is_valid():
             form.save()
+            # Las siguientes lecturas van al primario para que la lista ya muestre el cambio
+            pin_to_primary(request)
             return redirect('view_patients')
     else:
         form = PatientForm(instance=patient)
     return render(request, 'edit_patient.html', {'form': form, 'patient': patient})
 
-@login_required
+@role_required(NUTRICIONISTA)
 def edit_assistant(request, assistant_id):
     assistant = User.objects.get(id=assistant_id)
     if not assistant.is_staff or assistant.is_superuser:
@@ -114,7 +202,7 @@ def base_view(request):
     return render(request, 'base.html')
 
 
-@login_required
+@role_required(NUTRICIONISTA)
 def add_assistant(request):
     if request.method == 'POST':
         assistant_form = AssistantForm(request.POST)
@@ -128,7 +216,7 @@ def add_assistant(request):
         return render(request, 'add_assistant.html', {'assistant_form': assistant_form})
 
 
-@login_required
+@role_required(NUTRICIONISTA)
 def add_nutritionist(request):
     if request.method == 'POST':
         nutritionist_form = NutritionistForm(request.POST)
@@ -143,15 +231,16 @@ def add_nutritionist(request):
     return render(request, 'add_nutritionist.html', {'nutritionist_form': nutritionist_form})
 
 
-@login_required
+@role_required()
 def add_patient(request):
-    if request.user.is_superuser:
+    if request.roles.is_nutritionist:
         if request.method == 'POST':
             form = PatientForm(request.POST)
             if form.is_valid():
                 patient = form.save(commit=False)
                 patient.user = request.user
                 patient.save()
+                pin_to_primary(request)
                 messages.success(request, 'El paciente se ha agregado correctamente')
                 return render(request, 'patient_added.html', {'patient': patient})
         else:
@@ -161,29 +250,100 @@ def add_patient(request):
         return render(request, 'view_patients.html', {'section','home'}) #//
 
 
-@login_required
+# Tablero de analítica del consultorio: solo lee los agregados precalculados (ver refresh_rollups)
+@role_required()
+def analytics_dashboard(request):
+    if not request.roles.is_nutritionist:
+        return redirect('access_denied')
+    return render(request, 'analytics_dashboard.html', dashboard_data())
+
+
+@role_required()
 def patient_progress(request, patient_id):
-    patient = get_object_or_404(Patient, id=patient_id, user=request.user)
+    if not request.roles.is_nutritionist:
+        return redirect('access_denied')
+    patient = get_object_or_404(Patient, id=patient_id)
     return render(request, 'patient_progress.html', {'patient': patient})
 
-@login_required
+
+# El ETag de la serie depende de la última consulta del paciente (tomada del resumen), de la versión de caché del
+# paciente y de los filtros pedidos, así que mientras no cambien sus consultas el navegador recibe un 304 sin que se
+# lea la serie. La versión cubre los cambios que no mueven el resumen, como editar o borrar una consulta anterior.
+def progress_etag(request, patient_id):
+    summary = PatientSummary.objects.filter(patient_id=patient_id).values_list('last_visit', 'consultation_count', 'latest_imc').first()
+    if summary is None:
+        return None
+    last_visit, count, latest_imc = summary
+    version = public_cache.patient_version(patient_id)
+    key = f"{patient_id}:{version}:{last_visit.isoformat() if last_visit else ''}:{count}:{latest_imc}:{request.GET.urlencode()}"
+    return hashlib.md5(key.encode()).hexdigest()
+
+
+@role_required()
+@condition(etag_func=progress_etag)
+def patient_progress_data(request, patient_id):
+    if not request.roles.is_nutritionist:
+        return HttpResponseForbidden()
+    get_object_or_404(Patient.objects.only('id'), id=patient_id)
+
+    form = ProgressFilterForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    filters = form.cleaned_data
+
+    points = load_series(patient_id, filters['desde'], filters['hasta'])
+    points = downsample(points, filters['max_points'] or DEFAULT_MAX_POINTS, filters['agrupar'] or None)
+
+    if filters['formato'] == 'csv':
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = f'attachment; filename="progreso_{patient_id}.csv"'
+        writer = csv.writer(response)
+        writer.writerow(['fecha', 'peso', 'imc'])
+        writer.writerows((fecha.isoformat(), peso, imc) for fecha, peso, imc in points)
+        return response
+
+    return JsonResponse({
+        'patient': patient_id,
+        'points': [{'fecha': fecha.isoformat(), 'peso': float(peso), 'imc': float(imc)} for fecha, peso, imc in points],
+    })
+
+# Patient no tiene un usuario asignado: el listado muestra los pacientes activos, por páginas de cursor en el orden del
+# índice de pacientes activos.
+@role_required()
 def patient_list(request):
-    patients = Patient.objects.filter(user=request.user)
-    return render(request, 'patient_list.html', {'patients': patients})
+    patients = Patient.objects.filter(is_active=True).only('id', 'nombre', 'apellido_paterno', 'apellido_materno')
+    try:
+        patients_page = paginate_keyset(patients, PATIENT_KEYSET_FIELDS, request.GET.get('cursor'), per_page=50)
+    except ValueError:
+        return HttpResponseBadRequest('Cursor inválido')
+    return render(request, 'patient_list.html', {'patients': patients_page})
 
 
-@login_required
+@role_required()
 def patient_detail(request, patient_id):
-    # Retrieve the patient object from the database
-    patient = get_object_or_404(Patient, id=patient_id)
-
     # Check if the user is an administrator or an assistant
-    is_admin = request.user.is_superuser
-    is_assistant = request.user.is_staff and not request.user.is_superuser
+    is_admin = request.roles.is_nutritionist
+    is_assistant = request.roles.is_assistant
 
     # If the user is an administrator or the patient's assigned nutritionist, allow full access
     if is_admin or is_assistant:
-        return render(request, 'patient_detail.html', {'patient': patient})
+        try:
+            page = max(int(request.GET.get('page') or 1), 1)
+        except ValueError:
+            return redirect('patient_detail', patient_id)
+        # La ficha y el historial se guardan como fragmentos versionados; si ambos están en caché los datos solo se
+        # cargan si la plantilla los llega a pedir. Si no, el paciente, su resumen y una página del historial se leen
+        # con dos sentencias (ver detail.py).
+        fragment = detail_fragments(patient_id, page, request.roles.is_nutritionist)
+        # Si el paciente se restaura del archivo, las siguientes lecturas del usuario van al primario
+        on_restore = partial(pin_to_primary, request)
+        if fragments_cached(fragment):
+            public_cache.record('hits')
+            detail = SimpleLazyObject(lambda: load_patient_detail(patient_id, page, on_restore=on_restore))
+        else:
+            public_cache.record('misses')
+            detail = load_patient_detail(patient_id, page, on_restore=on_restore)
+        return render(request, 'patient_detail.html', {'detail': detail, 'fragment': fragment})
     # Otherwise, deny access
     else:
         return render(request, 'access_denied.html')
@@ -193,14 +353,15 @@ def patient_detail(request, patient_id):
 
 def patient_public_detail(request, patient_id):
     try:
-        # Buscar paciente por ID
-        patient = Patient.objects.get(id=patient_id)
+        # Buscar paciente por ID (solo si el fragmento no está en caché)
+        card = public_cache.patient_fragment(
+            patient_id, 'patient_public_card.html', lambda: {'patient': Patient.objects.get(id=patient_id)})
     except Patient.DoesNotExist:
         # Manejar el caso de que no se encuentre el paciente
         return HttpResponse("No se encontró el paciente con ese ID")
 
     # Renderizar plantilla con información del paciente
-    context = {'patient': patient}
+    context = {'patient_card': card}
     return render(request, 'patient_public_detail.html', context)
 
 
@@ -210,9 +371,9 @@ def search_patient(request):
             form = SearchPatientForm(request.POST)
             if form.is_valid():
                 patient_id = form.cleaned_data['patient_id']
-                patient = get_object_or_404(Patient, id=patient_id)
-                print(f"Patient found: {patient}") #debug
-                context = {'form': form, 'patient': patient}
+                patient_table = public_cache.patient_fragment(
+                    patient_id, 'patient_public_table.html', lambda: {'patient': get_object_or_404(Patient, id=patient_id)})
+                context = {'form': form, 'patient_table': patient_table}
                 return render(request, 'patient_public_form.html', context)
             else:
                 print(f"Form errors: {form.errors}")  # debug
@@ -228,21 +389,27 @@ def search_patient(request):
 
 
 
-@login_required
+@role_required()
 def initiate_consultation(request):
+    # Al iniciar una cita (start_appointment) el paciente llega preseleccionado y la consulta queda ligada a la cita
+    appointment_id = request.POST.get('appointment') or request.GET.get('appointment')
+    appointment = None
+    if appointment_id and appointment_id.isdigit():
+        appointment = Appointment.objects.filter(id=appointment_id, estado=Appointment.PROGRAMADA).first()
+
     if request.method == 'POST':
         form = ConsultationForm(request.POST)
         if form.is_valid():
-            consultation = form.save(commit=False)
-            consultation.fecha_consulta = datetime.now()
-            consultation.save()
-
             # Obtener el paciente seleccionado en el formulario
             patient = form.cleaned_data['patient']
 
-            # Actualizar el peso del paciente
-            patient.peso = consultation.peso
-            patient.save()
+            # La consulta y el peso del paciente se escriben juntos en ConsultationForm.save
+            with transaction.atomic():
+                consultation = form.save()
+                if appointment is not None and appointment.patient_id == patient.pk:
+                    Appointment.objects.filter(pk=appointment.pk, estado=Appointment.PROGRAMADA).update(
+                        estado=Appointment.ATENDIDA, consultation=consultation)
+            pin_to_primary(request)
 
             # Redireccionar a la página de detalle de consulta
             return redirect('consultation_detail', consultation.id)
@@ -250,7 +417,173 @@ def initiate_consultation(request):
         form = ConsultationForm()
 
     patients = Patient.objects.filter(is_active=True)  # Filtrar pacientes activos
-    return render(request, 'initiate_consultation.html', {'form': form, 'patients': patients})
+    return render(request, 'initiate_consultation.html', {'form': form, 'patients': patients, 'appointment': appointment})
+
+
+# Agenda semanal de un nutricionista: horarios libres, citas reservadas y el formulario para reservar. Los horarios
+# libres y los empalmes se calculan en scheduling.py con dos lecturas por índice para toda la semana.
+@role_required()
+def schedule(request):
+    try:
+        nutritionist_id = int(request.GET['nutritionist']) if request.GET.get('nutritionist') else None
+        day = date.fromisoformat(request.GET['week']) if request.GET.get('week') else timezone.localdate()
+    except ValueError:
+        return redirect('schedule')
+    if nutritionist_id is None:
+        nutritionist_id = request.roles.user_id if request.roles.is_nutritionist else \
+            User.objects.filter(is_superuser=True, is_active=True).order_by('username').values_list('id', flat=True).first()
+    desde, hasta = week_bounds(day)
+    week = timezone.localtime(desde).date()
+
+    if request.method == 'POST':
+        form = AppointmentForm(request.POST)
+        if form.is_valid():
+            inicio = form.cleaned_data['inicio']
+            nutritionist_id = form.cleaned_data['nutritionist'].pk
+            if not request.roles.manages_agenda(nutritionist_id, BOOK_APPOINTMENT):
+                return redirect('access_denied')
+            try:
+                book_appointment(form.cleaned_data['patient_id'], nutritionist_id, inicio,
+                                 inicio + timedelta(minutes=form.cleaned_data['duracion']))
+            except ValueError as error:
+                form.add_error(None, str(error))
+            else:
+                pin_to_primary(request)
+                messages.success(request, 'La cita se ha reservado correctamente')
+                week = timezone.localtime(inicio).date()
+                return redirect(f"{reverse('schedule')}?nutritionist={nutritionist_id}&week={week.isoformat()}")
+    else:
+        form = AppointmentForm(initial={'nutritionist': nutritionist_id, 'patient_id': request.GET.get('patient_id'),
+                                        'inicio': request.GET.get('inicio')})
+
+    appointments = booked_appointments(nutritionist_id, desde, hasta).select_related('patient').only(
+        'id', 'inicio', 'fin', 'estado', 'patient_id', 'patient__nombre', 'patient__apellido_paterno', 'patient__apellido_materno')
+    return render(request, 'schedule.html', {
+        'form': form,
+        'nutritionist_id': nutritionist_id,
+        'week': week,
+        'previous_week': week - timedelta(days=7),
+        'next_week': week + timedelta(days=7),
+        'free_slots': free_slots(nutritionist_id, desde, hasta) if nutritionist_id else [],
+        'appointments': appointments if nutritionist_id else [],
+        'can_book': request.roles.manages_agenda(nutritionist_id, BOOK_APPOINTMENT),
+        'can_cancel': request.roles.manages_agenda(nutritionist_id, CANCEL_APPOINTMENT),
+        'can_start': request.roles.is_nutritionist and request.roles.user_id == nutritionist_id,
+    })
+
+
+@role_required()
+def start_appointment(request, appointment_id):
+    if not request.roles.is_nutritionist:
+        return redirect('access_denied')
+    appointment = get_object_or_404(Appointment.objects.only('id', 'estado', 'nutritionist_id'), id=appointment_id)
+    if appointment.nutritionist_id != request.roles.user_id:
+        return redirect('access_denied')
+    if appointment.estado != Appointment.PROGRAMADA:
+        messages.error(request, 'La cita ya fue atendida o cancelada')
+        return redirect('schedule')
+    return redirect(f"{reverse('initiate_consultation')}?appointment={appointment.id}")
+
+
+@role_required()
+def cancel_appointment(request, appointment_id):
+    if request.method != 'POST':
+        return redirect('schedule')
+    appointment = get_object_or_404(Appointment.objects.only('id', 'nutritionist_id', 'inicio'), id=appointment_id)
+    if not request.roles.manages_agenda(appointment.nutritionist_id, CANCEL_APPOINTMENT):
+        return redirect('access_denied')
+    Appointment.objects.filter(pk=appointment.pk, estado=Appointment.PROGRAMADA).update(estado=Appointment.CANCELADA)
+    pin_to_primary(request)
+    week = timezone.localtime(appointment.inicio).date()
+    return redirect(f"{reverse('schedule')}?nutritionist={appointment.nutritionist_id}&week={week.isoformat()}")
+
+
+@role_required()
+def import_consultations(request):
+    if not request.roles.is_nutritionist:
+        return redirect('access_denied')
+
+    report = None
+    if request.method == 'POST':
+        form = ConsultationImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            report = import_uploaded_file(form.cleaned_data['archivo'], form.cleaned_data['formato'] or None)
+    else:
+        form = ConsultationImportForm()
+    return render(request, 'import_consultations.html', {'form': form, 'report': report})
+
+
+# Exportaciones de consultas. El CSV se puede descargar directamente (se genera mientras se envía); los formatos XLSX
+# y PDF, y cualquier exportación pedida desde el formulario, se encolan para run_export_worker y la página de estado
+# se consulta hasta que el archivo está listo. Las exportaciones llevan peso e IMC, así que son solo del nutricionista.
+@role_required()
+def export_consultations_csv(request):
+    if not request.roles.is_nutritionist:
+        return redirect('access_denied')
+    form = ExportForm({**request.GET.dict(), 'formato': ExportJob.CSV})
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    filters = form.cleaned_data
+
+    rows = consultation_rows(export_queryset(filters['patient_id'], filters['desde'], filters['hasta']))
+    response = StreamingHttpResponse(csv_lines(rows), content_type='text/csv')
+    alcance = f"paciente_{filters['patient_id']}" if filters['patient_id'] else 'consultorio'
+    response['Content-Disposition'] = f'attachment; filename="consultas_{alcance}.csv"'
+    return response
+
+
+@role_required()
+def request_export(request):
+    if not request.roles.is_nutritionist:
+        return redirect('access_denied')
+
+    if request.method == 'POST':
+        form = ExportForm(request.POST)
+        if form.is_valid():
+            job = ExportJob.objects.create(
+                formato=form.cleaned_data['formato'],
+                patient_id=form.cleaned_data['patient_id'],
+                desde=form.cleaned_data['desde'],
+                hasta=form.cleaned_data['hasta'],
+                solicitado_por_id=request.roles.user_id,
+            )
+            return redirect('export_status', job.id)
+    else:
+        form = ExportForm(initial={'patient_id': request.GET.get('patient_id')})
+
+    jobs = ExportJob.objects.filter(solicitado_por_id=request.roles.user_id).order_by('-id')[:10]
+    return render(request, 'export_request.html', {'form': form, 'jobs': jobs})
+
+
+def user_export_job(request, job_id):
+    jobs = ExportJob.objects.all() if request.roles.is_nutritionist else ExportJob.objects.filter(solicitado_por_id=request.roles.user_id)
+    return get_object_or_404(jobs, id=job_id)
+
+
+@role_required()
+def export_status(request, job_id):
+    if not request.roles.is_nutritionist:
+        return redirect('access_denied')
+    job = user_export_job(request, job_id)
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'id': job.id,
+            'estado': job.estado,
+            'filas': job.filas,
+            'error': job.error,
+            'descarga': reverse('export_download', args=[job.id]) if job.estado == ExportJob.TERMINADO else None,
+        })
+    return render(request, 'export_status.html', {'job': job})
+
+
+@role_required()
+def export_download(request, job_id):
+    if not request.roles.is_nutritionist:
+        return redirect('access_denied')
+    job = user_export_job(request, job_id)
+    if job.estado != ExportJob.TERMINADO or not job.archivo:
+        raise Http404("La exportación no está lista")
+    return FileResponse(job.archivo.open('rb'), as_attachment=True, filename=job.filename())
 
 
 def consultation_detail(request, consultation_id):
@@ -263,6 +596,79 @@ def consultation_detail(request, consultation_id):
     # Renderizar el template de detalle de consulta
     return render(request, 'consultation_detail.html', {'consultation': consultation})
 
+# Búsqueda de alimentos por nombre para armar el plan de alimentación; se responde desde el índice en memoria.
+@role_required()
+def food_search(request):
+    if not request.roles.is_staff:
+        return HttpResponseForbidden()
+    results = food_index().search(request.GET.get('q', ''))
+    return JsonResponse({'results': [{'id': food_id, 'nombre': nombre} for food_id, nombre in results]})
+
+
+# Plan de alimentación de una consulta con sus totales de nutrientes por comida y del día (ver foods.py), comparados
+# con el gasto energético del paciente.
+@role_required()
+def consultation_meal_plan(request, consultation_id):
+    if not request.roles.is_staff:
+        return redirect('access_denied')
+    consultation = get_object_or_404(Consultation.objects.select_related('patient'), id=consultation_id)
+    plan = consultation.meal_plans.order_by('-id').first()
+
+    if request.method == 'POST':
+        if not request.roles.is_nutritionist:
+            return redirect('access_denied')
+        form = MealPlanItemForm(request.POST)
+        if form.is_valid():
+            with transaction.atomic():
+                if plan is None:
+                    plan = MealPlan.objects.create(consultation=consultation)
+                MealPlanItem.objects.create(plan=plan, food_id=form.cleaned_data['food_id'],
+                                            comida=form.cleaned_data['comida'], gramos=form.cleaned_data['gramos'])
+            pin_to_primary(request)
+            return redirect('consultation_meal_plan', consultation.id)
+    else:
+        form = MealPlanItemForm()
+
+    items, meals, total, energy_percent = [], [], None, None
+    if plan is not None:
+        items = plan.items.select_related('food').only('id', 'comida', 'gramos', 'food__nombre').order_by('comida', 'id')
+        # Los renglones van en el orden de Food.NUTRIENTS, el de las columnas de la tabla
+        totals = plan_totals(plan.id)
+        total = [totals['total'][nutrient] for nutrient in Food.NUTRIENTS]
+        meals = [(label, [totals['comidas'][comida][nutrient] for nutrient in Food.NUTRIENTS])
+                 for comida, label in MealPlanItem.COMIDAS if comida in totals['comidas']]
+        tdee = patient_profile(consultation.patient)['tdee']
+        if tdee:
+            energy_percent = round(totals['total']['energia_kcal'] / float(tdee) * 100)
+    return render(request, 'meal_plan.html', {
+        'consultation': consultation,
+        'plan': plan,
+        'items': items,
+        'meals': meals,
+        'total': total,
+        'energy_percent': energy_percent,
+        'form': form,
+    })
+
+
+@staff_member_required
+def public_cache_stats(request):
+    return JsonResponse(public_cache.stats())
+
+
+@staff_member_required
+def query_stats(request):
+    return render(request, 'query_stats.html', {'views': registry.snapshot()})
+
+
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    authorized = token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}')
+    if not authorized and not request.roles.is_staff:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.prometheus(), content_type='text/plain; version=0.0.4')
+
+
 def patient_public_not_found(request):
     try:
         return render(request, 'patient_public_not_found.html')
@@ -0,0 +1,30 @@
+"""
+Configuración de gunicorn para el perfil de producción:
+
+    DJANGO_SETTINGS_MODULE=consultorioNutricionista.settings_production gunicorn -c gunicorn.conf.py
+
+WEB_WORKERS, WEB_THREADS y WEB_WORKER_CLASS ajustan los procesos, los hilos por proceso y el tipo de worker. Con
+WEB_WORKER_CLASS=uvicorn.workers.UvicornWorker se sirve la aplicación ASGI con las vistas asíncronas.
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('WEB_THREADS', 1))
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+
+if 'uvicorn' in worker_class.lower():
+    wsgi_app = 'consultorioNutricionista.asgi:application'
+    os.environ.setdefault('DJANGO_ROOT_URLCONF', 'consultorioNutricionista.urls_asgi')
+else:
+    wsgi_app = 'consultorioNutricionista.wsgi:application'
+
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+# Reinicia cada worker después de cierto número de peticiones para acotar el crecimiento de memoria
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', 5000))
+max_requests_jitter = int(os.environ.get('WEB_MAX_REQUESTS_JITTER', 500))
+
+accesslog = os.environ.get('WEB_ACCESS_LOG', '-')